@@ -131,11 +131,18 @@ module NarrativeService {
     /*
         workspaceId - optional workspace ID, if not specified then
             property from workspaceRef object info is used.
+        fastCopy - optional, default 0. If 1, and workspaceRef is the latest version of the
+            Narrative, the Narrative object is cloned along with the rest of the workspace and
+            only the workspace metadata is set, so the Narrative document is never downloaded or
+            re-saved. The copy keeps the original's object and document metadata (name, ws_name
+            and job info) until it's next saved, and its name is only set in the workspace
+            metadata. For earlier versions the regular copy is made.
     */
     typedef structure {
         string workspaceRef;
         int workspaceId;
         string newName;
+        boolean fastCopy;
     } CopyNarrativeParams;
 
     typedef structure {
@@ -272,6 +279,40 @@ module NarrativeService {
     funcdef copy_object(CopyObjectParams params)
         returns (CopyObjectOutput) authentication required;
 
+    /*
+        refs - workspace references to the source objects,
+        target_ws_id/target_ws_name - alternative ways to define target workspace.
+        Each object keeps its source object name.
+    */
+    typedef structure {
+        list<string> refs;
+        int target_ws_id;
+        string target_ws_name;
+    } CopyObjectsParams;
+
+    /*
+        info - workspace info of created object, not present if the copy failed
+        error - the reason the copy failed, not present if it succeeded
+    */
+    typedef structure {
+        ObjectInfo info;
+        string error;
+    } CopyObjectResult;
+
+    /*
+        results - one result for each of the refs, in the same order
+    */
+    typedef structure {
+        list<CopyObjectResult> results;
+    } CopyObjectsOutput;
+
+    /*
+        Copies many objects to one workspace at once. A failed copy doesn't stop the others, it
+        gets reported in that object's result.
+    */
+    funcdef copy_objects(CopyObjectsParams params)
+        returns (CopyObjectsOutput) authentication required;
+
 
     /*
         workspaces - list of items where each one is workspace name of textual ID.
@@ -396,6 +437,27 @@ module NarrativeService {
     */
     funcdef find_object_report(FindObjectReportParams params) returns (FindObjectReportOutput) authentication required;
 
+    /*
+        upas: the UPAs of the objects to find reports for.
+    */
+    typedef structure {
+        list<string> upas;
+    } FindObjectReportsParams;
+
+    /*
+        reports: the result for each UPA, in the same order as the input. If looking one up failed, its
+                 result has an error, and the others are still returned.
+    */
+    typedef structure {
+        list<FindObjectReportOutput> reports;
+    } FindObjectReportsOutput;
+
+    /*
+        find_object_reports does what find_object_report does for many objects at once. It takes a few
+        Workspace calls for all of them, rather than a few for each.
+    */
+    funcdef find_object_reports(FindObjectReportsParams params) returns (FindObjectReportsOutput) authentication required;
+
     /*
         ws_id: The workspace id containing the narrative to share
         share_level: The level of sharing requested - one of "r" (read), "w" (write), "a" (admin)
@@ -418,15 +480,21 @@ module NarrativeService {
 
     /*
         This sends a notification to the admins of a workspace (or anyone with share privileges) that a
-        user would like access to it.
+        user would like access to it. The notification is queued and sent to the Feeds service in the
+        background, so ok: 1 means it was queued.
 
         If a request has already been made, this will fail and return with the string "a request has already been made"
     */
     funcdef request_narrative_share(RequestNarrativeShareInput params) returns (RequestNarrativeShareOutput) authentication required;
 
+    /*
+        version is optional - the version from an earlier get_all_app_info call for the same tag.
+        If it's given, only what changed since then is returned (see AllAppInfo).
+    */
     typedef structure {
         string tag;
         string user;
+        string version;
     } GetAppInfoInput;
 
     typedef structure {
@@ -460,11 +528,28 @@ module NarrativeService {
 
     /*
         App info ids are all lowercase - module/app_id
+
+        version identifies the tag's app info, and can be sent back in GetAppInfoInput next time.
+        If it was sent back:
+        - and nothing changed, only version, unchanged (set to 1), and favorites are returned.
+        - and it's an earlier version the service still knows, version, base_version (the version
+          sent), changed_apps (the app infos that are new or different since then, without
+          favorite set), removed_apps (the ids of the apps that are gone), module_versions, and
+          favorites are returned.
+        - otherwise, everything is returned, as if no version was sent.
+        favorites maps the ids of the user's favorite apps to the timestamps when they were made
+        favorites.
     */
     typedef structure {
         mapping<string, string> module_versions;
         mapping<string, CategoryInfo> categories;
         mapping<string, mapping<string, AppInfo>> app_infos;
+        string version;
+        boolean unchanged;
+        string base_version;
+        mapping<string, mapping<string, AppInfo>> changed_apps;
+        list<string> removed_apps;
+        mapping<string, int> favorites;
     } AllAppInfo;
 
     /*
@@ -612,4 +697,68 @@ module NarrativeService {
         If all this goes off well, the new narrative UPA is returned.
     */
     funcdef rename_narrative(RenameNarrativeParams params) returns (RenameNarrativeResult result) authentication required;
+
+    /*
+        name - the profile's name, used to fetch it with get_profile
+        user - the user that made the profiled call, empty if it wasn't authenticated
+        method - the profiled method
+        call_id - the profiled call's id
+        timestamp - when the profile was saved, in milliseconds since the epoch
+        size - size of the profile file, in bytes
+    */
+    typedef structure {
+        string name;
+        string user;
+        string method;
+        string call_id;
+        int timestamp;
+        int size;
+    } ProfileInfo;
+
+    /*
+        limit - optional maximum number of profiles to return
+    */
+    typedef structure {
+        int limit;
+    } ListProfilesParams;
+
+    /*
+        profiles - saved profiles, newest first
+    */
+    typedef structure {
+        list<ProfileInfo> profiles;
+    } ListProfilesResult;
+
+    /*
+        Lists the cProfile profiles of requests saved by this server. Requests are only profiled
+        if profiling is turned on in the server's configuration. Only the profiles of the
+        caller's own requests are listed, unless the caller is one of the server's profile admins.
+    */
+    funcdef list_profiles(ListProfilesParams params) returns (ListProfilesResult result) authentication required;
+
+    /*
+        name - the profile's name, from list_profiles
+        limit - optional number of functions to include in the stats report, default 50
+    */
+    typedef structure {
+        string name;
+        int limit;
+    } GetProfileParams;
+
+    /*
+        info - the profile's info
+        stats - text report of the functions with the most cumulative time
+        data - the profile file, base64 encoded. It can be loaded with pstats or snakeviz.
+    */
+    typedef structure {
+        ProfileInfo info;
+        string stats;
+        string data;
+    } GetProfileResult;
+
+    /*
+        Fetches a saved cProfile profile. Only profiles of the caller's own requests can be
+        fetched, unless the caller is one of the server's profile admins.
+    */
+    funcdef get_profile(GetProfileParams params) returns (GetProfileResult result) authentication required;
 };
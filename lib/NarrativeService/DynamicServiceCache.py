@@ -5,6 +5,7 @@ from .baseclient import (
     BaseClient,
     ServerError
 )
+from .util import metrics
 
 
 class DynamicServiceClient:
@@ -29,19 +30,22 @@ class DynamicServiceClient:
         """
         Calls the given method. Uses the BaseClient and cached service URL.
         """
-        was_url_refreshed = False
-        if not self.cached_url or (time.time() - self.last_refresh_time > self.url_cache_time):
-            self._lookup_url()
-            was_url_refreshed = True
-        try:
-            return self._call(method, params_array, self.token)
-        except ServerError:
-            # Happens if a URL expired for real, even though it's still cached.
-            if was_url_refreshed:
-                raise  # Forwarding error with no changes
-            else:
+        with metrics.registry.time_upstream(self.module_name, method):
+            was_url_refreshed = False
+            if not self.cached_url or (time.time() - self.last_refresh_time > self.url_cache_time):
                 self._lookup_url()
+                was_url_refreshed = True
+            metrics.registry.count_cache('service_url', hits=0 if was_url_refreshed else 1,
+                                         misses=1 if was_url_refreshed else 0)
+            try:
                 return self._call(method, params_array, self.token)
+            except ServerError:
+                # Happens if a URL expired for real, even though it's still cached.
+                if was_url_refreshed:
+                    raise  # Forwarding error with no changes
+                else:
+                    self._lookup_url()
+                    return self._call(method, params_array, self.token)
 
     def _lookup_url(self):
         bc = BaseClient(url=self.sw_url, lookup_url=False)
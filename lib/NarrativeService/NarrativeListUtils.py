@@ -1,5 +1,7 @@
 import pylru
 
+from NarrativeService.util import metrics, tracing
+
 # For reference:
 #   workspace_info:
 #     0 ws_id id
@@ -40,7 +42,10 @@ class NarrativeInfoCache(object):
                  ]
         '''
         # search the cache and extract what we have, mark what was missed
-        res = self._search_cache(ws_lookup_table)
+        with tracing.span('narrative_info cache lookup') as span:
+            res = self._search_cache(ws_lookup_table)
+            if span:
+                span.attrs = {'hits': len(res['items']), 'misses': len(res['missed'])}
         items = res['items']
         missed_items = res['missed']
 
@@ -62,6 +67,7 @@ class NarrativeInfoCache(object):
                 items.append({'ws': ws_info, 'nar': self.cache[key]})
             else:
                 missed.append(ws_info)
+        metrics.registry.count_cache('narrative_info', hits=len(items), misses=len(missed))
         return {'items': items, 'missed': missed}
 
     def _fetch_objects_and_cache(self, ws_list, full_ws_lookup_table, wsClient):
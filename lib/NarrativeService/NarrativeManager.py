@@ -1,9 +1,19 @@
 import json
+import logging
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 from NarrativeService.ServiceUtils import ServiceUtils
-from installed_clients.NarrativeMethodStoreClient import NarrativeMethodStore
+from NarrativeService.narrative.pool import POOL_META_KEY, POOL_META_UNCLAIMED
+from NarrativeService.narrative.summary import SUMMARY_PATHS, summarize_narrative_data
+from NarrativeService.util import tracing
+from NarrativeService.util.lazy import lazy_import
+
+logger = logging.getLogger(__name__)
+
+NarrativeMethodStore = lazy_import("installed_clients.NarrativeMethodStoreClient",
+                                   "NarrativeMethodStore")
 
 
 class NarrativeManager:
@@ -18,16 +28,23 @@ class NarrativeManager:
     KB_STATE = 'widget_state'
 
     DEBUG = False
+    MAX_COPY_THREADS = 10
 
-    def __init__(self, config, user_id, set_api_client, data_palette_client, workspace_client):
+    def __init__(self, config, user_id, set_api_client, data_palette_client, workspace_client,
+                 narrative_pool=None, token=None):
         self.narrativeMethodStoreURL = config["narrative-method-store"]
         self.set_api_client = set_api_client                     # DynamicServiceCache type
         self.data_palette_client = data_palette_client          # DynamicServiceCache type
         self.user_id = user_id
         self.ws = workspace_client
         self.intro_md_file = config["intro-markdown-file"]
+        self.step_times = dict()    # step name -> seconds, filled in by _timed
+        self.narrative_pool = narrative_pool                    # NarrativePool type, optional
+        self.token = token                                      # only used to refill the pool
 
-    def copy_narrative(self, newName, workspaceRef, workspaceId):
+    def copy_narrative(self, newName, workspaceRef, workspaceId, fastCopy=False):
+        if fastCopy:
+            return self._fast_copy_narrative(newName, workspaceRef, workspaceId)
         time_ms = int(round(time.time() * 1000))
         newWsName = self.user_id + ':narrative_' + str(time_ms)
         # add the 'narrative' field to newWsMeta later.
@@ -81,10 +98,7 @@ class NarrativeManager:
             # now, just update the workspace metadata to point
             # to the new narrative object
 
-            if 'worksheets' in currentNarrative['data']:  # handle legacy.
-                num_cells = len(currentNarrative['data']['worksheets'][0]['cells'])
-            else:
-                num_cells = len(currentNarrative['data']['cells'])
+            num_cells = summarize_narrative_data(currentNarrative['data'])['cell_count']
             newNarId = newNarInfo[0][0]
             self.ws.alter_workspace_metadata({
                 'wsi': {
@@ -102,6 +116,52 @@ class NarrativeManager:
             self.ws.delete_workspace({'id': newWsId})
             raise
 
+    def _fast_copy_narrative(self, newName, workspaceRef, workspaceId):
+        """
+        Copies the Narrative by cloning the whole workspace, Narrative object included, and
+        setting everything the copy needs in the new workspace metadata. The Narrative document
+        itself never leaves the Workspace, so this costs the same for any size of Narrative: one
+        get_objects2 call for a subset of the latest version, then clone_workspace.
+
+        clone_workspace copies the latest version of each object, and can't change the object's
+        metadata or document. So the copied Narrative object keeps the original's object and
+        document metadata (its name, ws_name and job info) until it's next saved. The copy's name
+        is set in the workspace metadata (narrative_nice_name), which is what Narrative listings
+        show. If workspaceRef is an earlier version, the regular copy is made instead.
+
+        Object ids are kept by clone_workspace, so the copied Narrative has the same object id
+        as the original.
+        """
+        ref_parts = workspaceRef.split('/')
+        narObj = self.ws.get_objects2({'objects': [{
+            'ref': '/'.join(ref_parts[:2]),
+            'included': SUMMARY_PATHS
+        }]})['data'][0]
+        narInfo = narObj['info']
+        if len(ref_parts) > 2 and ref_parts[2] != str(narInfo[4]):
+            return self.copy_narrative(newName, workspaceRef, workspaceId)
+        if not workspaceId:
+            workspaceId = narInfo[6]
+
+        is_temporary = (narInfo[10] or {}).get('is_temporary')
+        if is_temporary is None:
+            is_temporary = 'true' if newName == 'Untitled' or newName is None else 'false'
+
+        time_ms = int(round(time.time() * 1000))
+        newWsName = self.user_id + ':narrative_' + str(time_ms)
+        newWsId = self.ws.clone_workspace({
+            'wsi': {'id': workspaceId},
+            'workspace': newWsName,
+            'meta': {
+                'narrative_nice_name': newName,
+                'searchtags': 'narrative',
+                'narrative': str(narInfo[0]),
+                'is_temporary': is_temporary,
+                'cell_count': str(summarize_narrative_data(narObj['data'])['cell_count'])
+            }
+        })[0]
+        return {'newWsId': newWsId, 'newNarId': narInfo[0]}
+
     def create_new_narrative(self, app, method, appparam, appData, markdown,
                              copydata, importData, includeIntroCell, title):
         if app and method:
@@ -128,6 +188,11 @@ class NarrativeManager:
             cells = [{"method": method}]
         elif markdown:
             cells = [{"markdown": markdown}]
+        if (self.narrative_pool is not None and not cells and not appData and not importData and
+                title in [None, 'Untitled']):
+            narr_info = self.narrative_pool.claim(self, includeIntroCell, self.token)
+            if narr_info is not None:
+                return narr_info
         narr_info = self._create_temp_narrative(cells, appData, importData, includeIntroCell, title)
         if title is not None:
             # update workspace info so it's not temporary
@@ -143,38 +208,83 @@ class NarrativeManager:
             intro_md = intro_file.read()
         return intro_md
 
-    def _create_temp_narrative(self, cells, parameters, importData, includeIntroCell, title):
+    def create_pooled_narrative(self, includeIntroCell):
+        """
+        Creates a blank, untitled Narrative to be kept in a NarrativePool. It stays out of
+        Narrative listings until claim_pooled_narrative is called on it.
+        """
+        return self._create_temp_narrative(None, None, None, includeIntroCell, None, pooled=True)
+
+    def claim_pooled_narrative(self, narr_info):
+        """
+        Hands out a Narrative made by create_pooled_narrative, by adding the workspace metadata
+        that makes it a Narrative. Returns the same structure as create_new_narrative, with the
+        workspace info as it is after the claim.
+        """
+        ws_id = narr_info['workspaceInfo']['id']
+        self.ws.alter_workspace_metadata({'wsi': {'id': ws_id},
+                                          'new': {
+                                              'narrative': str(narr_info['narrativeInfo']['id']),
+                                              'searchtags': 'narrative'
+                                          },
+                                          'remove': [POOL_META_KEY]})
+        return {
+            'workspaceInfo': ServiceUtils.workspace_info_to_object(
+                self.ws.get_workspace_info({'id': ws_id})),
+            'narrativeInfo': narr_info['narrativeInfo']
+        }
+
+    def list_pooled_narratives(self):
+        """
+        Returns the workspace infos of the user's unclaimed pooled Narratives.
+        """
+        return self.ws.list_workspace_info({'owners': [self.user_id],
+                                            'meta': {POOL_META_KEY: POOL_META_UNCLAIMED}})
+
+    def delete_pooled_narrative(self, ws_id):
+        self.ws.delete_workspace({'id': ws_id})
+
+    def _create_temp_narrative(self, cells, parameters, importData, includeIntroCell, title,
+                               pooled=False):
         # Migration to python of JavaScript class from https://github.com/kbase/kbase-ui/blob/4d31151d13de0278765a69b2b09f3bcf0e832409/src/client/modules/plugins/narrativemanager/modules/narrativeManager.js#L414
         narr_id = int(round(time.time() * 1000))
         workspaceName = self.user_id + ':narrative_' + str(narr_id)
         narrativeName = "Narrative." + str(narr_id)
 
         ws = self.ws
-        ws_info = ws.create_workspace({'workspace': workspaceName, 'description': ''})
-        [narrativeObject, metadataExternal] = self._fetchNarrativeObjects(
-            workspaceName, cells, parameters, includeIntroCell, title
-        )
+        # The workspace doesn't need to exist to build the Narrative object, so fetch app/method
+        # specs from the NMS while the workspace gets created.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            ws_info_future = executor.submit(tracing.propagate(self._timed), 'create_workspace',
+                                             ws.create_workspace,
+                                             {'workspace': workspaceName, 'description': ''})
+            [narrativeObject, metadataExternal] = self._timed(
+                'fetch_narrative_objects', self._fetchNarrativeObjects,
+                workspaceName, cells, parameters, includeIntroCell, title
+            )
+            ws_info = ws_info_future.result()
         is_temporary = 'true'
         if title is not None and title != 'Untitled':
             is_temporary = 'false'
 
         metadataExternal['is_temporary'] = is_temporary
-        objectInfo = ws.save_objects({'workspace': workspaceName,
-                                      'objects': [{'type': 'KBaseNarrative.Narrative',
-                                                   'data': narrativeObject,
-                                                   'name': narrativeName,
-                                                   'meta': metadataExternal,
-                                                   'provenance': [{'script': 'NarrativeManager.py',
-                                                                   'description': 'Created new ' +
-                                                                   'Workspace/Narrative bundle.'}],
-                                                   'hidden': 0}]})[0]
-        objectInfo = ServiceUtils.object_info_to_object(objectInfo)
-        ws_info = self._completeNewNarrative(ws_info[0], objectInfo['id'],
+        objectInfo = self._timed('save_objects', ws.save_objects, {
+            'workspace': workspaceName,
+            'objects': [{'type': 'KBaseNarrative.Narrative',
+                         'data': narrativeObject,
+                         'name': narrativeName,
+                         'meta': metadataExternal,
+                         'provenance': [{'script': 'NarrativeManager.py',
+                                         'description': 'Created new ' +
+                                         'Workspace/Narrative bundle.'}],
+                         'hidden': 0}]})[0]
+        ws_info = self._completeNewNarrative(ws_info, objectInfo,
                                              importData, is_temporary, title,
-                                             len(narrativeObject['cells']))
+                                             len(narrativeObject['cells']), pooled)
+        self._log_step_times()
         return {
             'workspaceInfo': ServiceUtils.workspace_info_to_object(ws_info),
-            'narrativeInfo': objectInfo
+            'narrativeInfo': ServiceUtils.object_info_to_object(objectInfo)
         }
 
     def _fetchNarrativeObjects(self, workspaceName, cells, parameters, includeIntroCell, title):
@@ -305,31 +415,90 @@ class NarrativeManager:
         cell["metadata"][self.KB_CELL] = cellInfo
         return cell
 
-    def _completeNewNarrative(self, workspaceId, objectId, importData, is_temporary, title, num_cells):
+    def _completeNewNarrative(self, ws_info, narrative_info, importData, is_temporary, title,
+                              num_cells, pooled=False):
         """
         'Completes' the new narrative by updating workspace metadata with the required fields and
-        copying in data from the importData list of references.
+        copying in data from the importData list of references. The metadata update and the
+        copies don't depend on each other, so they run at the same time.
+
+        Returns the workspace info of the completed narrative's workspace. It's put together from
+        the info returned at workspace creation, the metadata just set, and the infos of the
+        objects saved and copied into it, rather than fetched again: the object count is the
+        highest object id, and the moddate is the save date of the last object.
+
+        If pooled is True, the 'narrative' and 'searchtags' fields are left out and the workspace
+        is marked as an unclaimed pool Narrative instead (see claim_pooled_narrative).
         """
         new_meta = {
-            'narrative': str(objectId),
+            'narrative': str(narrative_info[0]),
             'is_temporary': is_temporary,
             'searchtags': 'narrative',
             'cell_count': str(num_cells)
         }
         if is_temporary == 'false' and title is not None:
             new_meta['narrative_nice_name'] = title
+        if pooled:
+            del new_meta['narrative']
+            del new_meta['searchtags']
+            new_meta[POOL_META_KEY] = POOL_META_UNCLAIMED
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            alter_future = executor.submit(tracing.propagate(self._timed),
+                                           'alter_workspace_metadata',
+                                           self.ws.alter_workspace_metadata,
+                                           {'wsi': {'id': ws_info[0]}, 'new': new_meta})
+            copied = list()
+            # copy_to_narrative:
+            if importData:
+                copied = self._timed('copy_import_data', self._copy_import_data, importData,
+                                     ws_info[0])
+            alter_future.result()
+
+        meta = dict(ws_info[8])
+        meta.update(new_meta)
+        return [ws_info[0],
+                ws_info[1],
+                ws_info[2],
+                max([ws_info[3], narrative_info[3]] + [obj['save_date'] for obj in copied],
+                    key=ServiceUtils.iso8601_to_millis_since_epoch),
+                max([ws_info[4], narrative_info[0]] + [obj['id'] for obj in copied]),
+                ws_info[5],
+                ws_info[6],
+                ws_info[7],
+                meta]
+
+    def _copy_import_data(self, importData, workspaceId):
+        """
+        Copies each object in the importData list of references into the workspace, several at
+        a time, and returns the infos of the copies (as from ServiceUtils.object_info_to_object).
+        """
+        objectsToCopy = [{'ref': x} for x in importData]
+        infoList = self.ws.get_object_info_new({'objects': objectsToCopy, 'includeMetadata': 0})
+        srcInfos = ServiceUtils.object_infos_to_objects(infoList)
+        with ThreadPoolExecutor(max_workers=min(len(srcInfos), self.MAX_COPY_THREADS)) as executor:
+            return [copy['info'] for copy in executor.map(
+                tracing.propagate(lambda src_info: self.copy_object(src_info['ref'], workspaceId,
+                                                                    None, None, src_info)),
+                srcInfos
+            )]
+
+    def _timed(self, step, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) and records how long it took under the given step name,
+        and as a trace span.
+        """
+        start = time.time()
+        try:
+            with tracing.span(step):
+                return func(*args, **kwargs)
+        finally:
+            self.step_times[step] = time.time() - start
 
-        self.ws.alter_workspace_metadata({'wsi': {'id': workspaceId},
-                                          'new': new_meta})
-        # copy_to_narrative:
-        if importData:
-            objectsToCopy = [{'ref': x} for x in importData]
-            infoList = self.ws.get_object_info_new({'objects': objectsToCopy, 'includeMetadata': 0})
-            for item in infoList:
-                objectInfo = ServiceUtils.object_info_to_object(item)
-                self.copy_object(objectInfo['ref'], workspaceId, None, None, objectInfo)
-
-        return self.ws.get_workspace_info({'id': workspaceId})
+    def _log_step_times(self):
+        if self.DEBUG:
+            for step, elapsed in self.step_times.items():
+                logger.info("NarrativeManager step {}: {:.1f} ms".format(step, elapsed * 1000))
 
     def _safeJSONStringify(self, obj):
         return json.dumps(self._safeJSONStringifyPrepare(obj))
@@ -371,3 +540,36 @@ class NarrativeManager:
         obj_info = ServiceUtils.object_info_to_object(obj_info_tuple)
         return {'info': obj_info}
 
+    def copy_objects(self, refs, target_ws_id, target_ws_name):
+        """
+        Copies a list of objects from their workspaces into one target workspace. The source
+        infos are all looked up in a single call, then the copies run concurrently. A copy
+        that fails doesn't stop the others.
+
+        Returns {'results': [...]} with one dict for each ref, in the same order as refs. Each
+        has either an 'info' key with the new object's info (as in copy_object) or an 'error'
+        key with the reason it couldn't be copied.
+        """
+        if not target_ws_id and not target_ws_name:
+            raise ValueError("Neither target workspace id nor name is defined")
+        if not refs:
+            return {'results': []}
+        infoList = self.ws.get_object_info_new({'objects': [{'ref': ref} for ref in refs],
+                                                'includeMetadata': 0,
+                                                'ignoreErrors': 1})
+
+        def copy_one(ref_and_info):
+            (ref, info) = ref_and_info
+            if info is None:
+                return {'error': 'Object {} does not exist or is not accessible'.format(ref)}
+            try:
+                return self.copy_object(ref, target_ws_id, target_ws_name, None, info)
+            except Exception as e:
+                # ServerErrors carry the whole server-side trace in str(e), the message is enough.
+                return {'error': getattr(e, 'message', None) or str(e)}
+
+        with ThreadPoolExecutor(max_workers=min(len(refs), self.MAX_COPY_THREADS)) as executor:
+            results = list(executor.map(tracing.propagate(copy_one),
+                                        zip(refs, ServiceUtils.object_infos_to_objects(infoList))))
+        return {'results': results}
+
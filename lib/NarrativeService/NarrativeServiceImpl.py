@@ -3,12 +3,19 @@
 from NarrativeService.DynamicServiceCache import DynamicServiceClient
 from NarrativeService.NarrativeListUtils import NarrativeListUtils, NarratorialUtils
 from NarrativeService.NarrativeManager import NarrativeManager
-from NarrativeService.ReportFetcher import ReportFetcher
+from NarrativeService.narrative.pool import NarrativePool
+from NarrativeService.ReportFetcher import ReportCache, ReportFetcher
 from NarrativeService.sharing.sharemanager import ShareRequester
-from NarrativeService.apps.appinfo import get_all_app_info, get_ignore_categories
+from NarrativeService.apps.appinfo import AppInfoCache, get_ignore_categories
 from NarrativeService.data.fetcher import DataFetcher
 from NarrativeService.data.objectswithsets import ObjectsWithSets
-from installed_clients.WorkspaceClient import Workspace
+from NarrativeService.feeds import NotificationQueue
+from NarrativeService.util.lazy import lazy_import
+from NarrativeService.util.object_info_cache import ObjectInfoCache
+from NarrativeService.util.profiling import Profiler
+from NarrativeService.util.workspace import CachingWorkspace
+
+Workspace = lazy_import("installed_clients.WorkspaceClient", "Workspace")
 #END_HEADER
 
 
@@ -40,7 +47,17 @@ class NarrativeService:
                                 ctx["user_id"],
                                 self._get_set_api_client(ctx["token"]),
                                 self._get_data_palette_client(ctx["token"]),
-                                self._get_workspace_client(ctx["token"]))
+                                self._get_workspace_client(ctx["token"], cache_infos=True),
+                                self.narrative_pool,
+                                ctx["token"])
+
+    def _pool_nm(self, user_id, token):
+        """
+        Makes the NarrativeManager that NarrativePool refills create Narratives with. It only has
+        a Workspace client, so a refill keeps nothing else from the request it started in.
+        """
+        return NarrativeManager(self.config, user_id, None, None,
+                                self._get_workspace_client(token))
 
     def _get_data_palette_client(self, token):
         return DynamicServiceClient(self.serviceWizardURL,
@@ -54,8 +71,15 @@ class NarrativeService:
                                     "SetAPI",
                                     token)
 
-    def _get_workspace_client(self, token):
-        return Workspace(self.workspaceURL, token=token)
+    def _get_workspace_client(self, token, cache_infos=False):
+        """
+        With cache_infos, the client takes the metadata in object infos for versioned UPAs
+        from the object info cache.
+        """
+        ws = Workspace(self.workspaceURL, token=token)
+        if not cache_infos:
+            return ws
+        return CachingWorkspace(ws, self.object_info_cache)
 
     #END_CLASS_HEADER
 
@@ -69,6 +93,15 @@ class NarrativeService:
         self.narrativeMethodStoreURL = config['narrative-method-store']
         self.catalogURL = config['catalog-url']
         self.narListUtils = NarrativeListUtils(config['narrative-list-cache-size'])
+        self.narrative_pool = NarrativePool(config.get('narrative-pool-size', 0), self._pool_nm,
+                                            max_age=config.get('narrative-pool-max-age', 3600))
+        self.report_cache = ReportCache(config.get('report-cache-size', 10000))
+        self.object_info_cache = ObjectInfoCache.from_config(config)
+        self.app_info_cache = AppInfoCache(self.narrativeMethodStoreURL, self.catalogURL,
+                                           config.get('app-info-refresh-interval', 300),
+                                           config.get('app-favorites-ttl', 60))
+        self.profiler = Profiler.from_config(config)
+        self.notification_queue = NotificationQueue.from_config(config)
         #END_CONSTRUCTOR
         pass
 
@@ -156,7 +189,7 @@ class NarrativeService:
         ows = ObjectsWithSets(
             self._get_set_api_client(ctx["token"]),
             self._get_data_palette_client(ctx["token"]),
-            self._get_workspace_client(ctx["token"])
+            self._get_workspace_client(ctx["token"], cache_infos=True)
         )
         returnVal = ows.list_objects_with_sets(
             ws_id=ws_id, ws_name=ws_name, workspaces=workspaces, types=types,
@@ -175,9 +208,18 @@ class NarrativeService:
         """
         :param params: instance of type "CopyNarrativeParams" (workspaceId -
            optional workspace ID, if not specified then property from
-           workspaceRef object info is used.) -> structure: parameter
-           "workspaceRef" of String, parameter "workspaceId" of Long,
-           parameter "newName" of String
+           workspaceRef object info is used. fastCopy - optional, default 0.
+           If 1, and workspaceRef is the latest version of the Narrative,
+           the Narrative object is cloned along with the rest of the
+           workspace and only the workspace metadata is set, so the
+           Narrative document is never downloaded or re-saved. The copy
+           keeps the original's object and document metadata (name, ws_name
+           and job info) until it's next saved, and its name is only set in
+           the workspace metadata. For earlier versions the regular copy is
+           made.)
+           -> structure: parameter "workspaceRef" of String, parameter
+           "workspaceId" of Long, parameter "newName" of String, parameter
+           "fastCopy" of type "boolean" (@range [0,1])
         :returns: instance of type "CopyNarrativeOutput" -> structure:
            parameter "newWsId" of Long, parameter "newNarId" of Long
         """
@@ -187,7 +229,8 @@ class NarrativeService:
         newName = params['newName']
         workspaceRef = params['workspaceRef']
         workspaceId = params.get('workspaceId', None)
-        returnVal = self._nm(ctx).copy_narrative(newName, workspaceRef, workspaceId)
+        fastCopy = params.get('fastCopy', 0) == 1
+        returnVal = self._nm(ctx).copy_narrative(newName, workspaceRef, workspaceId, fastCopy)
         #END copy_narrative
 
         # At some point might do deeper type checking...
@@ -336,6 +379,59 @@ class NarrativeService:
         # return the results
         return [returnVal]
 
+    def copy_objects(self, ctx, params):
+        """
+        Copies many objects to one workspace at once. A failed copy doesn't stop the others, it
+        gets reported in that object's result.
+        :param params: instance of type "CopyObjectsParams" (refs - workspace
+           references to the source objects, target_ws_id/target_ws_name -
+           alternative ways to define target workspace. Each object keeps its
+           source object name.) -> structure: parameter "refs" of list of
+           String, parameter "target_ws_id" of Long, parameter
+           "target_ws_name" of String
+        :returns: instance of type "CopyObjectsOutput" (results - one result
+           for each of the refs, in the same order) -> structure: parameter
+           "results" of list of type "CopyObjectResult" (info - workspace
+           info of created object, not present if the copy failed error - the
+           reason the copy failed, not present if it succeeded) -> structure:
+           parameter "info" of type "ObjectInfo" (Restructured workspace
+           object info 'data' tuple: id: data[0], name: data[1], type:
+           data[2], save_date: data[3], version: data[4], saved_by: data[5],
+           wsid: data[6], ws: data[7], checksum: data[8], size: data[9],
+           metadata: data[10], ref: data[6] + '/' + data[0] + '/' + data[4],
+           obj_id: 'ws.' + data[6] + '.obj.' + data[0], typeModule: type[0],
+           typeName: type[1], typeMajorVersion: type[2], typeMinorVersion:
+           type[3], saveDateMs:
+           ServiceUtils.iso8601ToMillisSinceEpoch(data[3])) -> structure:
+           parameter "id" of Long, parameter "name" of String, parameter
+           "type" of String, parameter "save_date" of String, parameter
+           "version" of Long, parameter "saved_by" of String, parameter
+           "wsid" of Long, parameter "ws" of String, parameter "checksum" of
+           String, parameter "size" of Long, parameter "metadata" of mapping
+           from String to String, parameter "ref" of String, parameter
+           "obj_id" of String, parameter "typeModule" of String, parameter
+           "typeName" of String, parameter "typeMajorVersion" of String,
+           parameter "typeMinorVersion" of String, parameter "saveDateMs" of
+           Long, parameter "error" of String
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN copy_objects
+        refs = params.get('refs')
+        if not isinstance(refs, list):
+            raise ValueError('"refs" field must be a list of object references.')
+        target_ws_id = params.get('target_ws_id')
+        target_ws_name = params.get('target_ws_name')
+        returnVal = self._nm(ctx).copy_objects(refs, target_ws_id, target_ws_name)
+        #END copy_objects
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method copy_objects return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
+
     def list_available_types(self, ctx, params):
         """
         :param params: instance of type "ListAvailableTypesParams"
@@ -352,7 +448,7 @@ class NarrativeService:
         ows = ObjectsWithSets(
             self._get_set_api_client(ctx["token"]),
             self._get_data_palette_client(ctx["token"]),
-            self._get_workspace_client(ctx["token"]))
+            self._get_workspace_client(ctx["token"], cache_infos=True))
         returnVal = ows.list_available_types(workspaces)
         #END list_available_types
 
@@ -413,7 +509,7 @@ class NarrativeService:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN list_narratorials
-        ws = self._get_workspace_client(ctx["token"])
+        ws = self._get_workspace_client(ctx["token"], cache_infos=True)
         returnVal = {'narratorials': self.narListUtils.list_narratorials(ws)}
         #END list_narratorials
 
@@ -474,7 +570,7 @@ class NarrativeService:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN list_narratives
-        ws = self._get_workspace_client(ctx["token"])
+        ws = self._get_workspace_client(ctx["token"], cache_infos=True)
         nar_type = 'mine'
         valid_types = ['mine', 'shared', 'public']
         if 'type' in params:
@@ -518,7 +614,7 @@ class NarrativeService:
             raise ValueError('"ws" field indicating WS name or id is required.')
         if 'description' not in params:
             raise ValueError('"description" field indicating WS name or id is required.')
-        ws = self._get_workspace_client(ctx["token"])
+        ws = self._get_workspace_client(ctx["token"], cache_infos=True)
         nu = NarratorialUtils()
         nu.set_narratorial(params['ws'], params['description'], ws)
         returnVal = {}
@@ -542,7 +638,7 @@ class NarrativeService:
         #BEGIN remove_narratorial
         if 'ws' not in params:
             raise ValueError('"ws" field indicating WS name or id is required.')
-        ws = self._get_workspace_client(ctx["token"])
+        ws = self._get_workspace_client(ctx["token"], cache_infos=True)
         nu = NarratorialUtils()
         nu.remove_narratorial(params['ws'], ws)
         returnVal = {}
@@ -582,7 +678,8 @@ class NarrativeService:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN find_object_report
-        report_fetcher = ReportFetcher(self._get_workspace_client(ctx["token"]))
+        report_fetcher = ReportFetcher(self._get_workspace_client(ctx["token"], cache_infos=True),
+                                       self.report_cache)
         returnVal = report_fetcher.find_report_from_object(params['upa'])
         #END find_object_report
 
@@ -593,10 +690,54 @@ class NarrativeService:
         # return the results
         return [returnVal]
 
+    def find_object_reports(self, ctx, params):
+        """
+        find_object_reports does what find_object_report does for many objects at once. It takes a few
+        Workspace calls for all of them, rather than a few for each.
+        :param params: instance of type "FindObjectReportsParams" (upas: the
+           UPAs of the objects to find reports for.) -> structure: parameter
+           "upas" of list of String
+        :returns: instance of type "FindObjectReportsOutput" (reports: the
+           result for each UPA, in the same order as the input. If looking
+           one up failed, its result has an error, and the others are still
+           returned.) -> structure: parameter "reports" of list of type
+           "FindObjectReportOutput" (report_upas: the UPAs for the report
+           object. If empty list, then no report is available. But there
+           might be more than one... object_upa: the UPA for the object that
+           this report references. If the originally passed object was
+           copied, then this will be the source of that copy that has a
+           referencing report. copy_inaccessible: 1 if this object was
+           copied, and the user can't see the source, so no report's
+           available. error: if an error occurred while looking up (found an
+           unavailable copy, or the report is not accessible), this will have
+           a sensible string, more or less. Optional.) -> structure:
+           parameter "report_upas" of list of String, parameter "object_upa"
+           of String, parameter "copy_inaccessible" of type "boolean" (@range
+           [0,1]), parameter "error" of String
+        """
+        # ctx is the context object
+        # return variables are: returnVal
+        #BEGIN find_object_reports
+        upas = params.get('upas')
+        if not isinstance(upas, list):
+            raise ValueError('Parameter "upas" must be a list of object UPAs')
+        report_fetcher = ReportFetcher(self._get_workspace_client(ctx["token"], cache_infos=True),
+                                       self.report_cache)
+        returnVal = {'reports': report_fetcher.find_reports_from_objects(upas)}
+        #END find_object_reports
+
+        # At some point might do deeper type checking...
+        if not isinstance(returnVal, dict):
+            raise ValueError('Method find_object_reports return value ' +
+                             'returnVal is not type dict as required.')
+        # return the results
+        return [returnVal]
+
     def request_narrative_share(self, ctx, params):
         """
         This sends a notification to the admins of a workspace (or anyone with share privileges) that a
-        user would like access to it.
+        user would like access to it. The notification is queued and sent to the Feeds service in the
+        background, so ok: 1 means it was queued.
         If a request has already been made, this will fail and return with the string "a request has already been made"
         :param params: instance of type "RequestNarrativeShareInput" (ws_id:
            The workspace id containing the narrative to share share_level:
@@ -613,7 +754,7 @@ class NarrativeService:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN request_narrative_share
-        sm = ShareRequester(params, self.config)
+        sm = ShareRequester(params, self.config, self.notification_queue)
         returnVal = sm.request_share()
         #END request_narrative_share
 
@@ -628,10 +769,23 @@ class NarrativeService:
         """
         This returns all app info from the KBase catalog, formatted in a way to make life easy for the
         Narrative APPS panel on startup.
-        :param input: instance of type "GetAppInfoInput" -> structure:
-           parameter "tag" of String, parameter "user" of String
+        :param input: instance of type "GetAppInfoInput" (version is
+           optional - the version from an earlier get_all_app_info call for
+           the same tag. If it's given, only what changed since then is
+           returned (see AllAppInfo).) -> structure: parameter "tag" of
+           String, parameter "user" of String, parameter "version" of String
         :returns: instance of type "AllAppInfo" (App info ids are all
-           lowercase - module/app_id) -> structure: parameter
+           lowercase - module/app_id version identifies the tag's app info,
+           and can be sent back in GetAppInfoInput next time. If it was sent
+           back: - and nothing changed, only version, unchanged (set to 1),
+           and favorites are returned. - and it's an earlier version the
+           service still knows, version, base_version (the version sent),
+           changed_apps (the app infos that are new or different since then,
+           without favorite set), removed_apps (the ids of the apps that are
+           gone), module_versions, and favorites are returned. - otherwise,
+           everything is returned, as if no version was sent. favorites maps
+           the ids of the user's favorite apps to the timestamps when they
+           were made favorites.) -> structure: parameter
            "module_versions" of mapping from String to String, parameter
            "categories" of mapping from String to type "CategoryInfo" ->
            structure: parameter "description" of String, parameter "id" of
@@ -647,13 +801,28 @@ class NarrativeService:
            parameter "module_name" of String, parameter "name" of String,
            parameter "namespace" of String, parameter "output_types" of list
            of String, parameter "subtitle" of String, parameter "tooltip" of
-           String, parameter "ver" of String, parameter "favorite" of Long
+           String, parameter "ver" of String, parameter "favorite" of Long,
+           parameter "version" of String, parameter "unchanged" of type
+           "boolean" (@range [0,1]), parameter "base_version" of String,
+           parameter "changed_apps" of mapping from String to mapping from
+           String to type "AppInfo" (favorite is optional - if the app is one
+           of the user's favorites, this will be the timestamp when it was
+           made a favorite.) -> structure: parameter "app_type" of String,
+           parameter "authors" of list of String, parameter "categories" of
+           list of String, parameter "git_commit_hash" of String, parameter
+           "id" of String, parameter "input_types" of list of String,
+           parameter "module_name" of String, parameter "name" of String,
+           parameter "namespace" of String, parameter "output_types" of list
+           of String, parameter "subtitle" of String, parameter "tooltip" of
+           String, parameter "ver" of String, parameter "favorite" of Long,
+           parameter "removed_apps" of list of String, parameter "favorites"
+           of mapping from String to Long
         """
         # ctx is the context object
         # return variables are: output
         #BEGIN get_all_app_info
-        output = get_all_app_info(input['tag'], input['user'],
-                                  self.narrativeMethodStoreURL, self.catalogURL)
+        output = self.app_info_cache.get_all_app_info(input['tag'], input['user'],
+                                                      input.get('version'))
         #END get_all_app_info
 
         # At some point might do deeper type checking...
@@ -845,6 +1014,80 @@ class NarrativeService:
                              'result is not type dict as required.')
         # return the results
         return [result]
+
+    def list_profiles(self, ctx, params):
+        """
+        Lists the cProfile profiles of requests saved by this server. Requests are only profiled
+        if profiling is turned on in the server's configuration. Only the profiles of the
+        caller's own requests are listed, unless the caller is one of the server's profile admins.
+        :param params: instance of type "ListProfilesParams" (limit -
+           optional maximum number of profiles to return) -> structure:
+           parameter "limit" of Long
+        :returns: instance of type "ListProfilesResult" (profiles - saved
+           profiles, newest first) -> structure: parameter "profiles" of list
+           of type "ProfileInfo" (name - the profile's name, used to fetch it
+           with get_profile user - the user that made the profiled call,
+           empty if it wasn't authenticated method - the profiled method
+           call_id - the profiled call's id timestamp - when the profile was
+           saved, in milliseconds since the epoch size - size of the profile
+           file, in bytes) -> structure: parameter "name" of String,
+           parameter "user" of String, parameter "method" of String,
+           parameter "call_id" of String, parameter "timestamp" of Long,
+           parameter "size" of Long
+        """
+        # ctx is the context object
+        # return variables are: result
+        #BEGIN list_profiles
+        result = {'profiles': self.profiler.list_profiles(params.get('limit'),
+                                                          for_user=ctx['user_id'])}
+        #END list_profiles
+
+        # At some point might do deeper type checking...
+        if not isinstance(result, dict):
+            raise ValueError('Method list_profiles return value ' +
+                             'result is not type dict as required.')
+        # return the results
+        return [result]
+
+    def get_profile(self, ctx, params):
+        """
+        Fetches a saved cProfile profile. Only profiles of the caller's own requests can be
+        fetched, unless the caller is one of the server's profile admins.
+        :param params: instance of type "GetProfileParams" (name - the
+           profile's name, from list_profiles limit - optional number of
+           functions to include in the stats report, default 50) ->
+           structure: parameter "name" of String, parameter "limit" of Long
+        :returns: instance of type "GetProfileResult" (info - the profile's
+           info stats - text report of the functions with the most
+           cumulative time data - the profile file, base64 encoded. It can be
+           loaded with pstats or snakeviz.) -> structure: parameter "info" of
+           type "ProfileInfo" (name - the profile's name, used to fetch it
+           with get_profile user - the user that made the profiled call,
+           empty if it wasn't authenticated method - the profiled method
+           call_id - the profiled call's id timestamp - when the profile was
+           saved, in milliseconds since the epoch size - size of the profile
+           file, in bytes) -> structure: parameter "name" of String,
+           parameter "user" of String, parameter "method" of String,
+           parameter "call_id" of String, parameter "timestamp" of Long,
+           parameter "size" of Long, parameter "stats" of String, parameter
+           "data" of String
+        """
+        # ctx is the context object
+        # return variables are: result
+        #BEGIN get_profile
+        if 'name' not in params:
+            raise ValueError('"name" is a required parameter.')
+        result = self.profiler.get_profile(params['name'], params.get('limit', 50),
+                                           for_user=ctx['user_id'])
+        #END get_profile
+
+        # At some point might do deeper type checking...
+        if not isinstance(result, dict):
+            raise ValueError('Method get_profile return value ' +
+                             'result is not type dict as required.')
+        # return the results
+        return [result]
+
     def status(self, ctx):
         #BEGIN_STATUS
         returnVal = {'state': "OK",
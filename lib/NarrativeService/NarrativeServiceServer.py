@@ -1,15 +1,19 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import datetime
+import itertools
 import json
 import os
 import random as _random
 import sys
+import time
 import traceback
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from getopt import getopt, GetoptError
-from multiprocessing import Process
 from os import environ
-from wsgiref.simple_server import make_server
+from urllib.parse import parse_qs
 
 import requests as _requests
 from jsonrpcbase import JSONRPCService, InvalidParamsError, KeywordError, \
@@ -18,6 +22,9 @@ from jsonrpcbase import ServerError as JSONServerError
 
 from biokbase import log
 from NarrativeService.authclient import KBaseAuth as _KBaseAuth
+from NarrativeService.util import json_codec, metrics, service_log, tracing
+from NarrativeService.util.response_cache import (ResponseCache, encoded_etag,
+                                                  matching_etag)
 
 try:
     from ConfigParser import ConfigParser
@@ -52,7 +59,11 @@ def get_config():
 config = get_config()
 
 from NarrativeService.NarrativeServiceImpl import NarrativeService  # noqa @IgnorePep8
+json_codec.codec = json_codec.get_codec((config or {}).get('json-codec') or None)
 impl_NarrativeService = NarrativeService(config)
+# the codec replaces the clients' _call, so it goes before the metrics wrapper
+json_codec.install_in_clients()
+metrics.instrument_clients()
 
 
 class JSONObjectEncoder(json.JSONEncoder):
@@ -67,8 +78,120 @@ class JSONObjectEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+# responses are encoded and sent in chunks of about this many bytes. A response that fits in
+# one chunk is sent with a content-length, larger ones are sent as they're encoded.
+RESPONSE_CHUNK_SIZE = 64 * 1024
+# lists and dicts nested deeper than this in a response are encoded in one piece
+_CHUNK_MAX_DEPTH = 4
+# number of items at a time to encode from a list whose items are encoded in one piece
+_CHUNK_LIST_SLICE = 100
+
+
+def _iterencode(obj, depth=0):
+    """
+    Encodes obj to JSON a piece at a time, as utf-8 bytes. The outer lists and dicts are walked
+    here and everything inside them is encoded with json_codec, which is much faster than
+    JSONEncoder.iterencode. With the json module as the codec, the joined pieces are the same as
+    json.dumps(obj, cls=JSONObjectEncoder).
+    """
+    if depth + 1 == _CHUNK_MAX_DEPTH and isinstance(obj, (list, tuple)) and obj:
+        # the items won't be walked, so encode them a slice at a time
+        yield b'['
+        for i in range(0, len(obj), _CHUNK_LIST_SLICE):
+            if i:
+                yield b', '
+            yield json_codec.dumps_bytes(list(obj[i:i + _CHUNK_LIST_SLICE]))[1:-1]
+        yield b']'
+    elif depth < _CHUNK_MAX_DEPTH and isinstance(obj, (list, tuple)) and obj:
+        yield b'['
+        for i, item in enumerate(obj):
+            if i:
+                yield b', '
+            yield from _iterencode(item, depth + 1)
+        yield b']'
+    elif (depth < _CHUNK_MAX_DEPTH and isinstance(obj, dict) and obj and
+            all(isinstance(k, str) for k in obj)):
+        yield b'{'
+        for i, (key, value) in enumerate(obj.items()):
+            yield (b', ' if i else b'') + json_codec.dumps_bytes(key) + b': '
+            yield from _iterencode(value, depth + 1)
+        yield b'}'
+    else:
+        yield json_codec.dumps_bytes(obj)
+
+
+def encode_json_chunks(obj, chunk_size=RESPONSE_CHUNK_SIZE):
+    """
+    Yields the JSON encoding of obj as utf-8 encoded chunks of about chunk_size bytes.
+    """
+    parts = []
+    size = 0
+    for part in _iterencode(obj):
+        parts.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield b''.join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield b''.join(parts)
+
+
+# zlib wbits for each supported Content-Encoding. HTTP's "deflate" is the zlib format.
+_COMPRESSION_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+
+def get_response_encoding(accept_encoding):
+    """
+    Returns the content coding to compress a response with - 'gzip' or 'deflate' - given the
+    value of a request's Accept-Encoding header, or None if neither is accepted. gzip is preferred
+    when both have the same q-value.
+    """
+    best = None
+    best_q = 0
+    for coding in (accept_encoding or '').split(','):
+        parts = coding.split(';')
+        name = parts[0].strip().lower()
+        q = 1.0
+        for param in parts[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0
+        if name == '*':
+            name = 'gzip'
+        if name in _COMPRESSION_WBITS and q > 0 and \
+                (q > best_q or (q == best_q and name == 'gzip')):
+            best = name
+            best_q = q
+    return best
+
+
+def compress_chunks(chunks, encoding, level):
+    """
+    Yields the chunks compressed with the given content coding ('gzip' or 'deflate').
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _COMPRESSION_WBITS[encoding])
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
 class JSONRPCServiceCustom(JSONRPCService):
 
+    # maximum number of requests in a batch that are run at the same time. 1 runs them in order.
+    batch_concurrency = 1
+
+    def __init__(self):
+        super(JSONRPCServiceCustom, self).__init__()
+        # cached results are kept in the chunks they're sent in
+        self.response_cache = ResponseCache(
+            encode=lambda result: list(encode_json_chunks(result)))
+
     def call(self, ctx, jsondata):
         """
         Calls jsonrpc service's method and returns its return value in a JSON
@@ -84,6 +207,19 @@ class JSONRPCServiceCustom(JSONRPCService):
         return None
 
     def _call_method(self, ctx, request):
+        """
+        Calls given method with given params and returns it value, or a cached
+        value if the method's results are cached (see ResponseCache). Sets
+        ctx.encoded_result for cached results.
+        """
+        if not self.response_cache.is_cached(request['method']):
+            return self._call_uncached_method(ctx, request)
+        result, ctx.encoded_result = self.response_cache.call(
+            request['method'], ctx, request['params'],
+            lambda: self._call_uncached_method(ctx, request))
+        return result
+
+    def _call_uncached_method(self, ctx, request):
         """Calls given method with given params and returns it value."""
         method = self.method_data[request['method']]['method']
         params = request['params']
@@ -163,8 +299,7 @@ class JSONRPCServiceCustom(JSONRPCService):
                 self._fill_request(request_, rdata_)
                 requests.append(request_)
 
-            for request_ in requests:
-                respond = self._handle_request(ctx, request_)
+            for respond in self._handle_batch(ctx, requests):
                 # Don't respond to notifications
                 if respond is not None:
                     responds.append(respond)
@@ -178,12 +313,38 @@ class JSONRPCServiceCustom(JSONRPCService):
             # empty dict, list or wrong type
             raise InvalidRequestError
 
+    def _handle_batch(self, ctx, requests):
+        """
+        Handles each request in a batch and returns their responses in the same order. Up to
+        batch_concurrency requests run at the same time, each with its own copy of the context.
+        If any request fails, the first failure in request order is raised, same as running them
+        one at a time.
+        """
+        workers = min(self.batch_concurrency, len(requests))
+        if workers < 2:
+            return [self._handle_request(ctx.for_request(request_), request_)
+                    for request_ in requests]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            handle_request = tracing.propagate(self._handle_request)
+            futures = [executor.submit(handle_request, ctx.for_request(request_), request_)
+                       for request_ in requests]
+        return [future.result() for future in futures]
+
     def _handle_request(self, ctx, request):
         """Handles given request and returns its response."""
-        if 'types' in self.method_data[request['method']]:
-            self._validate_params_types(request['method'], request['params'])
+        start = time.time()
+        error = True
+        try:
+            with tracing.span(request['method']):
+                if 'types' in self.method_data[request['method']]:
+                    self._validate_params_types(request['method'],
+                                                request['params'])
 
-        result = self._call_method(ctx, request)
+                result = self._call_method(ctx, request)
+            error = False
+        finally:
+            metrics.registry.observe_rpc(request['method'],
+                                         time.time() - start, error)
 
         # Do not respond to notifications.
         if request['id'] is None:
@@ -211,6 +372,28 @@ class MethodContext(dict):
         self['provenance'] = None
         self._debug_levels = set([7, 8, 9, 'DEBUG', 'DEBUG2', 'DEBUG3'])
         self._logger = logger
+        # the request's util.tracing.Trace, if slow call logging is on
+        self.trace = None
+        # the result's ETag and encoding (a response_cache.EncodedResult),
+        # if it came from or went into the response cache
+        self.encoded_result = None
+
+    def for_request(self, request):
+        """
+        Returns a copy of this context for a single request out of a batch, with the module,
+        method, call id, and provenance set for that request. Changes to the copy don't affect
+        this context or the other requests' copies.
+        """
+        ctx = MethodContext(self._logger)
+        ctx.update(deepcopy(dict(self)))
+        ctx.trace = self.trace
+        ctx['module'], ctx['method'] = request['method'].split('.')
+        ctx['call_id'] = request['id']
+        ctx['provenance'] = [{'service': ctx['module'],
+                              'method': ctx['method'],
+                              'method_params': request['params']
+                              }]
+        return ctx
 
     def log_err(self, message):
         self._log(log.ERR, message)
@@ -313,6 +496,15 @@ def getIPAddress(environ):
     return environ.get('REMOTE_ADDR')
 
 
+def _public_narratives_key(params):
+    # only the public list is cached, the user's own and shared lists change
+    # as they work
+    if params and isinstance(params[0], dict) and \
+            params[0].get('type') == 'public':
+        return 'public'
+    return None
+
+
 class Application(object):
     # Wrap the wsgi handler in a class definition so that we can
     # do some initialization and avoid regenerating stuff over
@@ -336,7 +528,29 @@ class Application(object):
             submod, ip_address=True, authuser=True, module=True, method=True,
             call_id=True, logfile=self.userlog.get_log_file())
         self.serverlog.set_log_level(6)
+        service_log.send_to_kbase_log(self.serverlog)
         self.rpc_service = JSONRPCServiceCustom()
+        if config:
+            self.rpc_service.batch_concurrency = int(
+                config.get('batch-concurrency', 1))
+        # responses at least this many bytes long are compressed if the
+        # client accepts it. A level of 0 turns compression off.
+        self.compression_threshold = int(
+            (config or {}).get('response-compression-threshold', 1024))
+        self.compression_level = int(
+            (config or {}).get('response-compression-level', 6))
+        # requests that take longer than this many seconds get their trace
+        # logged. If it isn't set, requests aren't traced.
+        threshold = (config or {}).get('slow-call-log-threshold')
+        self.slow_call_threshold = float(threshold) if threshold else None
+        # metrics are served with a GET on exactly this path, if they're
+        # turned on. They aren't by default, since anyone can fetch them.
+        self.metrics_path = None
+        if (config or {}).get('metrics-enabled') == 'true':
+            self.metrics_path = (config or {}).get('metrics-path') or '/metrics'
+        self.profiler = None
+        if impl_NarrativeService.profiler.enabled:
+            self.profiler = impl_NarrativeService.profiler
         self.method_authentication = dict()
         self.rpc_service.add(impl_NarrativeService.list_objects_with_sets,
                              name='NarrativeService.list_objects_with_sets',
@@ -354,6 +568,10 @@ class Application(object):
                              name='NarrativeService.copy_object',
                              types=[dict])
         self.method_authentication['NarrativeService.copy_object'] = 'required'  # noqa
+        self.rpc_service.add(impl_NarrativeService.copy_objects,
+                             name='NarrativeService.copy_objects',
+                             types=[dict])
+        self.method_authentication['NarrativeService.copy_objects'] = 'required'  # noqa
         self.rpc_service.add(impl_NarrativeService.list_available_types,
                              name='NarrativeService.list_available_types',
                              types=[dict])
@@ -378,6 +596,10 @@ class Application(object):
                              name='NarrativeService.find_object_report',
                              types=[dict])
         self.method_authentication['NarrativeService.find_object_report'] = 'required'  # noqa
+        self.rpc_service.add(impl_NarrativeService.find_object_reports,
+                             name='NarrativeService.find_object_reports',
+                             types=[dict])
+        self.method_authentication['NarrativeService.find_object_reports'] = 'required'  # noqa
         self.rpc_service.add(impl_NarrativeService.request_narrative_share,
                              name='NarrativeService.request_narrative_share',
                              types=[dict])
@@ -402,9 +624,19 @@ class Application(object):
                              name='NarrativeService.rename_narrative',
                              types=[dict])
         self.method_authentication['NarrativeService.rename_narrative'] = 'required'  # noqa
+        self.rpc_service.add(impl_NarrativeService.list_profiles,
+                             name='NarrativeService.list_profiles',
+                             types=[dict])
+        self.method_authentication['NarrativeService.list_profiles'] = 'required'  # noqa
+        self.rpc_service.add(impl_NarrativeService.get_profile,
+                             name='NarrativeService.get_profile',
+                             types=[dict])
+        self.method_authentication['NarrativeService.get_profile'] = 'required'  # noqa
         self.rpc_service.add(impl_NarrativeService.status,
                              name='NarrativeService.status',
                              types=[dict])
+        if (config or {}).get('response-cache-enabled', 'true') == 'true':
+            self.add_cached_methods()
         authurl = config.get(AUTH) if config else None
         self.auth_client = _KBaseAuth(authurl)
 
@@ -413,6 +645,10 @@ class Application(object):
         ctx = MethodContext(self.userlog)
         ctx['client_ip'] = getIPAddress(environ)
         status = '500 Internal Server Error'
+        rpc_result = None
+        response_chunks = None
+        # the ETag to send, if the result has one
+        etag = None
 
         try:
             body_size = int(environ.get('CONTENT_LENGTH', 0))
@@ -422,10 +658,20 @@ class Application(object):
             # we basically do nothing and just return headers
             status = '200 OK'
             rpc_result = ""
+        elif (environ['REQUEST_METHOD'] == 'GET' and self.metrics_path and
+                environ.get('PATH_INFO') == self.metrics_path):
+            body = metrics.registry.prometheus_text().encode('utf8')
+            start_response('200 OK', [
+                ('content-type', 'text/plain; version=0.0.4; charset=utf-8'),
+                ('content-length', str(len(body)))])
+            return [body]
         else:
-            request_body = environ['wsgi.input'].read(body_size)
             try:
-                req = json.loads(request_body)
+                if environ['REQUEST_METHOD'] == 'GET':
+                    req = self.get_request(environ)
+                else:
+                    request_body = environ['wsgi.input'].read(body_size)
+                    req = json_codec.loads(request_body)
             except ValueError as ve:
                 err = {'error': {'code': -32700,
                                  'name': "Parse error",
@@ -433,26 +679,46 @@ class Application(object):
                                  }
                        }
                 rpc_result = self.process_error(err, ctx, {'version': '1.1'})
+            except InvalidRequestError as ire:
+                err = {'error': {'code': ire.code,
+                                 'name': ire.message,
+                                 'message': ire.data,
+                                 }
+                       }
+                rpc_result = self.process_error(err, ctx, {'version': '1.1'})
             else:
-                ctx['module'], ctx['method'] = req['method'].split('.')
-                ctx['call_id'] = req['id']
-                ctx['rpc_context'] = {
-                    'call_stack': [{'time': self.now_in_utc(),
-                                    'method': req['method']}
-                                   ]
-                }
-                prov_action = {'service': ctx['module'],
-                               'method': ctx['method'],
-                               'method_params': req['params']
-                               }
-                ctx['provenance'] = [prov_action]
+                if isinstance(req, list):
+                    # a batch - each request in it gets its own copy of
+                    # this context when it runs, see MethodContext.for_request
+                    method_names = [r.get('method') for r in req
+                                    if isinstance(r, dict)]
+                    ctx['module'] = get_service_name() or 'NarrativeService'
+                    ctx['method'] = 'batch'
+                    ctx['rpc_context'] = {
+                        'call_stack': [{'time': self.now_in_utc(),
+                                        'method': ctx['module'] + '.batch'}
+                                       ]
+                    }
+                else:
+                    method_names = [req['method']]
+                    ctx['module'], ctx['method'] = req['method'].split('.')
+                    ctx['call_id'] = req['id']
+                    ctx['rpc_context'] = {
+                        'call_stack': [{'time': self.now_in_utc(),
+                                        'method': req['method']}
+                                       ]
+                    }
+                    prov_action = {'service': ctx['module'],
+                                   'method': ctx['method'],
+                                   'method_params': req['params']
+                                   }
+                    ctx['provenance'] = [prov_action]
                 try:
                     token = environ.get('HTTP_AUTHORIZATION')
-                    # parse out the method being requested and check if it
-                    # has an authentication requirement
-                    method_name = req['method']
-                    auth_req = self.method_authentication.get(
-                        method_name, 'none')
+                    # parse out the method(s) being requested and check if
+                    # they have an authentication requirement. A batch uses
+                    # the strictest requirement of its methods.
+                    auth_req = self.get_auth_requirement(method_names)
                     if auth_req != 'none':
                         if token is None and auth_req == 'required':
                             err = JSONServerError()
@@ -479,9 +745,45 @@ class Application(object):
                         self.log(log.INFO, ctx, 'X-Forwarded-For: ' +
                                  environ.get('HTTP_X_FORWARDED_FOR'))
                     self.log(log.INFO, ctx, 'start method')
-                    rpc_result = self.rpc_service.call(ctx, req)
-                    self.log(log.INFO, ctx, 'end method')
-                    status = '200 OK'
+                    if self.slow_call_threshold is not None:
+                        ctx.trace = tracing.start_trace(
+                            ctx['module'] + '.' + ctx['method'])
+                    try:
+                        if (self.profiler and
+                                self.profiler.should_profile(environ)):
+                            result = self.profiler.run(
+                                ctx['module'] + '.' + ctx['method'],
+                                ctx['call_id'], ctx['user_id'],
+                                self.rpc_service.call_py, ctx, req)
+                        else:
+                            result = self.rpc_service.call_py(ctx, req)
+                        self.log(log.INFO, ctx, 'end method')
+                        encoded = ctx.encoded_result
+                        etag = encoded.etag if encoded else None
+                        # only a GET can be answered with a 304, a POST
+                        # response isn't cacheable
+                        not_modified = None
+                        if environ['REQUEST_METHOD'] == 'GET':
+                            not_modified = matching_etag(
+                                etag, environ.get('HTTP_IF_NONE_MATCH'))
+                        if not_modified:
+                            # the client's tag says which encoding it has
+                            etag = not_modified
+                            status = '304 Not Modified'
+                            response_chunks = []
+                        elif result is not None and encoded:
+                            response_chunks = self.encode_cached_response(
+                                result, encoded)
+                        elif result is not None:
+                            # only the first chunks are encoded here
+                            with tracing.span('encode response'):
+                                response_chunks = self.encode_response(
+                                    result, ctx)
+                    finally:
+                        if ctx.trace:
+                            self.finish_trace(ctx)
+                    if status != '304 Not Modified':
+                        status = '200 OK'
                 except JSONRPCError as jre:
                     err = {'error': {'code': jre.code,
                                      'name': jre.message,
@@ -506,19 +808,148 @@ class Application(object):
         # print('Result from the method call is:\n%s\n' % \
         #    pprint.pformat(rpc_result))
 
-        if rpc_result:
-            response_body = rpc_result
-        else:
-            response_body = ''
+        if response_chunks is None:
+            response_chunks = [rpc_result.encode('utf8') if rpc_result else b'']
 
         response_headers = [
             ('Access-Control-Allow-Origin', '*'),
             ('Access-Control-Allow-Headers', environ.get(
                 'HTTP_ACCESS_CONTROL_REQUEST_HEADERS', 'authorization')),
-            ('content-type', 'application/json'),
-            ('content-length', str(len(response_body)))]
+            ('content-type', 'application/json')]
+        content_encoding = None
+        if self.compression_level > 0:
+            response_headers.append(('Vary', 'Accept-Encoding'))
+            encoding = get_response_encoding(
+                environ.get('HTTP_ACCEPT_ENCODING'))
+            if not encoding:
+                pass
+            elif not isinstance(response_chunks, list):
+                # a streamed response is always bigger than the threshold
+                response_chunks = compress_chunks(
+                    response_chunks, encoding, self.compression_level)
+                content_encoding = encoding
+            elif (response_chunks and sum(len(c) for c in response_chunks) >=
+                    self.compression_threshold):
+                response_chunks = [b''.join(compress_chunks(
+                    response_chunks, encoding, self.compression_level))]
+                content_encoding = encoding
+        if content_encoding:
+            response_headers.append(('Content-Encoding', content_encoding))
+        if etag:
+            # the ETag is for the result, the rest of the response (the id)
+            # can differ. A compressed response's bytes differ, so it gets
+            # its own ETag.
+            if content_encoding:
+                etag = encoded_etag(etag, content_encoding)
+            response_headers.append(('ETag', etag))
+            response_headers.append(('Access-Control-Expose-Headers', 'ETag'))
+            if environ['REQUEST_METHOD'] == 'GET':
+                # the result can depend on the user, so it's only kept by
+                # the client, and checked with If-None-Match before it's used
+                response_headers.append(('Cache-Control', 'private, no-cache'))
+        if (isinstance(response_chunks, list) and
+                status != '304 Not Modified'):
+            response_headers.append(
+                ('content-length', str(sum(len(c) for c in response_chunks))))
         start_response(status, response_headers)
-        return [response_body.encode('utf8')]
+        return response_chunks
+
+    def add_cached_methods(self):
+        """
+        Turns on response caching for read-only methods whose results
+        rarely change.
+        """
+        cache = self.rpc_service.response_cache
+        cache.add('NarrativeService.get_ignore_categories', ttl=3600,
+                  max_size=1)
+        # these include the user's permissions in each workspace info, so
+        # they're cached for each user
+        cache.add('NarrativeService.list_narratorials', ttl=60,
+                  max_size=1000, per_user=True,
+                  invalidated_by=['NarrativeService.set_narratorial',
+                                  'NarrativeService.remove_narratorial'])
+        cache.add('NarrativeService.list_narratives', ttl=60, max_size=1000,
+                  per_user=True, key=_public_narratives_key)
+
+    def get_request(self, environ):
+        """
+        Returns the JSON-RPC request for a GET, from its method, params (JSON, default []), and
+        id query parameters. Only methods with cached results can be called with a GET, so their
+        responses can be checked with If-None-Match.
+        """
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        method = query.get('method', [None])[0]
+        if not self.rpc_service.response_cache.caches(method):
+            err = InvalidRequestError()
+            err.data = ('Only methods with cached results can be called with a GET, '
+                        'not {}'.format(method))
+            raise err
+        return {'method': method,
+                'params': json_codec.loads(query.get('params', ['[]'])[0]),
+                'version': '1.1',
+                'id': query.get('id', ['0'])[0]}
+
+    def encode_cached_response(self, response, encoded):
+        """
+        Returns the chunks of a JSON-RPC response whose result came from the response cache, using
+        the result's cached encoding instead of encoding it again.
+        """
+        prefix = [b'{']
+        suffix = []
+        parts = prefix
+        for i, (key, value) in enumerate(response.items()):
+            parts.append((b', ' if i else b'') + json_codec.dumps_bytes(key) + b': ')
+            if key == 'result':
+                parts = suffix
+            else:
+                parts.append(json_codec.dumps_bytes(value))
+        suffix.append(b'}')
+        return [b''.join(prefix)] + list(encoded.chunks) + [b''.join(suffix)]
+
+    def encode_response(self, result, ctx):
+        """
+        Starts encoding a JSON-RPC response. If it fits in one chunk, it's returned as a list with
+        that chunk, so it can be sent with a content-length. Otherwise, an iterator over the chunks
+        is returned so the server can send them (chunked, or until the connection closes) while the
+        rest is encoded, without holding the whole response in memory.
+
+        The first two chunks are encoded here, so a result that can't be encoded there raises
+        and gets an error response. Once the first chunk is sent it's too late for that, so a
+        failure later on is logged and the response ends there, leaving invalid JSON.
+        """
+        chunks = encode_json_chunks(result)
+        first = next(chunks, b'')
+        second = next(chunks, None)
+        if second is None:
+            return [first]
+        return itertools.chain([first, second], self._rest_of_response(chunks, ctx))
+
+    def _rest_of_response(self, chunks, ctx):
+        try:
+            yield from chunks
+        except (TypeError, ValueError) as e:
+            self.log(log.ERR, ctx, 'response truncated, the result could not be '
+                                   'encoded: {}'.format(e))
+
+    def finish_trace(self, ctx):
+        """
+        Ends the request's trace, and logs its span tree if the request took
+        longer than slow_call_threshold.
+        """
+        root = ctx.trace.finish()
+        if root.duration >= self.slow_call_threshold:
+            self.log(log.INFO, ctx, 'slow call took {:.1f}ms'.format(
+                root.duration * 1000))
+            for line in ctx.trace.format():
+                self.log(log.INFO, ctx, 'slow call trace: ' + line)
+
+    def get_auth_requirement(self, method_names):
+        auth_reqs = [self.method_authentication.get(name, 'none')
+                     for name in method_names]
+        for auth_req in ['required', 'optional']:
+            if auth_req in auth_reqs:
+                return auth_req
+        return 'none'
 
     def process_error(self, error, context, request, trace=None):
         if trace:
@@ -549,6 +980,25 @@ class Application(object):
 
 application = Application()
 
+_asgi_application = None
+
+
+def __getattr__(name):
+    # The same application for ASGI servers, e.g.
+    # uvicorn NarrativeService.NarrativeServiceServer:asgi_application
+    # Each request runs in a thread from a pool of asgi-max-threads. It's
+    # made when first used, so uwsgi workers don't import asyncio.
+    global _asgi_application
+    if name != 'asgi_application':
+        raise AttributeError("module {!r} has no attribute {!r}".format(
+            __name__, name))
+    if _asgi_application is None:
+        from NarrativeService.util.asgi import ASGIAdapter, DEFAULT_MAX_THREADS
+        _asgi_application = ASGIAdapter(
+            application,
+            (config or {}).get('asgi-max-threads') or DEFAULT_MAX_THREADS)
+    return _asgi_application
+
 # This is the uwsgi application dictionary. On startup uwsgi will look
 # for this dict and pull its configuration from here.
 # This simply lists where to "mount" the application in the URL path
@@ -589,6 +1039,8 @@ def start_server(host='localhost', port=0, newprocess=False):
     thus allow the stop_server method to be called, set newprocess = True. This
     will also allow returning of the port number.'''
 
+    from multiprocessing import Process
+    from wsgiref.simple_server import make_server
     global _proc
     if _proc:
         raise RuntimeError('server is already running')
@@ -1,43 +1,254 @@
+import re
+import threading
+
+import pylru
+
 from NarrativeService.ServiceUtils import ServiceUtils
+from NarrativeService.util import metrics, tracing
+
+# copy chains longer than this are given up on
+MAX_COPY_DEPTH = 20
+COPY_INACCESSIBLE_ERROR = "No report found. This object is a copy, and its source is inaccessible."
+_VERSIONED_UPA = re.compile(r"^\d+/\d+/\d+$")
+
+
+class ReportCache(object):
+    """
+    Remembers the reports found for objects, by versioned UPA, as (object_upa, report_upas) -
+    object_upa being the object itself or the source of the copy it came from. Versioned objects
+    and their copy sources never change, so entries don't expire, and every copy along a chain
+    gets one, so other copies of a popular object resolve without walking the chain again.
+    Objects without a report aren't remembered, as one might be made later.
+
+    The cache is shared by all users, but the reports found depend on what the user who found
+    them can read. So ReportFetcher only uses an entry after checking the caller can read the
+    object, its copy source, and the reports, and drops the reports they can't.
+    """
+    def __init__(self, cache_size=10000):
+        self._cache = pylru.lrucache(int(cache_size))
+        self._lock = threading.Lock()
+
+    def get(self, upa):
+        with self._lock:
+            found = self._cache.get(upa)
+        if found:
+            metrics.registry.count_cache('report', hits=1)
+        else:
+            metrics.registry.count_cache('report', misses=1)
+        return found
+
+    def put(self, upas, object_upa, report_upas):
+        with self._lock:
+            for upa in upas:
+                if _VERSIONED_UPA.match(upa):
+                    self._cache[upa] = (object_upa, report_upas)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class _LookupFailure(object):
+    def __init__(self, upa, error):
+        self.upa = upa
+        self.error = error
 
 
 class ReportFetcher(object):
-    def __init__(self, ws_client):
+    def __init__(self, ws_client, cache=None):
         self.ws_client = ws_client
+        self.cache = cache if cache is not None else ReportCache()
 
     def find_report_from_object(self, upa):
-        #TODO:
-        # 1. make sure upa's real.
-
-        # first, fetch object references (without data)
-        ref_list = self.ws_client.list_referencing_objects([{"ref": upa}])[0]
-        # scan it for a report.
-        # if we find at least one, return them
-        # if we find 0, test if it's a copy, and search upstream.
-        if len(ref_list):
-            report_upas = list()
-            for ref_info in ref_list:
-                if "KBaseReport.Report" in ref_info[2]:
-                    report_upas.append(ServiceUtils.object_info_to_object(ref_info)['ref'])
-            if len(report_upas):
-                return self.build_output(upa, report_upas)
+        """
+        Finds the report that references the object with the given UPA. If the object has none and
+        it's a copy, the report for the copy's source is found instead, and so on. Errors looking
+        the object up are raised.
+        """
+        result = self._find_reports([upa])[upa]
+        if isinstance(result, _LookupFailure):
+            raise result.error
+        return result
+
+    def find_reports_from_objects(self, upas):
+        """
+        Does what find_report_from_object does for each UPA in a list, in a few Workspace calls:
+        one list_referencing_objects call for all of them, then one get_objects2 call for those
+        without a report (to see if they're copies), and so on back along the copy chains.
+        Returns a list of outputs in the same order as upas. If looking up one UPA fails, its
+        output has an error instead of failing the rest.
+        """
+        results = self._find_reports(upas)
+        outputs = list()
+        for upa in upas:
+            result = results[upa]
+            if isinstance(result, _LookupFailure):
+                result = self.build_output(result.upa, [], error=str(result.error))
+            outputs.append(result)
+        return outputs
+
+    def _find_reports(self, upas):
+        """
+        Returns a dict of each UPA to its output, or a _LookupFailure. Copy chains are walked
+        breadth first, so each step takes two calls for all the UPAs still being searched.
+        """
+        results = dict()
+        # each search is (UPA asked for, UPAs along its copy chain so far, the last being searched)
+        searches = list()
+        # (object_upa, report_upas) this user has been found to read, by UPA along the chains
+        found = dict()
+        cached = dict()
+        for upa in dict.fromkeys(upas):
+            entry = self.cache.get(upa)
+            if entry:
+                cached[upa] = entry
             else:
-                return self.find_report_from_copy_source(upa)
-        else:
-            return self.find_report_from_copy_source(upa)
+                searches.append((upa, [upa]))
+        if cached:
+            readable = self._readable(list(cached) + self._cached_upas(cached.values()))
+            for upa, entry in cached.items():
+                if upa not in readable:
+                    err = ValueError("Object {} cannot be accessed".format(upa))
+                    results[upa] = _LookupFailure(upa, err)
+                    continue
+                entry = self._readable_entry(entry, readable)
+                if entry:
+                    found[upa] = entry
+                    results[upa] = self.build_output(*entry)
+                else:
+                    searches.append((upa, [upa]))
+
+        depth = 0
+        while searches:
+            with tracing.span('find reports', objects=len(searches), depth=depth):
+                searches = self._search_step(searches, results, found)
+            depth += 1
+        return results
+
+    def _readable(self, upas):
+        """
+        Returns the set of the UPAs the user can read, from one get_object_info3 call.
+        """
+        upas = list(dict.fromkeys(upas))
+        infos = self.ws_client.get_object_info3({
+            'objects': [{'ref': upa} for upa in upas],
+            'ignoreErrors': 1
+        })['infos']
+        return {upa for upa, info in zip(upas, infos) if info is not None}
+
+    @staticmethod
+    def _cached_upas(entries):
+        return [upa for (object_upa, report_upas) in entries for upa in [object_upa] + report_upas]
+
+    @staticmethod
+    def _readable_entry(entry, readable):
+        """
+        Returns a cache entry with only the reports in readable, or None if the user can't read
+        its object or any of its reports. Their own search might find others.
+        """
+        (object_upa, report_upas) = entry
+        report_upas = [report_upa for report_upa in report_upas if report_upa in readable]
+        if object_upa not in readable or not report_upas:
+            return None
+        return (object_upa, report_upas)
+
+    def _search_step(self, searches, results, found):
+        """
+        Looks for reports referencing the last object in each search's chain. Sets the results of
+        those that are done, and returns the searches continuing on to a copy source. Reports
+        found are added to found, and copy sources in it need no permission check.
+        """
+        currents = list(dict.fromkeys(chain[-1] for _, chain in searches))
+        ref_lists = dict(zip(currents, self._list_referencing_objects(currents)))
+        no_reports = list()
+        for upa, chain in searches:
+            ref_list = ref_lists[chain[-1]]
+            if isinstance(ref_list, Exception):
+                results[upa] = _LookupFailure(chain[-1], ref_list)
+                continue
+            report_upas = ServiceUtils.object_infos_to_objects(
+                [ref_info for ref_info in ref_list if "KBaseReport.Report" in ref_info[2]],
+                columnar=True)['ref']
+            if report_upas:
+                self.cache.put(chain, chain[-1], report_upas)
+                found.update(dict.fromkeys(chain, (chain[-1], report_upas)))
+                results[upa] = self.build_output(chain[-1], report_upas)
+            else:
+                no_reports.append((upa, chain))
+        if not no_reports:
+            return []
+
+        currents = list(dict.fromkeys(chain[-1] for _, chain in no_reports))
+        obj_datas = dict(zip(currents, self.ws_client.get_objects2({
+            'objects': [{'ref': current} for current in currents],
+            'no_data': 1,
+            'ignoreErrors': 1
+        })['data']))
+        searches = list()
+        hits = list()  # (upa, chain, copy source, cache entry for the source)
+        for upa, chain in no_reports:
+            current = chain[-1]
+            obj_data = obj_datas[current]
+            if obj_data is None:
+                err = ValueError("Object {} cannot be accessed".format(current))
+                results[upa] = _LookupFailure(current, err)
+            elif obj_data.get('copy_source_inaccessible', 0) == 1:
+                results[upa] = self.build_output(current, [], inaccessible=1,
+                                                 error=COPY_INACCESSIBLE_ERROR)
+            elif 'copied' not in obj_data:
+                results[upa] = self.build_output(current, [])
+            else:
+                source = obj_data['copied']
+                if source in found:
+                    self.cache.put(chain, *found[source])
+                    found.update(dict.fromkeys(chain, found[source]))
+                    results[upa] = self.build_output(*found[source])
+                    continue
+                entry = self.cache.get(source)
+                if entry:
+                    hits.append((upa, chain, source, entry))
+                elif source in chain:
+                    err = "No report found. Object {} is in a copy cycle.".format(source)
+                    results[upa] = self.build_output(current, [], error=err)
+                elif len(chain) > MAX_COPY_DEPTH:
+                    err = "No report found. Object {} was copied more than {} times.".format(
+                        upa, MAX_COPY_DEPTH)
+                    results[upa] = self.build_output(current, [], error=err)
+                else:
+                    searches.append((upa, chain + [source]))
+        if hits:
+            readable = self._readable(self._cached_upas(entry for _, _, _, entry in hits))
+            for upa, chain, source, entry in hits:
+                readable_entry = self._readable_entry(entry, readable)
+                if readable_entry:
+                    self.cache.put(chain, *entry)
+                    found.update(dict.fromkeys(chain, readable_entry))
+                    results[upa] = self.build_output(*readable_entry)
+                else:
+                    searches.append((upa, chain + [source]))
+        return searches
 
-    def find_report_from_copy_source(self, upa):
+    def _list_referencing_objects(self, upas):
         """
-        Fetch the info about this object. If it's a copy, run find_report_from_object on its source.
-        If it's not, return an error state, or just an empty list for the upas.
+        Returns the list_referencing_objects result for each of upas. That fails for all of them if
+        any one can't be read, so if it does, each is looked up alone, and those that fail get the
+        exception in place of their list.
         """
-        obj_data = self.ws_client.get_objects2({'objects': [{'ref': upa}], 'no_data': 1})['data'][0]
-        if obj_data.get('copy_source_inaccessible', 0) == 1:
-            err = "No report found. This object is a copy, and its source is inaccessible."
-            return self.build_output(upa, [], inaccessible=1, error=err)
-        elif 'copied' in obj_data:
-            return self.find_report_from_object(obj_data['copied'])
-        return self.build_output(upa, [])
+        try:
+            return self.ws_client.list_referencing_objects([{"ref": upa} for upa in upas])
+        except Exception as e:
+            if len(upas) == 1:
+                return [e]
+        ref_lists = list()
+        for upa in upas:
+            try:
+                ref_lists.append(self.ws_client.list_referencing_objects([{"ref": upa}])[0])
+            except Exception as e:
+                ref_lists.append(e)
+        return ref_lists
 
     def build_output(self, upa, report_upas=[], inaccessible=0, error=None):
         retVal = {
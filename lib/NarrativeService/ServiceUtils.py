@@ -1,27 +1,126 @@
-import dateutil.parser
 import datetime
+import functools
 import re
 
+from NarrativeService.util.lazy import lazy_import
+
+dateutil_parser = lazy_import("dateutil.parser")
+
+EPOCH = datetime.datetime(1970, 1, 1)
+# the Workspace's timestamp format, e.g. 2019-05-01T12:34:56+0000, with some leeway for
+# fractional seconds, Z, and +00:00 offsets
+_ISO8601 = re.compile(r"^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d{1,6})\d*)?"
+                      r"(?:(Z)|([+-])(\d\d):?(\d\d))$")
+# many objects are saved at the same time, and workspace timestamps repeat across calls
+ISO8601_CACHE_SIZE = 10000
+
+
+@functools.lru_cache(maxsize=ISO8601_CACHE_SIZE)
+def _iso8601_to_millis(date):
+    match = _ISO8601.match(date)
+    if match is None:
+        # anything else dateutil can make sense of
+        dt = dateutil_parser.parse(date)
+        utc_naive = dt.replace(tzinfo=None) - dt.utcoffset()
+    else:
+        (year, month, day, hour, minute, second, fraction, zulu, sign, offset_hours,
+         offset_minutes) = match.groups()
+        utc_naive = datetime.datetime(int(year), int(month), int(day), int(hour), int(minute),
+                                      int(second), int(fraction.ljust(6, "0")) if fraction else 0)
+        if not zulu:
+            offset = datetime.timedelta(hours=int(offset_hours), minutes=int(offset_minutes))
+            utc_naive = utc_naive - offset if sign == "+" else utc_naive + offset
+    return int((utc_naive - EPOCH).total_seconds() * 1000.0)
+
+
+WORKSPACE_FIELDS = ['id', 'name', 'owner', 'moddate', 'object_count', 'user_permission',
+                    'globalread', 'lockstat', 'metadata', 'modDateMs']
+OBJECT_FIELDS = ['id', 'name', 'type', 'save_date', 'version', 'saved_by', 'wsid', 'ws', 'checksum',
+                 'size', 'metadata', 'ref', 'obj_id', 'typeModule', 'typeName', 'typeMajorVersion',
+                 'typeMinorVersion', 'saveDateMs']
+_TYPE_SEPARATORS = re.compile(r"-|\.")
+
+
+@functools.lru_cache(maxsize=1000)
+def _type_parts(obj_type):
+    """
+    KBaseGenomes.Genome-14.2 -> (KBaseGenomes, Genome, 14, 2)
+    """
+    return tuple(_TYPE_SEPARATORS.split(obj_type))
+
 
 class ServiceUtils:
 
     @staticmethod
     def workspace_info_to_object(wsInfo):
-        return {'id': wsInfo[0],
-                'name': wsInfo[1],
-                'owner': wsInfo[2],
-                'moddate': wsInfo[3],
-                'object_count': wsInfo[4],
-                'user_permission': wsInfo[5],
-                'globalread': wsInfo[6],
-                'lockstat': wsInfo[7],
-                'metadata': wsInfo[8],
-                'modDateMs': ServiceUtils.iso8601_to_millis_since_epoch(wsInfo[3])}
+        return ServiceUtils.workspace_infos_to_objects([wsInfo])[0]
 
     @staticmethod
     def object_info_to_object(data):
-        dtype = re.split("-|\.", data[2])
-        return {'id': data[0],
+        return ServiceUtils.object_infos_to_objects([data])[0]
+
+    @staticmethod
+    def workspace_infos_to_objects(ws_infos, columnar=False):
+        """
+        Does workspace_info_to_object for a list of workspace info tuples, parsing each distinct
+        timestamp once. None infos (as from ignoreErrors) become None.
+
+        If columnar is True, returns a dict of field name -> list of that field's values, one for
+        each info (all None for None infos), instead of a list of dicts.
+        """
+        mod_dates = ServiceUtils._iso8601_to_millis_many(
+            [info[3] for info in ws_infos if info is not None])
+        if columnar:
+            columns = {field: [None if info is None else info[i] for info in ws_infos]
+                       for i, field in enumerate(WORKSPACE_FIELDS[:-1])}
+            columns['modDateMs'] = [mod_dates.get(moddate) for moddate in columns['moddate']]
+            return columns
+        return [None if wsInfo is None else {
+            'id': wsInfo[0],
+            'name': wsInfo[1],
+            'owner': wsInfo[2],
+            'moddate': wsInfo[3],
+            'object_count': wsInfo[4],
+            'user_permission': wsInfo[5],
+            'globalread': wsInfo[6],
+            'lockstat': wsInfo[7],
+            'metadata': wsInfo[8],
+            'modDateMs': mod_dates[wsInfo[3]]
+        } for wsInfo in ws_infos]
+
+    @staticmethod
+    def object_infos_to_objects(infos, columnar=False):
+        """
+        Does object_info_to_object for a list of object info tuples, splitting each distinct type
+        and parsing each distinct timestamp once. None infos (as from ignoreErrors) become None.
+
+        If columnar is True, returns a dict of field name -> list of that field's values, one for
+        each info (all None for None infos), instead of a list of dicts.
+        """
+        present = [info for info in infos if info is not None]
+        types = {obj_type: _type_parts(obj_type) for obj_type in {info[2] for info in present}}
+        save_dates = ServiceUtils._iso8601_to_millis_many([info[3] for info in present])
+        if columnar:
+            columns = {field: [None if info is None else info[i] for info in infos]
+                       for i, field in enumerate(OBJECT_FIELDS[:11])}
+            columns['ref'] = [None if info is None else "{}/{}/{}".format(info[6], info[0], info[4])
+                              for info in infos]
+            columns['obj_id'] = [None if info is None else "ws.{}.obj.{}".format(info[6], info[0])
+                                 for info in infos]
+            parts = [types.get(obj_type) for obj_type in columns['type']]
+            for i, field in enumerate(OBJECT_FIELDS[13:17]):
+                columns[field] = [None if dtype is None else dtype[i] for dtype in parts]
+            columns['saveDateMs'] = [save_dates.get(save_date)
+                                     for save_date in columns['save_date']]
+            return columns
+        objects = list()
+        for data in infos:
+            if data is None:
+                objects.append(None)
+                continue
+            dtype = types[data[2]]
+            objects.append({
+                'id': data[0],
                 'name': data[1],
                 'type': data[2],
                 'save_date': data[3],
@@ -32,17 +131,27 @@ class ServiceUtils:
                 'checksum': data[8],
                 'size': data[9],
                 'metadata': data[10],
-                'ref': str(data[6]) + '/' + str(data[0]) + '/' + str(data[4]),
-                'obj_id': 'ws.' + str(data[6]) + '.obj.' + str(data[0]),
+                'ref': "{}/{}/{}".format(data[6], data[0], data[4]),
+                'obj_id': "ws.{}.obj.{}".format(data[6], data[0]),
                 'typeModule': dtype[0],
                 'typeName': dtype[1],
                 'typeMajorVersion': dtype[2],
                 'typeMinorVersion': dtype[3],
-                'saveDateMs': ServiceUtils.iso8601_to_millis_since_epoch(data[3])}
+                'saveDateMs': save_dates[data[3]]
+            })
+        return objects
+
+    @staticmethod
+    def _iso8601_to_millis_many(dates):
+        """
+        Returns a dict of each distinct date in dates -> iso8601_to_millis_since_epoch(date).
+        """
+        return {date: _iso8601_to_millis(date) for date in set(dates)}
 
     @staticmethod
     def iso8601_to_millis_since_epoch(date):
-        epoch = datetime.datetime.utcfromtimestamp(0)
-        dt = dateutil.parser.parse(date)
-        utc_naive = dt.replace(tzinfo=None) - dt.utcoffset()
-        return int((utc_naive - epoch).total_seconds() * 1000.0)
+        """
+        Timestamps in the Workspace's format are parsed directly, others with dateutil. Results
+        are memoized.
+        """
+        return _iso8601_to_millis(date)
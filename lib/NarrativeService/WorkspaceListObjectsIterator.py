@@ -1,5 +1,7 @@
 from collections import deque
 
+from NarrativeService.util import tracing
+
 
 class WorkspaceListObjectsIterator:
 
@@ -70,5 +72,9 @@ class WorkspaceListObjectsIterator:
         self.list_objects_params['minObjectID'] = self.min_obj_id
         self.list_objects_params['maxObjectID'] = max_obj_id
         self.min_obj_id += self.part_size  # For next load cycle
-        ret = self.ws.list_objects(self.list_objects_params)
+        with tracing.span('list_objects page', workspaces=len(self.list_objects_params['ids']),
+                          min_id=self.list_objects_params['minObjectID']) as span:
+            ret = self.ws.list_objects(self.list_objects_params)
+            if span:
+                span.attrs['objects'] = len(ret)
         return ret.__iter__()
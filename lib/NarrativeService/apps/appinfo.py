@@ -1,7 +1,25 @@
-from installed_clients.NarrativeMethodStoreClient import NarrativeMethodStore
-from installed_clients.CatalogClient import Catalog
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pylru
+
+from NarrativeService.util import metrics, tracing
+from NarrativeService.util.lazy import lazy_import
+
+NarrativeMethodStore = lazy_import("installed_clients.NarrativeMethodStoreClient",
+                                   "NarrativeMethodStore")
+Catalog = lazy_import("installed_clients.CatalogClient", "Catalog")
+
+logger = logging.getLogger(__name__)
 
 IGNORE_CATEGORIES = {"inactive", "importers", "viewers"}
+# number of earlier app info versions for each tag that deltas can be made from
+APP_INFO_VERSION_HISTORY = 20
 
 
 def get_ignore_categories():
@@ -22,33 +40,244 @@ def _shorten_types(type_list):
     return shorten_types
 
 
-def get_all_app_info(tag, user, nms_url, catalog_url):
+def _check_tag(tag):
     if tag not in ["release", "beta", "dev"]:
         raise ValueError("tag must be one of 'release', 'beta', or 'dev'")
-    nms = NarrativeMethodStore(nms_url)
-    catalog = Catalog(catalog_url)
-    apps = nms.list_methods({"tag": tag})
+
+
+def _favorite_times(favorites):
+    """
+    Returns a dict of app id (as in app_infos) -> when it was made a favorite, from a Catalog
+    list_favorites result.
+    """
+    return {f"{fav['module_name_lc']}/{fav['id']}".lower(): fav["timestamp"] for fav in favorites}
+
+
+def _build_tag_app_info(apps, favorites=()):
+    """
+    Turns an NMS list_methods result into (app_infos, module_versions) for get_all_app_info, in one
+    pass over the apps. Without favorites, that's the part that's the same for every user. The
+    apps aren't changed.
+    """
+    favorite_times = _favorite_times(favorites)
     app_infos = {}
     module_versions = {}
     for a in apps:
         # ignore empty apps or apps in IGNORE_CATEGORIES
-        if not a or not set(a.get('categories')).isdisjoint(IGNORE_CATEGORIES):
+        if not a or not IGNORE_CATEGORIES.isdisjoint(a.get('categories')):
             continue
         # add short version of input/output types
-        for target_type in ['input_types', 'output_types']:
-            a['short_{}'.format(target_type)] = _shorten_types(a.get(target_type))
-        app_infos[a["id"].lower()] = {"info": a}
+        info = dict(a, short_input_types=_shorten_types(a.get('input_types')),
+                    short_output_types=_shorten_types(a.get('output_types')))
+        app_id = a["id"].lower()
+        app_infos[app_id] = {"info": info}
+        if app_id in favorite_times:
+            app_infos[app_id]["favorite"] = favorite_times[app_id]
         if "module_name" in a:
             module_versions[a["module_name"].lower()] = a.get("ver")
+    return app_infos, module_versions
+
+
+def _copy_app_info(app_info):
+    """
+    Copies an app info and its info dict, so callers can change either without changing the
+    cached one. The lists inside info are still shared.
+    """
+    return dict(app_info, info=dict(app_info["info"]))
 
-    favorites = catalog.list_favorites(user)
 
-    for fav in favorites:
-        app_id = f"{fav['module_name_lc']}/{fav['id']}".lower()
+def _with_favorites(app_infos, module_versions, favorites):
+    """
+    Adds a user's Catalog favorites to copies of the app infos. app_infos and module_versions
+    aren't changed.
+    """
+    app_infos = {app_id: _copy_app_info(app_info) for app_id, app_info in app_infos.items()}
+    for app_id, timestamp in _favorite_times(favorites).items():
         if app_id in app_infos:
-            app_infos[app_id]["favorite"] = fav["timestamp"]
+            app_infos[app_id]["favorite"] = timestamp
+    return {
+        "module_versions": dict(module_versions),
+        "app_infos": app_infos
+    }
+
+
+def _app_digests(app_infos):
+    """
+    Returns a dict of app id -> hash of its app info, and a version for the whole set - a hash
+    of those. They only depend on the content, so every server process comes up with the same
+    version for the same app info.
+    """
+    digests = {app_id: hashlib.sha1(json.dumps(app_info, sort_keys=True).encode()).hexdigest()
+               for app_id, app_info in app_infos.items()}
+    version = hashlib.sha1("\n".join(
+        "{} {}".format(app_id, digests[app_id]) for app_id in sorted(digests)).encode())
+    return digests, version.hexdigest()
 
+
+def get_all_app_info(tag, user, nms_url, catalog_url):
+    _check_tag(tag)
+    nms = NarrativeMethodStore(nms_url)
+    catalog = Catalog(catalog_url)
+    # the calls don't depend on each other, so the favorites are fetched while NMS is
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        favorites = executor.submit(tracing.propagate(catalog.list_favorites), user)
+        apps = nms.list_methods({"tag": tag})
+        app_infos, module_versions = _build_tag_app_info(apps, favorites.result())
     return {
         "module_versions": module_versions,
         "app_infos": app_infos
     }
+
+
+class _TagAppInfo(object):
+    def __init__(self, app_infos, module_versions):
+        self.fetch_time = time.time()
+        self.app_infos = app_infos
+        self.module_versions = module_versions
+        self.digests, self.version = _app_digests(app_infos)
+
+
+class AppInfoCache(object):
+    """
+    Keeps the app info for each tag, which is the same for all users, so get_all_app_info only
+    needs each user's Catalog favorites - and those are kept for a short time too.
+
+    A tag's app info is fetched from NMS the first time it's asked for. After that, it's served
+    from memory, and once it's older than refresh_interval, the next request starts a refresh in
+    a background thread while it (and any others until that's done) gets the current one.
+
+    Each tag's app info has a version. A client that sends back the version it has gets only what
+    changed since then - or nothing, if it's current - plus its favorites. The per-app hashes of
+    the last APP_INFO_VERSION_HISTORY versions are kept to make those deltas from.
+    """
+    def __init__(self, nms_url, catalog_url, refresh_interval=300, favorites_ttl=60,
+                 favorites_cache_size=1000):
+        """
+        refresh_interval - seconds before a tag's app info is refreshed
+        favorites_ttl - seconds to keep a user's favorites, 0 to always fetch them
+        favorites_cache_size - the number of users to keep favorites for
+        """
+        self.nms_url = nms_url
+        self.catalog_url = catalog_url
+        self.refresh_interval = float(refresh_interval)
+        self.favorites_ttl = float(favorites_ttl)
+        self._tags = dict()  # tag -> _TagAppInfo
+        self._history = dict()  # tag -> OrderedDict of version -> app digests
+        self._refreshing = set()  # tags with a refresh running
+        self._favorites = pylru.lrucache(int(favorites_cache_size))  # user -> (expiry, favorites)
+        self._lock = threading.Lock()
+        self._tag_locks = {tag: threading.Lock() for tag in ["release", "beta", "dev"]}
+
+    def get_all_app_info(self, tag, user, version=None):
+        """
+        Returns the same thing as get_all_app_info(tag, user, nms_url, catalog_url), plus the
+        version of the tag's app info.
+
+        If version is the current one, only {version, unchanged: 1, favorites} is returned, where
+        favorites maps the ids of the user's favorite apps to when they were made favorites. If
+        it's an earlier one that's still known, {version, base_version, changed_apps,
+        removed_apps, module_versions, favorites} is returned, where changed_apps has the app
+        infos that are new or different since base_version (without favorites), and removed_apps
+        has the ids of the apps that are gone.
+        """
+        _check_tag(tag)
+        if tag in self._tags:
+            tag_info = self._get_tag_app_info(tag)
+            favorites = self._get_favorites(user)
+        else:
+            # fetch the favorites while the app info is fetched
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                favorites = executor.submit(tracing.propagate(self._get_favorites), user)
+                tag_info = self._get_tag_app_info(tag)
+                favorites = favorites.result()
+
+        base_digests = None
+        if version is not None and version != tag_info.version:
+            with self._lock:
+                base_digests = self._history.get(tag, {}).get(version)
+        if version is None or (version != tag_info.version and base_digests is None):
+            output = _with_favorites(tag_info.app_infos, tag_info.module_versions, favorites)
+            output["version"] = tag_info.version
+            return output
+
+        favorite_times = {app_id: timestamp
+                          for app_id, timestamp in _favorite_times(favorites).items()
+                          if app_id in tag_info.app_infos}
+        if version == tag_info.version:
+            return {"version": version, "unchanged": 1, "favorites": favorite_times}
+        return {
+            "version": tag_info.version,
+            "base_version": version,
+            "changed_apps": {app_id: _copy_app_info(tag_info.app_infos[app_id])
+                             for app_id, digest in tag_info.digests.items()
+                             if base_digests.get(app_id) != digest},
+            "removed_apps": [app_id for app_id in base_digests
+                             if app_id not in tag_info.digests],
+            "module_versions": dict(tag_info.module_versions),
+            "favorites": favorite_times
+        }
+
+    def clear(self):
+        with self._lock:
+            self._tags.clear()
+            self._history.clear()
+            self._favorites.clear()
+
+    def _get_tag_app_info(self, tag):
+        cached = self._tags.get(tag)
+        if cached is None:
+            # only one request fetches it, the others wait for that
+            with self._tag_locks[tag]:
+                cached = self._tags.get(tag)
+                if cached is None:
+                    metrics.registry.count_cache('app info', misses=1)
+                    return self._fetch_tag_app_info(tag)
+        metrics.registry.count_cache('app info', hits=1)
+        if time.time() - cached.fetch_time > self.refresh_interval:
+            self._start_refresh(tag)
+        return cached
+
+    def _fetch_tag_app_info(self, tag):
+        apps = NarrativeMethodStore(self.nms_url).list_methods({"tag": tag})
+        cached = _TagAppInfo(*_build_tag_app_info(apps))
+        with self._lock:
+            history = self._history.setdefault(tag, OrderedDict())
+            history[cached.version] = cached.digests
+            history.move_to_end(cached.version)
+            while len(history) > APP_INFO_VERSION_HISTORY:
+                history.popitem(last=False)
+        self._tags[tag] = cached
+        return cached
+
+    def _start_refresh(self, tag):
+        with self._lock:
+            if tag in self._refreshing:
+                return
+            self._refreshing.add(tag)
+        refresh_thread = threading.Thread(target=self._refresh, args=(tag,))
+        refresh_thread.daemon = True
+        refresh_thread.start()
+
+    def _refresh(self, tag):
+        try:
+            self._fetch_tag_app_info(tag)
+        except Exception:
+            # keep the current app info, the next request past the interval tries again
+            logger.exception("Unable to refresh app info for tag %s", tag)
+        finally:
+            with self._lock:
+                self._refreshing.discard(tag)
+
+    def _get_favorites(self, user):
+        if self.favorites_ttl > 0:
+            with self._lock:
+                cached = self._favorites.get(user)
+            if cached is not None and cached[0] > time.time():
+                metrics.registry.count_cache('app favorites', hits=1)
+                return cached[1]
+            metrics.registry.count_cache('app favorites', misses=1)
+        favorites = Catalog(self.catalog_url).list_favorites(user)
+        if self.favorites_ttl > 0:
+            with self._lock:
+                self._favorites[user] = (time.time() + self.favorites_ttl, favorites)
+        return favorites
@@ -10,6 +10,8 @@ import requests as _requests
 import threading as _threading
 import hashlib
 
+from NarrativeService.util import metrics
+
 
 class TokenCache(object):
     ''' A basic cache for tokens. '''
@@ -72,11 +74,14 @@ class KBaseAuth(object):
         if not token:
             raise ValueError('Must supply token')
         user = self._cache.get_user(token)
+        metrics.registry.count_cache('auth_token', hits=1 if user else 0,
+                                     misses=0 if user else 1)
         if user:
             return user
 
         d = {'token': token, 'fields': 'user_id'}
-        ret = _requests.post(self._authurl, data=d)
+        with metrics.registry.time_upstream('Auth', 'get_user'):
+            ret = _requests.post(self._authurl, data=d)
         if not ret.ok:
             try:
                 err = ret.json()
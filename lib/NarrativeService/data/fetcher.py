@@ -1,8 +1,11 @@
-from biokbase.workspace.client import Workspace
 from ..authclient import KBaseAuth
 from ..WorkspaceListObjectsIterator import WorkspaceListObjectsIterator
+from ..util import tracing
+from ..util.lazy import lazy_import
 from collections import defaultdict
 
+Workspace = lazy_import("biokbase.workspace.client", "Workspace")
+
 DEFAULT_DATA_LIMIT = 30000
 
 
@@ -160,26 +163,29 @@ class DataFetcher(object):
         if 'types' in params:
             type_set = set(params['types'])
 
-        (data_objects, limit_reached) = self._fetch_all_objects(
-            ws_info_list, include_metadata=include_metadata, types=type_set, ignore_narratives=ignore_narratives, limit=params["limit"]
-        )
+        with tracing.span("fetch objects", workspaces=len(ws_info_list)):
+            (data_objects, limit_reached) = self._fetch_all_objects(
+                ws_info_list, include_metadata=include_metadata, types=type_set, ignore_narratives=ignore_narratives, limit=params["limit"]
+            )
         # now, post-process the data objects.
         simple_types = params.get("simple_types", 0) == 1
         return_objects = list()
-        for obj in data_objects:
-            obj_type = self._parse_type(obj[2], simple_types)
-            ws_id = obj[6]
-            return_objects.append({
-                "ws_id": ws_id,
-                "obj_id": obj[0],
-                "ver": obj[4],
-                "saved_by": obj[5],
-                "name": obj[1],
-                "type": obj_type,
-                "timestamp": obj[3]
-            })
-            ws_display[ws_id]["count"] += 1  # gets initialized back in _get_non_temporary_workspaces
-        return_objects.sort(key=lambda obj: obj['timestamp'], reverse=True)
+        with tracing.span("process objects", objects=len(data_objects)):
+            for obj in data_objects:
+                obj_type = self._parse_type(obj[2], simple_types)
+                ws_id = obj[6]
+                return_objects.append({
+                    "ws_id": ws_id,
+                    "obj_id": obj[0],
+                    "ver": obj[4],
+                    "saved_by": obj[5],
+                    "name": obj[1],
+                    "type": obj_type,
+                    "timestamp": obj[3]
+                })
+                ws_display[ws_id]["count"] += 1  # gets initialized back in _get_non_temporary_workspaces
+        with tracing.span("sort objects"):
+            return_objects.sort(key=lambda obj: obj['timestamp'], reverse=True)
         return_val = {
             "workspace_display": ws_display,
             "objects": return_objects,
@@ -187,9 +193,10 @@ class DataFetcher(object):
             "limit_reached": 1 if limit_reached else 0
         }
         if params.get("include_type_counts", 0) == 1:
-            type_counts = defaultdict(lambda: 0)
-            for obj in return_objects:
-                type_counts[obj["type"]] += 1
+            with tracing.span("count types"):
+                type_counts = defaultdict(lambda: 0)
+                for obj in return_objects:
+                    type_counts[obj["type"]] += 1
             return_val["type_counts"] = type_counts
         return return_val
 
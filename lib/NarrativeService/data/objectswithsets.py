@@ -1,4 +1,5 @@
 from ..WorkspaceListObjectsIterator import WorkspaceListObjectsIterator
+from ..util import tracing
 
 
 class ObjectsWithSets:
@@ -42,17 +43,18 @@ class ObjectsWithSets:
             }]
         )
         sets = set_ret["sets"]
-        for set_info in sets:
-            # Process
-            target_set_items = []
-            for set_item in set_info["items"]:
-                target_set_items.append(set_item["info"])
-            if self._check_info_type(set_info["info"], type_map):
-                data_item = {
-                    "object_info": set_info["info"],
-                    "set_items": {"set_items_info": target_set_items}}
-                data.append(data_item)
-                processed_refs[set_info["ref"]] = data_item
+        with tracing.span("process sets", sets=len(sets)):
+            for set_info in sets:
+                # Process
+                target_set_items = []
+                for set_item in set_info["items"]:
+                    target_set_items.append(set_item["info"])
+                if self._check_info_type(set_info["info"], type_map):
+                    data_item = {
+                        "object_info": set_info["info"],
+                        "set_items": {"set_items_info": target_set_items}}
+                    data.append(data_item)
+                    processed_refs[set_info["ref"]] = data_item
 
         ws_info_list = []
         # for ws in workspaces:
@@ -71,16 +73,18 @@ class ObjectsWithSets:
                 if ws_info[1] in ws_map or str(ws_info[0]) in ws_map:
                     ws_info_list.append(ws_info)
 
-        for info in WorkspaceListObjectsIterator(self.workspace_client,
-                                                 ws_info_list=ws_info_list,
-                                                 list_objects_params={
-                                                     "includeMetadata": include_metadata
-                                                 }):
-            item_ref = str(info[6]) + '/' + str(info[0]) + '/' + str(info[4])
-            if item_ref not in processed_refs and self._check_info_type(info, type_map):
-                data_item = {"object_info": info}
-                data.append(data_item)
-                processed_refs[item_ref] = data_item
+        # the list_objects pages are spans under this one
+        with tracing.span("process objects", workspaces=len(ws_info_list)):
+            for info in WorkspaceListObjectsIterator(self.workspace_client,
+                                                     ws_info_list=ws_info_list,
+                                                     list_objects_params={
+                                                         "includeMetadata": include_metadata
+                                                     }):
+                item_ref = str(info[6]) + '/' + str(info[0]) + '/' + str(info[4])
+                if item_ref not in processed_refs and self._check_info_type(info, type_map):
+                    data_item = {"object_info": info}
+                    data.append(data_item)
+                    processed_refs[item_ref] = data_item
 
         return_data = {
             "data": data
@@ -91,22 +95,23 @@ class ObjectsWithSets:
                 "list_data",
                 [{'workspaces': workspaces, 'include_metadata': include_metadata}]
             )
-            for item in dp_ret['data']:
-                ref = item['ref']
-                if self._check_info_type(item['info'], type_map):
-                    data_item = None
-                    if ref in processed_refs:
-                        data_item = processed_refs[ref]
-                    else:
-                        data_item = {'object_info': item['info']}
-                        processed_refs[ref] = data_item
-                        data.append(data_item)
-                    dp_info = {}
-                    if 'dp_ref' in item:
-                        dp_info['ref'] = item['dp_ref']
-                    if 'dp_refs' in item:
-                        dp_info['refs'] = item['dp_refs']
-                    data_item['dp_info'] = dp_info
+            with tracing.span("process data palettes", items=len(dp_ret['data'])):
+                for item in dp_ret['data']:
+                    ref = item['ref']
+                    if self._check_info_type(item['info'], type_map):
+                        data_item = None
+                        if ref in processed_refs:
+                            data_item = processed_refs[ref]
+                        else:
+                            data_item = {'object_info': item['info']}
+                            processed_refs[ref] = data_item
+                            data.append(data_item)
+                        dp_info = {}
+                        if 'dp_ref' in item:
+                            dp_info['ref'] = item['dp_ref']
+                        if 'dp_refs' in item:
+                            dp_info['refs'] = item['dp_refs']
+                        data_item['dp_info'] = dp_info
             return_data["data_palette_refs"] = dp_ret['data_palette_refs']
 
         return return_data
@@ -1,13 +1,274 @@
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+
 import requests
 
 
 SERVICE_NAME = "narrativeservice"
 
-def make_notification(note, feeds_url, auth_token):
+logger = logging.getLogger(__name__)
+# the started queues, restarted in each process the server forks
+_started_queues = weakref.WeakSet()
+
+def make_notification(note, feeds_url, auth_token, session=None):
     # calls the feeds service
     note["source"] = SERVICE_NAME
     headers = {"Authorization": auth_token}
-    r = requests.post(feeds_url + "/api/V1/notification", json=note, headers=headers)
+    r = (session or requests).post(feeds_url + "/api/V1/notification", json=note, headers=headers)
     if r.status_code != requests.codes.ok:
         raise RuntimeError("Unable to create notification: {}".format(r.text))
     return r.json()["id"]
+
+
+class _QueuedNote(object):
+    def __init__(self, note, key, attempts=0, spool_path=None):
+        self.note = note
+        self.key = key
+        self.attempts = attempts
+        self.spool_path = spool_path
+
+
+class NotificationQueue(object):
+    """
+    Sends feed notifications from a background thread, so callers don't wait on the Feeds
+    service. The worker sends up to batch_size notifications at a time over one HTTP session,
+    and retries failed ones with exponential backoff, up to max_attempts times (about eight and
+    a half minutes with the defaults).
+
+    Each notification can have a key (e.g. (ws_id, user, share_level) for share requests). One
+    that's put while another with the same key is still waiting to be sent is dropped.
+
+    With a spool_dir, each waiting notification is also written there until it's sent, and ones
+    left by processes that stopped before sending them are picked up when the worker starts -
+    when start is called, and again in each process the server forks after that. Each file is
+    named for the process that wrote it, so server processes sharing the directory don't send
+    each other's notifications. A notification that's given up on keeps its file, so it's tried
+    again after the next restart.
+    """
+    # the longest to wait between attempts, in seconds
+    MAX_RETRY_DELAY = 300
+
+    def __init__(self, feeds_url, auth_token, max_size=1000, spool_dir=None, batch_size=20,
+                 max_attempts=10, retry_delay=1):
+        """
+        max_size - the most notifications to hold, put returns False past that
+        spool_dir - optional directory to keep waiting notifications in
+        retry_delay - seconds before the first retry, doubling each time after that
+        """
+        self.feeds_url = feeds_url
+        self.auth_token = auth_token
+        self.max_size = int(max_size)
+        self.batch_size = int(batch_size)
+        self.max_attempts = int(max_attempts)
+        self.retry_delay = float(retry_delay)
+        self.spool_dir = spool_dir
+        self._ready = deque()  # _QueuedNotes to send now
+        self._retries = list()  # heap of (retry time, sequence number, _QueuedNote)
+        self._retry_count = 0
+        self._keys = set()  # keys of the notifications not sent yet
+        self._unfinished = 0
+        self._cond = threading.Condition()
+        self._worker = None
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Returns a started queue, or None if feed-notification-queue-size is 0, so notifications
+        are sent right away.
+        """
+        max_size = int(config.get("feed-notification-queue-size") or 0)
+        if max_size < 1:
+            return None
+        spool_dir = None
+        if config.get("feed-notification-spool") == "true":
+            spool_dir = os.path.join(config.get("scratch", "/kb/module/work/tmp"),
+                                     "feed_notifications")
+        queue = cls(config.get("feeds-url"), config.get("service-token"), max_size, spool_dir)
+        queue.start()
+        return queue
+
+    def start(self):
+        """
+        Starts the worker if it isn't running in this process already, and queues any
+        notifications left in the spool. Processes forked after this start their own.
+        """
+        _started_queues.add(self)
+        with self._cond:
+            if self._worker is None or not self._worker.is_alive():
+                self._start_worker()
+
+    def put(self, note, key=None):
+        """
+        Queues a notification to be sent. Returns True if it was queued or one with the same key
+        is already waiting, or False if the queue is full.
+        """
+        return self._put(_QueuedNote(note, key))
+
+    def join(self, timeout=None):
+        """
+        Waits until every queued notification has been sent or given up on. Returns False if that
+        took longer than timeout seconds.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._unfinished == 0, timeout)
+
+    def __len__(self):
+        with self._cond:
+            return self._unfinished
+
+    def _put(self, queued):
+        with self._cond:
+            if self._worker is None or not self._worker.is_alive():
+                self._start_worker()
+            if queued.key is not None and queued.key in self._keys:
+                return True
+            if self._unfinished >= self.max_size:
+                return False
+            if self.spool_dir and queued.spool_path is None:
+                queued.spool_path = self._spool(queued)
+            if queued.key is not None:
+                self._keys.add(queued.key)
+            self._unfinished += 1
+            self._ready.append(queued)
+            self._cond.notify_all()
+        return True
+
+    def _after_fork(self):
+        """
+        Threads don't survive a fork, and the notifications waiting in the parent are the
+        parent's to send, so the child starts over with its own worker.
+        """
+        self._ready = deque()
+        self._retries = list()
+        self._keys = set()
+        self._unfinished = 0
+        self._cond = threading.Condition()
+        self._worker = None
+        self.start()
+
+    def _start_worker(self):
+        self._worker = threading.Thread(target=self._run)
+        self._worker.daemon = True
+        self._worker.start()
+        if self.spool_dir:
+            self._recover_spool()
+
+    def _run(self):
+        session = requests.Session()
+        while True:
+            for queued in self._next_batch():
+                self._send(queued, session)
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                now = time.time()
+                while self._retries and self._retries[0][0] <= now:
+                    self._ready.append(heapq.heappop(self._retries)[2])
+                if self._ready:
+                    return [self._ready.popleft()
+                            for _ in range(min(self.batch_size, len(self._ready)))]
+                self._cond.wait(self._retries[0][0] - now if self._retries else None)
+
+    def _send(self, queued, session):
+        try:
+            make_notification(dict(queued.note), self.feeds_url, self.auth_token, session=session)
+        except Exception:
+            queued.attempts += 1
+            if queued.attempts < self.max_attempts:
+                delay = min(self.retry_delay * 2 ** (queued.attempts - 1), self.MAX_RETRY_DELAY)
+                with self._cond:
+                    self._retry_count += 1
+                    heapq.heappush(self._retries, (time.time() + delay, self._retry_count, queued))
+                    self._cond.notify_all()
+                return
+            if queued.spool_path:
+                logger.exception("Unable to send feed notification after %s attempts, it's kept "
+                                 "in %s until the next restart", queued.attempts,
+                                 queued.spool_path)
+            else:
+                logger.exception("Unable to send feed notification after %s attempts",
+                                 queued.attempts)
+            self._done(queued, keep_spool=True)
+            return
+        self._done(queued)
+
+    def _done(self, queued, keep_spool=False):
+        if queued.spool_path and not keep_spool:
+            try:
+                os.remove(queued.spool_path)
+            except OSError:
+                pass
+        with self._cond:
+            self._keys.discard(queued.key)
+            self._unfinished -= 1
+            self._cond.notify_all()
+
+    def _spool(self, queued):
+        path = os.path.join(self.spool_dir, "{}-{}.json".format(os.getpid(), uuid.uuid4().hex))
+        try:
+            with open(path + ".tmp", "w") as spool_file:
+                json.dump({"note": queued.note, "key": queued.key}, spool_file)
+            os.replace(path + ".tmp", path)
+            return path
+        except OSError:
+            # it's still sent, it just won't survive a restart
+            logger.exception("Unable to spool feed notification")
+            return None
+
+    def _recover_spool(self):
+        """
+        Queues the notifications spooled by processes that aren't running any more, or had this
+        one's process id before it.
+        """
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            names = sorted(os.listdir(self.spool_dir))
+        except OSError:
+            logger.exception("Unable to use feed notification spool %s", self.spool_dir)
+            self.spool_dir = None
+            return
+        for name in names:
+            pid = name.split("-")[0]
+            if not name.endswith(".json") or not pid.isdigit() or not self._stopped(int(pid)):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            claimed = "{}.{}.claimed".format(path, os.getpid())
+            try:
+                # only one process gets to rename it
+                os.rename(path, claimed)
+                with open(claimed) as spool_file:
+                    spooled = json.load(spool_file)
+                os.remove(claimed)
+            except (OSError, ValueError):
+                continue
+            key = tuple(spooled["key"]) if spooled.get("key") is not None else None
+            self._put(_QueuedNote(spooled["note"], key))
+
+    @staticmethod
+    def _stopped(pid):
+        if pid == os.getpid():
+            # this one hasn't spooled anything before its worker starts
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass
+        return False
+
+
+def _restart_after_fork():
+    for queue in list(_started_queues):
+        queue._after_fork()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
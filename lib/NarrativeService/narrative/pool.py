@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from installed_clients.baseclient import ServerError
+
+from NarrativeService.ServiceUtils import ServiceUtils
+
+logger = logging.getLogger(__name__)
+
+# Workspace metadata key that marks a pre-created Narrative that hasn't been handed out yet.
+# Pooled Narratives have no "narrative" or "searchtags" metadata until they're claimed, so they
+# don't show up in Narrative listings or search.
+POOL_META_KEY = "narrative_pool"
+POOL_META_UNCLAIMED = "unclaimed"
+# seconds a pooled Narrative can be handed out for after it's made
+POOL_MAX_AGE = 3600
+
+
+class NarrativePool(object):
+    """
+    Keeps a small number of pre-created blank Narratives (with the intro cell) for each user that
+    has made one, so a request for a blank Narrative only needs to claim one instead of creating
+    it from scratch. The pool is refilled in a background thread after each claim.
+
+    The pool lives in process memory, so each server process keeps its own. Narratives are only
+    handed out for max_age seconds after they're made, so the creation time in their names stays
+    close to when they're claimed. Ones left over when a process stops stay in their owner's
+    workspaces, marked with POOL_META_KEY. Refills delete the user's pooled Narratives that are
+    more than twice max_age old, at most once every max_age seconds, as no process hands those out.
+    """
+
+    def __init__(self, size, make_manager=None, include_intro_cell=1, max_age=POOL_MAX_AGE):
+        """
+        size - number of Narratives to keep ready for each user. 0 turns the pool off.
+        make_manager - called with a user id and token, returns the NarrativeManager a refill
+            uses. That should only have a Workspace client, as it's kept while the refill runs.
+        include_intro_cell - the includeIntroCell value that pooled Narratives are made with.
+        max_age - seconds a pooled Narrative can be handed out for.
+        """
+        self.size = int(size)
+        self.make_manager = make_manager
+        self.include_intro_cell = include_intro_cell
+        self.max_age = float(max_age)
+        self._pools = defaultdict(deque)  # user id -> deque of (creation time, narrative info)
+        self._refilling = set()  # user ids with a refill running
+        self._cleaned = dict()  # user id -> last time the user's old pooled Narratives were deleted
+        self._lock = threading.Lock()
+
+    def claim(self, narrative_manager, include_intro_cell, token):
+        """
+        Claims a pre-created Narrative for the NarrativeManager's user, and starts refilling that
+        user's pool with the token. Returns the same structure as
+        NarrativeManager.create_new_narrative, or None if the pool is off, doesn't match the
+        request, or has nothing new enough.
+        """
+        if self.size < 1 or include_intro_cell != self.include_intro_cell:
+            return None
+        user_id = narrative_manager.user_id
+        claimed = None
+        while claimed is None:
+            with self._lock:
+                pool = self._pools.get(user_id)
+                if not pool:
+                    break
+                (created, narr_info) = pool.popleft()
+            if time.time() - created > self.max_age:
+                # left for a refill to delete
+                continue
+            try:
+                claimed = narrative_manager.claim_pooled_narrative(narr_info)
+            except ServerError:
+                # the workspace went away or can't be changed any more, so try the next one.
+                pass
+        self.refill(user_id, token)
+        return claimed
+
+    def refill(self, user_id, token):
+        """
+        Starts a background thread that tops up the user's pool, unless one is already running.
+        """
+        if self.size < 1:
+            return
+        with self._lock:
+            if user_id in self._refilling or (len(self._pools[user_id]) >= self.size and
+                                              not self._cleanup_due(user_id)):
+                return
+            self._refilling.add(user_id)
+        refill_thread = threading.Thread(target=self._refill, args=(user_id, token))
+        refill_thread.daemon = True
+        refill_thread.start()
+
+    def pool_size(self, user_id):
+        with self._lock:
+            return len(self._pools.get(user_id, []))
+
+    def _cleanup_due(self, user_id):
+        return time.time() - self._cleaned.get(user_id, 0) >= self.max_age
+
+    def _refill(self, user_id, token):
+        try:
+            narrative_manager = self.make_manager(user_id, token)
+            with self._lock:
+                cleanup_due = self._cleanup_due(user_id)
+            if cleanup_due:
+                self._delete_old(narrative_manager)
+            while True:
+                # checked and marked done under the same lock, so a claim that comes in
+                # right after this never finds a refill that's about to stop.
+                with self._lock:
+                    pool = self._pools[user_id]
+                    while pool and time.time() - pool[0][0] > self.max_age:
+                        pool.popleft()
+                    if len(pool) >= self.size:
+                        self._refilling.discard(user_id)
+                        return
+                created = time.time()
+                narr_info = narrative_manager.create_pooled_narrative(self.include_intro_cell)
+                with self._lock:
+                    self._pools[user_id].append((created, narr_info))
+        except Exception:
+            logger.exception("Unable to refill Narrative pool for user {}".format(user_id))
+            with self._lock:
+                self._refilling.discard(user_id)
+
+    def _delete_old(self, narrative_manager):
+        """
+        Deletes the user's pooled Narratives that are more than twice max_age old.
+        """
+        user_id = narrative_manager.user_id
+        with self._lock:
+            self._cleaned[user_id] = time.time()
+        oldest = (time.time() - 2 * self.max_age) * 1000
+        for ws_info in ServiceUtils.workspace_infos_to_objects(
+                narrative_manager.list_pooled_narratives()):
+            if ws_info['modDateMs'] < oldest:
+                try:
+                    narrative_manager.delete_pooled_narrative(ws_info['id'])
+                except ServerError as e:
+                    logger.warning("Unable to delete pooled Narrative workspace {}: {}".format(
+                        ws_info['id'], e))
@@ -0,0 +1,69 @@
+# Object paths that make up a Narrative summary. Cell outputs make up nearly all of a Narrative's
+# size, so fetching just these fields as a Workspace object subset means the rest of the document
+# is never sent or decoded. Paths that don't exist in a given Narrative are skipped by the
+# Workspace (strict_maps defaults to false).
+SUMMARY_PATHS = [
+    "/cells/[*]/cell_type",
+    "/cells/[*]/metadata/kbase/type",
+    "/cells/[*]/metadata/kbase/appCell/exec/jobState/job_id",
+    "/worksheets/[*]/cells/[*]/cell_type",
+    "/metadata/job_ids"
+]
+
+
+def get_narrative_summary(ws_client, ref):
+    """
+    Fetches summary stats for a Narrative object without fetching its full document.
+
+    Args:
+        ws_client (Workspace): a Workspace client
+        ref (str): a reference to the Narrative object
+    Returns a dict with keys:
+        info (list): the Narrative's object info tuple, with metadata
+        cell_count (int): the number of cells
+        cell_types (dict): each key is a cell type, values are the number of cells of that
+            type. Cells that are managed by KBase (apps, data, outputs) are typed by their kbase
+            type, the rest by their Jupyter cell_type (markdown, code)
+        job_ids (list<str>): job ids found in app cells and the legacy job_ids metadata
+    """
+    obj = ws_client.get_objects2({
+        "objects": [{"ref": ref, "included": SUMMARY_PATHS}]
+    })["data"][0]
+    summary = summarize_narrative_data(obj["data"])
+    summary["info"] = obj["info"]
+    return summary
+
+
+def summarize_narrative_data(nar_data):
+    """
+    Builds the summary from Narrative data, either a full document or the subset fetched
+    by get_narrative_summary.
+    """
+    if "worksheets" in nar_data:  # handle legacy.
+        cells = nar_data["worksheets"][0].get("cells", []) if nar_data["worksheets"] else []
+    else:
+        cells = nar_data.get("cells", [])
+
+    cell_types = dict()
+    job_ids = list()
+    for cell in cells:
+        kb_meta = cell.get("metadata", {}).get("kbase", {})
+        cell_type = kb_meta.get("type") or cell.get("cell_type", "unknown")
+        cell_types[cell_type] = cell_types.get(cell_type, 0) + 1
+        job_id = kb_meta.get("appCell", {}).get("exec", {}).get("jobState", {}).get("job_id")
+        if job_id:
+            job_ids.append(job_id)
+
+    legacy_jobs = nar_data.get("metadata", {}).get("job_ids", {})
+    if isinstance(legacy_jobs, dict):
+        for job_type in ["apps", "methods"]:
+            for job in legacy_jobs.get(job_type, []):
+                job_id = job.get("id") if isinstance(job, dict) else job
+                if job_id and job_id not in job_ids:
+                    job_ids.append(job_id)
+
+    return {
+        "cell_count": len(cells),
+        "cell_types": cell_types,
+        "job_ids": job_ids
+    }
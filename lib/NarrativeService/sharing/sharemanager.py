@@ -10,12 +10,17 @@ WS_TOKEN_KEY = "ws-admin-token"
 
 
 class ShareRequester(object):
-    def __init__(self, params, config):
+    def __init__(self, params, config, notification_queue=None):
+        """
+        notification_queue - optional feeds.NotificationQueue to send the request's notification
+        through, instead of sending it before request_share returns
+        """
         self.validate_request_params(params)
         self.ws_id = params['ws_id']
         self.user = params['user']
         self.share_level = params['share_level']
         self.config = config
+        self.notification_queue = notification_queue
 
     def request_share(self):
         """
@@ -44,7 +49,9 @@ class ShareRequester(object):
 
         # Make the request by firing a notification
         try:
-            requestees = ws.get_ws_admins(self.ws_id, self.config['workspace-url'], ws_token)
+            requestees = ws.get_ws_admins(self.ws_id, self.config['workspace-url'], ws_token,
+                                          ttl=float(self.config.get('ws-admins-ttl',
+                                                                    ws.WS_ADMINS_TTL)))
         except ServerError:
             return {
                 "ok": 0,
@@ -67,7 +74,10 @@ class ShareRequester(object):
             "users": [{"id": u, "type": "user"} for u in requestees + [self.user]]
         }
 
-        feeds.make_notification(note, self.config['feeds-url'], service_token)
+        # a request just like one still waiting to be sent is dropped
+        key = (self.ws_id, self.user, self.share_level)
+        if self.notification_queue is None or not self.notification_queue.put(note, key):
+            feeds.make_notification(note, self.config['feeds-url'], service_token)
 
         # Store that we made the request, uh, somewhere
         # save_share_request(self.ws_id, self.user, self.level, note_id)
@@ -0,0 +1,129 @@
+"""
+Serves the WSGI Application over ASGI, for running under an asyncio server like uvicorn.
+
+This only swaps the HTTP server. The calls to other services (the Workspace and the rest) are
+still blocking: ASGIAdapter runs each request's WSGI call in a thread pool, and the event loop only
+holds the connections. So the concurrency is the pool size, as it is with threaded uwsgi workers,
+and each request in flight still takes a thread. What it saves is the uwsgi worker processes: one
+process can have up to asgi-max-threads requests in flight. The Impl methods and the clients they
+use are unchanged.
+"""
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_MAX_THREADS = 200
+
+
+class ASGIAdapter(object):
+    def __init__(self, wsgi_app, max_threads=DEFAULT_MAX_THREADS):
+        """
+        wsgi_app - the WSGI application to run
+        max_threads - maximum number of requests to run at once, more wait for a free thread
+        """
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=int(max_threads),
+                                           thread_name_prefix="asgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await self._handle_http(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self._handle_lifespan(receive, send)
+        else:
+            raise ValueError("Unsupported ASGI scope type '{}'".format(scope["type"]))
+
+    async def _handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _handle_http(self, scope, receive, send):
+        body = list()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        environ = build_environ(scope, b"".join(body))
+
+        loop = asyncio.get_running_loop()
+        response = dict()
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                                   for name, value in headers]
+
+        def first_chunks():
+            # the WSGI call, plus the first chunk of a streamed response, since an iterable
+            # response is often still encoding
+            chunks = self.wsgi_app(environ, start_response)
+            if isinstance(chunks, list):
+                return chunks, None
+            chunks = iter(chunks)
+            return [next(chunks, b"")], chunks
+
+        chunks, rest = await loop.run_in_executor(self.executor, first_chunks)
+        await send({"type": "http.response.start", "status": response["status"],
+                    "headers": response["headers"]})
+        for chunk in chunks[:-1]:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        last = chunks[-1] if chunks else b""
+        if rest is not None:
+            # encode the rest of the response in the thread pool, a chunk at a time
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, rest, None)
+                if chunk is None:
+                    break
+                await send({"type": "http.response.body", "body": last, "more_body": True})
+                last = chunk
+        await send({"type": "http.response.body", "body": last, "more_body": False})
+
+
+def build_environ(scope, body):
+    """
+    Returns a WSGI environ for an ASGI http scope and the request body.
+    """
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_LENGTH":
+            continue
+        if name != "CONTENT_TYPE":
+            name = "HTTP_" + name
+        if name in environ:
+            # repeated headers are joined, as WSGI servers do
+            value = environ[name] + "," + value
+        environ[name] = value
+    return environ
+
@@ -0,0 +1,48 @@
+"""
+Lazy imports, so modules that a worker may never use (the large generated clients, dateutil) are
+only loaded by the first request that needs them, rather than when the server starts.
+"""
+import importlib
+import threading
+
+_lock = threading.Lock()
+
+
+class LazyImport(object):
+    """
+    Stands in for a module, or a name in one, and imports it the first time it's called or one of
+    its attributes is used. E.g.
+        Workspace = lazy_import("installed_clients.WorkspaceClient", "Workspace")
+        ws = Workspace(url, token=token)  # WorkspaceClient is imported here
+    """
+    def __init__(self, module, name=None):
+        self._module = module
+        self._name = name
+        self._target = None
+
+    def _load(self):
+        if self._target is None:
+            with _lock:
+                if self._target is None:
+                    target = importlib.import_module(self._module)
+                    if self._name is not None:
+                        target = getattr(target, self._name)
+                    self._target = target
+        return self._target
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        return "<lazy import of {}>".format(
+            self._module + ("." + self._name if self._name else ""))
+
+
+def lazy_import(module, name=None):
+    """
+    Returns a LazyImport of a module, or of a name in that module.
+    """
+    return LazyImport(module, name)
@@ -0,0 +1,191 @@
+"""
+In-process metrics for the service: latency histograms and error counts for each RPC method and
+each upstream service method it calls, and hit/miss counts for the caches. They're served in the
+Prometheus text format from the server's /metrics path.
+
+Each server process keeps its own numbers, starting from zero when it starts.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from NarrativeService.util import tracing
+
+# histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = "narrative_service"
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # not cumulative, the +Inf bucket is count
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, seconds, error=False):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        if error:
+            self.errors += 1
+
+
+class MetricsRegistry(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._rpc = dict()  # method -> Histogram
+        self._upstream = dict()  # (service, method) -> Histogram
+        self._cache = dict()  # cache name -> [hits, misses]
+        self._lock = threading.Lock()
+
+    def observe_rpc(self, method, seconds, error=False):
+        """
+        Records a call to one of this service's RPC methods, e.g. NarrativeService.list_narratives.
+        """
+        self._observe(self._rpc, method, seconds, error)
+
+    def observe_upstream(self, service, method, seconds, error=False):
+        """
+        Records a call to another service's method, e.g. service=Workspace, method=list_objects.
+        """
+        self._observe(self._upstream, (service, method), seconds, error)
+
+    @contextmanager
+    def time_upstream(self, service, method):
+        """
+        Times the with block as a call to service.method, and counts it as an error if it raises.
+        It's also recorded as a trace span.
+        """
+        start = time.time()
+        error = True
+        try:
+            with tracing.span(service + "." + method):
+                yield
+            error = False
+        finally:
+            self.observe_upstream(service, method, time.time() - start, error)
+
+    def count_cache(self, cache, hits=0, misses=0):
+        with self._lock:
+            counts = self._cache.setdefault(cache, [0, 0])
+            counts[0] += hits
+            counts[1] += misses
+
+    def reset(self):
+        with self._lock:
+            self._rpc.clear()
+            self._upstream.clear()
+            self._cache.clear()
+
+    def snapshot(self):
+        """
+        Returns the current numbers as a dict:
+        {
+            "rpc": {method: {"count", "errors", "sum", "buckets": {bound: cumulative count}}},
+            "upstream": {"service.method": {same as rpc}},
+            "cache": {cache name: {"hits", "misses", "hit_ratio"}}
+        }
+        """
+        with self._lock:
+            return {
+                "rpc": {method: self._histogram_dict(h) for method, h in self._rpc.items()},
+                "upstream": {service + "." + method: self._histogram_dict(h)
+                             for (service, method), h in self._upstream.items()},
+                "cache": {name: {"hits": hits, "misses": misses,
+                                 "hit_ratio": _ratio(hits, hits + misses)}
+                          for name, (hits, misses) in self._cache.items()}
+            }
+
+    def prometheus_text(self):
+        """
+        Returns the current numbers in the Prometheus text exposition format.
+        """
+        lines = list()
+        with self._lock:
+            rpc = [({"method": method}, h) for method, h in sorted(self._rpc.items())]
+            upstream = [({"service": service, "method": method}, h)
+                        for (service, method), h in sorted(self._upstream.items())]
+            self._histogram_lines(lines, "rpc", "NarrativeService RPC method", rpc)
+            self._histogram_lines(lines, "upstream", "upstream service method", upstream)
+            name = METRIC_PREFIX + "_cache_requests_total"
+            lines.append("# HELP {} Cache lookups, by cache and result.".format(name))
+            lines.append("# TYPE {} counter".format(name))
+            for cache, (hits, misses) in sorted(self._cache.items()):
+                lines.append(_sample(name, {"cache": cache, "result": "hit"}, hits))
+                lines.append(_sample(name, {"cache": cache, "result": "miss"}, misses))
+        return "\n".join(lines) + "\n"
+
+    def _observe(self, histograms, key, seconds, error):
+        with self._lock:
+            histogram = histograms.get(key)
+            if histogram is None:
+                histogram = histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds, error)
+
+    def _histogram_dict(self, histogram):
+        buckets = dict()
+        total = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            total += count
+            buckets[str(bound)] = total
+        buckets["+Inf"] = histogram.count
+        return {"count": histogram.count, "errors": histogram.errors, "sum": histogram.sum,
+                "buckets": buckets}
+
+    def _histogram_lines(self, lines, kind, description, labeled_histograms):
+        name = "{}_{}_duration_seconds".format(METRIC_PREFIX, kind)
+        lines.append("# HELP {} Time taken by each {} call.".format(name, description))
+        lines.append("# TYPE {} histogram".format(name))
+        for labels, histogram in labeled_histograms:
+            total = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                total += count
+                lines.append(_sample(name + "_bucket", dict(labels, le=str(bound)), total))
+            lines.append(_sample(name + "_bucket", dict(labels, le="+Inf"), histogram.count))
+            lines.append(_sample(name + "_sum", labels, histogram.sum))
+            lines.append(_sample(name + "_count", labels, histogram.count))
+        errors = "{}_{}_errors_total".format(METRIC_PREFIX, kind)
+        lines.append("# HELP {} Failed {} calls.".format(errors, description))
+        lines.append("# TYPE {} counter".format(errors))
+        for labels, histogram in labeled_histograms:
+            lines.append(_sample(errors, labels, histogram.errors))
+
+
+def _ratio(part, total):
+    return float(part) / total if total else 0.0
+
+
+def _sample(name, labels, value):
+    label_text = ",".join('{}="{}"'.format(key, _escape(value)) for key, value in labels.items())
+    return "{}{{{}}} {}".format(name, label_text, value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+registry = MetricsRegistry()
+
+
+def instrument_clients():
+    """
+    Wraps the generated service clients' BaseClient._call so every call they make is recorded
+    in the registry, by service and method name. Only does it once.
+    """
+    from installed_clients.baseclient import BaseClient
+    if getattr(BaseClient._call, "_instrumented", False) is True:
+        return
+    call = BaseClient._call
+
+    def _call(self, url, method, params, context=None):
+        service, _, service_method = method.rpartition(".")
+        with registry.time_upstream(service, service_method):
+            return call(self, url, method, params, context)
+    _call._instrumented = True
+    BaseClient._call = _call
@@ -0,0 +1,177 @@
+"""
+A cache of Workspace object info tuples, keyed by versioned UPA (ws_id/obj_id/version).
+
+An object version's info never changes once it's saved, so entries are never invalidated. Entries
+are kept in an in-memory LRU and, optionally, in an SQLite file (e.g. under scratch) that's shared
+by the server's processes and survives restarts.
+
+This only stores infos. An object can still be deleted, or its workspace unshared, after its info
+is cached, and the info stays here. Whether a user can still read an object is up to the caller to
+check, see util.workspace.CachingWorkspace.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+import pylru
+
+from NarrativeService.util import json_codec
+
+logger = logging.getLogger(__name__)
+
+VERSIONED_UPA = re.compile(r"^\d+/\d+/\d+$")
+# SQLite's default limit on the number of variables in a statement is 999
+_DB_BATCH = 500
+
+
+def info_upa(info):
+    return "{}/{}/{}".format(info[6], info[0], info[4])
+
+
+def _copy_info(info):
+    info = list(info)
+    if isinstance(info[10], dict):
+        info[10] = dict(info[10])
+    return info
+
+
+class ObjectInfoCache(object):
+    def __init__(self, cache_size=50000, path=None):
+        """
+        cache_size - the number of infos to keep in memory
+        path - optional SQLite file to keep infos in as well
+        """
+        self._memory = pylru.lrucache(int(cache_size))
+        self._lock = threading.Lock()
+        self._path = path
+        # opened on first use in each process, as SQLite connections can't be used across a fork
+        self._db = None
+        self._db_pid = None
+
+    @classmethod
+    def from_config(cls, config):
+        path = None
+        if config.get("object-info-cache-disk") == "true":
+            path = os.path.join(config.get("scratch", "/kb/module/work/tmp"),
+                                "object_info_cache.sqlite")
+        return cls(config.get("object-info-cache-size") or 50000, path)
+
+    def _connection(self):
+        """
+        Returns this process's SQLite connection, or None if there's no file or it can't be
+        opened. Call with the lock held.
+        """
+        if self._path is None:
+            return None
+        if self._db_pid != os.getpid():
+            # a connection inherited from the parent process is left alone
+            self._db = self._open_db(self._path)
+            self._db_pid = os.getpid()
+        return self._db
+
+    @staticmethod
+    def _open_db(path):
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS object_info "
+                       "(upa TEXT PRIMARY KEY, has_metadata INTEGER, info TEXT)")
+            return db
+        except (OSError, sqlite3.Error):
+            # the memory cache still works without it
+            logger.exception("Unable to open object info cache %s", path)
+            return None
+
+    def get_many(self, upas, include_metadata=False):
+        """
+        Returns a dict of upa -> info for those of upas that are cached. Infos cached without
+        their metadata don't count if include_metadata is True, and have the metadata removed if
+        it's False, as the Workspace would.
+        """
+        found = dict()
+        missed = list()
+        with self._lock:
+            for upa in upas:
+                entry = self._memory.get(upa)
+                if entry is not None and (entry[0] or not include_metadata):
+                    found[upa] = entry[1]
+                else:
+                    missed.append(upa)
+            db = self._connection()
+        if missed and db is not None:
+            for upa, entry in self._db_get(db, missed).items():
+                if entry[0] or not include_metadata:
+                    found[upa] = entry[1]
+        return {upa: self._for_caller(info, include_metadata) for upa, info in found.items()}
+
+    def put_many(self, infos, include_metadata=False):
+        """
+        Caches object info tuples (None ones are skipped), which were fetched with or without
+        metadata.
+        """
+        entries = dict()
+        with self._lock:
+            for info in infos:
+                if info is None:
+                    continue
+                upa = info_upa(info)
+                current = self._memory.get(upa)
+                if current is None or include_metadata and not current[0]:
+                    entries[upa] = self._memory[upa] = (include_metadata, _copy_info(info))
+            db = self._connection()
+        if entries and db is not None:
+            self._db_put(db, entries, include_metadata)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM object_info")
+
+    def __len__(self):
+        return len(self._memory)
+
+    @staticmethod
+    def _for_caller(info, include_metadata):
+        info = _copy_info(info)
+        if not include_metadata:
+            info[10] = None
+        return info
+
+    def _db_get(self, db, upas):
+        found = dict()
+        try:
+            for i in range(0, len(upas), _DB_BATCH):
+                batch = upas[i:i + _DB_BATCH]
+                with self._lock:
+                    rows = db.execute(
+                        "SELECT upa, has_metadata, info FROM object_info WHERE upa IN ({})".format(
+                            ",".join("?" * len(batch))), batch).fetchall()
+                for upa, has_metadata, info in rows:
+                    found[upa] = (bool(has_metadata), json_codec.loads(info))
+        except sqlite3.Error:
+            logger.exception("Unable to read object info cache")
+        with self._lock:
+            for upa, entry in found.items():
+                self._memory[upa] = entry
+        return found
+
+    def _db_put(self, db, entries, include_metadata):
+        # infos with metadata replace those without, others only fill gaps
+        statement = "INSERT OR {} INTO object_info VALUES (?, ?, ?)".format(
+            "REPLACE" if include_metadata else "IGNORE")
+        rows = [(upa, int(has_metadata), json_codec.dumps(info))
+                for upa, (has_metadata, info) in entries.items()]
+        with self._lock:
+            try:
+                db.execute("BEGIN")
+                db.executemany(statement, rows)
+                db.execute("COMMIT")
+            except sqlite3.Error:
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+                logger.exception("Unable to write object info cache")
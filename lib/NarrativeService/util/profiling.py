@@ -0,0 +1,150 @@
+"""
+Opt-in cProfile profiling of production requests.
+
+A request is profiled if the profile-sample-rate (deploy.cfg) draw picks it, or if it has an
+X-KBase-Profile: 1 header and profile-header-enabled is true. The profile is written to
+<scratch>/profiles as <time in ms>-<user>-<method>-<call id>.prof, and only the newest
+profile-max-files are kept. The list_profiles and get_profile methods read them back. Profiles can
+hold request parameters and results, so users only get their own, except for the users in
+profile-admins, who get all of them.
+
+Only the thread running the request is profiled, so work done in thread pools (concurrent batch
+requests, parallel copies, etc.) shows up as time spent waiting on them.
+
+When it's turned off (the default), should_profile is the only cost.
+"""
+import base64
+import io
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+PROFILE_HEADER = "HTTP_X_KBASE_PROFILE"
+PROFILE_EXT = ".prof"
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9._]")
+_UNSAFE_USER_CHARS = re.compile(r"[^A-Za-z0-9_]")
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler(object):
+    def __init__(self, directory, sample_rate=0, header_enabled=False, max_files=50, admins=None):
+        """
+        directory - where profiles are written
+        sample_rate - fraction of requests to profile, 0 to 1
+        header_enabled - if True, requests with the profile header are profiled
+        max_files - number of profiles to keep, older ones are deleted
+        admins - users that can list and fetch every user's profiles
+        """
+        self.directory = directory
+        self.sample_rate = float(sample_rate)
+        self.header_enabled = header_enabled
+        self.max_files = int(max_files)
+        self.admins = set(admins or [])
+        self._lock = threading.Lock()
+        self._last_timestamp = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(os.path.join(config.get("scratch", "/kb/module/work/tmp"), "profiles"),
+                   sample_rate=config.get("profile-sample-rate") or 0,
+                   header_enabled=config.get("profile-header-enabled") == "true",
+                   max_files=config.get("profile-max-files") or 50,
+                   admins=[user.strip() for user in (config.get("profile-admins") or "").split(",")
+                           if user.strip()])
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 or self.header_enabled
+
+    def should_profile(self, environ):
+        """
+        Returns True if the request with the given WSGI environ should be profiled.
+        """
+        if self.header_enabled and environ.get(PROFILE_HEADER) == "1":
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def run(self, method, call_id, user, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) under cProfile and writes the profile, named for the method,
+        call id, and the user making the request (None if it's not authenticated), even if func
+        raises. Returns what func returns.
+        """
+        import cProfile  # only loaded if profiling is used
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            try:
+                self._save(profile, method, call_id, user)
+            except Exception:
+                # losing a profile shouldn't fail the request
+                logger.exception("Unable to save profile for {}".format(method))
+
+    def list_profiles(self, limit=None, for_user=None):
+        """
+        Returns info about the saved profiles, newest first. Each is a dict with keys name, user
+        (empty if the request wasn't authenticated), method, call_id, timestamp (ms since the
+        epoch), and size (bytes). With for_user, only the profiles that user can see are listed.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        infos = list()
+        for name in os.listdir(self.directory):
+            info = self._profile_info(name)
+            if info and self._can_see(for_user, info):
+                infos.append(info)
+        infos.sort(key=lambda info: info["timestamp"], reverse=True)
+        return infos[:limit] if limit else infos
+
+    def get_profile(self, name, limit=50, for_user=None):
+        """
+        Returns a saved profile as a dict with keys:
+            info - the same info as list_profiles gives
+            stats - pstats text report of the top <limit> functions by cumulative time
+            data - the .prof file, base64 encoded, for loading into pstats or snakeviz
+        Raises ValueError if there's no profile with that name, or for_user can't see it.
+        """
+        info = self._profile_info(name)
+        if info is None or not self._can_see(for_user, info):
+            raise ValueError("No profile named '{}' found".format(name))
+        import pstats
+        path = os.path.join(self.directory, name)
+        report = io.StringIO()
+        pstats.Stats(path, stream=report).sort_stats("cumulative").print_stats(limit)
+        with open(path, "rb") as f:
+            data = base64.b64encode(f.read()).decode("ascii")
+        return {"info": info, "stats": report.getvalue(), "data": data}
+
+    def _can_see(self, user, info):
+        return user is None or user in self.admins or user == info["user"]
+
+    def _save(self, profile, method, call_id, user):
+        with self._lock:
+            # keep timestamps unique so profiles saved in the same ms still sort in order
+            timestamp = self._last_timestamp = max(int(time.time() * 1000),
+                                                   self._last_timestamp + 1)
+            name = "{}-{}-{}-{}{}".format(timestamp, _UNSAFE_USER_CHARS.sub("_", user or ""),
+                                          _UNSAFE_CHARS.sub("_", str(method)),
+                                          _UNSAFE_CHARS.sub("_", str(call_id)), PROFILE_EXT)
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(os.path.join(self.directory, name))
+            for old in self.list_profiles()[self.max_files:]:
+                os.remove(os.path.join(self.directory, old["name"]))
+
+    def _profile_info(self, name):
+        # only names that _save makes - this also keeps get_profile out of other directories
+        match = re.match(r"^(\d+)-([A-Za-z0-9_]*)-([A-Za-z0-9._]+)-([A-Za-z0-9._]*)\.prof$",
+                         name)
+        if not match:
+            return None
+        path = os.path.join(self.directory, name)
+        if not os.path.isfile(path):
+            return None
+        return {"name": name, "user": match.group(2), "method": match.group(3),
+                "call_id": match.group(4), "timestamp": int(match.group(1)),
+                "size": os.path.getsize(path)}
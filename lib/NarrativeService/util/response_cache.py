@@ -0,0 +1,194 @@
+"""
+Caches the results of read-only RPC methods in the server process.
+
+Methods are opted in with ResponseCache.add, each with a TTL, a maximum number of cached results,
+and a key function over the method's params. Results for users can be kept apart with per_user.
+While a result is being computed, other calls with the same key wait for it instead of computing
+it again.
+
+Each cached result is encoded to JSON once, when it's computed, and kept with its encoding (see
+EncodedResult), so the server can send it without encoding it again. Its ETag is a hash of that
+encoding, which the server sends back so clients can use If-None-Match on a GET to skip
+downloading a result they already have. A compressed response gets the ETag with the content
+coding added (see encoded_etag), as its bytes differ.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+import pylru
+
+from NarrativeService.util import json_codec, metrics
+
+
+def params_key(params):
+    """
+    The default key function - the params themselves, as canonical JSON.
+    """
+    return json.dumps(params, sort_keys=True, default=list)
+
+
+# a cached result's JSON encoding, as a list of bytes chunks, and the ETag made from them
+EncodedResult = namedtuple('EncodedResult', ['etag', 'chunks'])
+
+
+def _encode(result):
+    return [json_codec.dumps_bytes(result)]
+
+
+class _CachedMethod(object):
+    def __init__(self, ttl, max_size, per_user, key):
+        self.ttl = ttl
+        self.per_user = per_user
+        self.key = key
+        self.results = pylru.lrucache(max_size)  # key -> (expiry time, result, EncodedResult)
+        self.pending = dict()  # key -> Future for a result being computed
+        # incremented when the cache is cleared, so results computed before that aren't kept
+        self.generation = 0
+
+
+class ResponseCache(object):
+    def __init__(self, encode=_encode):
+        """
+        encode - function that returns a result's JSON encoding as a list of bytes chunks, by
+            default as one chunk from json_codec
+        """
+        self._encode = encode
+        self._methods = dict()  # method name -> _CachedMethod
+        self._invalidates = dict()  # method name -> names of cached methods it changes
+        self._lock = threading.Lock()
+
+    def add(self, method, ttl, max_size=100, per_user=False, key=params_key, invalidated_by=None):
+        """
+        Caches the results of a method.
+        method - the full method name, e.g. NarrativeService.list_narratorials
+        ttl - seconds to keep a result
+        max_size - maximum number of results to keep, least recently used ones are dropped first
+        per_user - if True, each user (and anonymous callers) gets their own results
+        key - function of the method's params list that returns a string key for the result, or
+            None if that call shouldn't be cached
+        invalidated_by - names of methods that change this method's results. A successful call to
+            one of them clears this method's cache.
+        """
+        self._methods[method] = _CachedMethod(ttl, max_size, per_user, key)
+        for other in invalidated_by or []:
+            self._invalidates.setdefault(other, []).append(method)
+
+    def is_cached(self, method):
+        """Returns True if calls to the method go through the cache, see caches."""
+        return method in self._methods or method in self._invalidates
+
+    def caches(self, method):
+        """Returns True if the method's results are cached."""
+        return method in self._methods
+
+    def clear(self, method=None):
+        """
+        Drops the cached results for a method, or all methods if it's None. Results that are being
+        computed when it's called aren't cached, and later calls don't wait for them.
+        """
+        with self._lock:
+            for name, cached in self._methods.items():
+                if method is None or name == method:
+                    cached.results.clear()
+                    cached.pending.clear()
+                    cached.generation += 1
+
+    def call(self, method, ctx, params, compute):
+        """
+        Returns (result, encoded) for a call to method with params, using a cached result if there's
+        one, and calling compute() for it otherwise. encoded is the result's EncodedResult, or None
+        if the result wasn't cacheable.
+        """
+        cached = self._methods.get(method)
+        if cached is None:
+            result = compute()
+            for other in self._invalidates.get(method, []):
+                self.clear(other)
+            return result, None
+        key = cached.key(params)
+        if key is None:
+            return compute(), None
+        if cached.per_user:
+            key = (ctx['user_id'], key)
+
+        with self._lock:
+            entry = cached.results.get(key)
+            if entry is not None and entry[0] > time.time():
+                metrics.registry.count_cache('response ' + method, hits=1)
+                return entry[1], entry[2]
+            future = cached.pending.get(key)
+            computing = future is None
+            if computing:
+                future = cached.pending[key] = Future()
+                generation = cached.generation
+        if not computing:
+            # the same call is already being computed, so wait for its result
+            metrics.registry.count_cache('response ' + method, hits=1)
+            return future.result()
+
+        metrics.registry.count_cache('response ' + method, misses=1)
+        try:
+            result = compute()
+            chunks = self._encode(result)
+            sha1 = hashlib.sha1()
+            for chunk in chunks:
+                sha1.update(chunk)
+            encoded = EncodedResult('"{}"'.format(sha1.hexdigest()), chunks)
+        except BaseException as e:
+            with self._lock:
+                self._done(cached, key, future)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            if cached.generation == generation:
+                cached.results[key] = (time.time() + cached.ttl, result, encoded)
+            self._done(cached, key, future)
+        future.set_result((result, encoded))
+        return result, encoded
+
+    @staticmethod
+    def _done(cached, key, future):
+        # after a clear, another call may be computing the same key
+        if cached.pending.get(key) is future:
+            del cached.pending[key]
+
+
+# content codings that encoded_etag can add to an ETag
+ETAG_ENCODINGS = ['gzip', 'deflate']
+
+
+def encoded_etag(etag, encoding):
+    """
+    Returns the ETag for a result sent with the given Content-Encoding.
+    """
+    return '"{}-{}"'.format(etag.strip('"'), encoding)
+
+
+def matching_etag(etag, if_none_match):
+    """
+    Returns the entity tag in an If-None-Match header value that matches the ETag, either as is or
+    with a content coding added by encoded_etag, or None if none does. For '*', returns the ETag.
+    """
+    if not etag or not if_none_match:
+        return None
+    matches = [etag] + [encoded_etag(etag, encoding) for encoding in ETAG_ENCODINGS]
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == '*':
+            return etag
+        if tag in matches:
+            return tag
+    return None
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Returns True if an If-None-Match header value matches the ETag (see matching_etag).
+    """
+    return matching_etag(etag, if_none_match) is not None
@@ -0,0 +1,49 @@
+"""
+Logging for code that runs outside of a request's MethodContext - background threads, caches, and
+helpers that don't get the ctx. Modules log with logging.getLogger(__name__), which is under the
+NarrativeService logger. Once the server calls send_to_kbase_log with its biokbase log, those
+messages go to the service log with a matching level. Before that (e.g. in scripts and tests),
+warnings and errors go to stderr.
+"""
+import logging
+
+LOGGER_NAME = "NarrativeService"
+# the biokbase.log level for each logging level and up
+_KBASE_LEVELS = [
+    (logging.CRITICAL, 2),  # CRIT
+    (logging.ERROR, 3),     # ERR
+    (logging.WARNING, 4),   # WARNING
+    (logging.INFO, 6),      # INFO
+]
+_KBASE_DEBUG = 7
+
+
+class KBaseLogHandler(logging.Handler):
+    """
+    Sends log records to a biokbase.log.log.
+    """
+    def __init__(self, kbase_log):
+        super().__init__()
+        self.kbase_log = kbase_log
+
+    def emit(self, record):
+        try:
+            level = next((kbase_level for levelno, kbase_level in _KBASE_LEVELS
+                          if record.levelno >= levelno), _KBASE_DEBUG)
+            self.kbase_log.log_message(level, self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+def send_to_kbase_log(kbase_log):
+    """
+    Sends everything logged under the NarrativeService logger to kbase_log, which decides what
+    level to log at.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        if isinstance(handler, KBaseLogHandler):
+            logger.removeHandler(handler)
+    logger.addHandler(KBaseLogHandler(kbase_log))
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
@@ -0,0 +1,109 @@
+"""
+Lightweight tracing of where the time goes in a single request.
+
+The server starts a trace for each request when slow call logging is on (see
+slow-call-log-threshold in deploy.cfg). While a trace is running, span() records a timed span as a
+child of the current span, so nested spans make a tree. Upstream service calls (through
+util.metrics), cache lookups, Workspace list_objects pages, and post-processing steps are all
+spans. If the request takes longer than the threshold, the tree gets logged.
+
+When there's no trace running, span() does nothing but check a context variable.
+
+The current span is kept in a contextvars.ContextVar. New threads don't inherit it, so functions
+run in a thread pool should be wrapped with propagate() to keep their spans in the tree.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+_current_span = contextvars.ContextVar("narrative_service_span", default=None)
+
+
+class Span(object):
+    __slots__ = ("name", "attrs", "start", "end", "children")
+
+    def __init__(self, name, attrs=None):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.end = None
+        self.children = list()
+
+    @property
+    def duration(self):
+        """Seconds the span took, or has taken so far if it isn't finished."""
+        return (self.end or time.time()) - self.start
+
+
+class Trace(object):
+    def __init__(self, name, attrs=None):
+        self.root = Span(name, attrs)
+        self._token = _current_span.set(self.root)
+
+    def finish(self):
+        """Ends the trace's root span and stops recording spans in this context."""
+        self.root.end = time.time()
+        _current_span.reset(self._token)
+        return self.root
+
+    def format(self):
+        """
+        Returns the span tree as a list of lines, one per span, indented by depth. Each line has
+        when the span started relative to the trace, how long it took, its name, and attributes.
+        """
+        lines = list()
+        self._format_span(self.root, 0, lines)
+        return lines
+
+    def _format_span(self, span, depth, lines):
+        attrs = ""
+        if span.attrs:
+            attrs = " " + " ".join("{}={}".format(k, v) for k, v in sorted(span.attrs.items()))
+        lines.append("{}+{:.1f}ms {:.1f}ms {}{}".format(
+            "  " * depth, (span.start - self.root.start) * 1000, span.duration * 1000,
+            span.name, attrs))
+        for child in sorted(span.children, key=lambda s: s.start):
+            self._format_span(child, depth + 1, lines)
+
+
+def start_trace(name, **attrs):
+    """
+    Starts a trace in the current context, with a root span with the given name.
+    Returns a Trace - call finish() on it when the request is done.
+    """
+    return Trace(name, attrs)
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times the with block as a span under the current one. Yields the Span, or None if there's
+    no trace running.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.time()
+        _current_span.reset(token)
+
+
+def propagate(func):
+    """
+    Returns a function that runs func in (a copy of) the current context, so spans it records
+    go under the current span even when it runs in another thread.
+    """
+    if _current_span.get() is None:
+        return func
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # a context can only be entered by one thread at a time, so copy it for every call
+        return context.copy().run(func, *args, **kwargs)
+    return run
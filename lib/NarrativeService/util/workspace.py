@@ -1,17 +1,154 @@
-from installed_clients.WorkspaceClient import Workspace
-
-
-def get_ws_admins(ws_id, ws_url, admin_token):
-    ws = Workspace(url=ws_url, token=admin_token)
-    perms = ws.administer({
-        "command": "getPermissionsMass",
-        "params": {
-            "workspaces": [{"id": ws_id}]
-        }
-    })['perms'][0]
-
-    admins = list()
-    for u in perms:
-        if perms[u] == "a":
-            admins.append(u)
-    return admins
+import threading
+import time
+
+import pylru
+
+from NarrativeService.util import metrics
+from NarrativeService.util.lazy import lazy_import
+from NarrativeService.util.object_info_cache import VERSIONED_UPA, info_upa
+
+Workspace = lazy_import("installed_clients.WorkspaceClient", "Workspace")
+
+# seconds to remember the admins of a workspace for
+WS_ADMINS_TTL = 30
+# the most workspaces getPermissionsMass takes
+MAX_PERMISSIONS_MASS = 1000
+
+# (ws_url, admin_token) -> WorkspaceAdmins
+_ws_admins = dict()
+_ws_admins_lock = threading.Lock()
+
+
+def get_ws_admins(ws_id, ws_url, admin_token, ttl=WS_ADMINS_TTL):
+    """
+    Returns the list of users with admin rights to a workspace.
+    """
+    return get_ws_admins_mass([ws_id], ws_url, admin_token, ttl=ttl)[ws_id]
+
+
+def get_ws_admins_mass(ws_ids, ws_url, admin_token, ttl=WS_ADMINS_TTL):
+    """
+    Returns a dict of each of ws_ids -> the list of users with admin rights to it. Admins looked
+    up in the last ttl seconds are reused, the rest are looked up with as few getPermissionsMass
+    calls as possible, through one admin Workspace client for each ws_url and admin_token.
+    """
+    key = (ws_url, admin_token)
+    with _ws_admins_lock:
+        ws_admins = _ws_admins.get(key)
+        if ws_admins is None:
+            ws_admins = _ws_admins[key] = WorkspaceAdmins(Workspace(url=ws_url, token=admin_token))
+    return ws_admins.get_many(ws_ids, ttl=ttl)
+
+
+class WorkspaceAdmins(object):
+    """
+    Looks up the admins of workspaces with an admin Workspace client, and remembers them for a
+    short time so bursts of share requests for the same Narrative make one call.
+    """
+    def __init__(self, admin_client, cache_size=10000):
+        self._client = admin_client
+        self._cache = pylru.lrucache(int(cache_size))  # ws_id -> (lookup time, admins)
+        self._lock = threading.Lock()
+
+    def get_many(self, ws_ids, ttl=WS_ADMINS_TTL):
+        found = dict()
+        now = time.time()
+        with self._lock:
+            for ws_id in ws_ids:
+                cached = self._cache.get(ws_id)
+                if cached is not None and now - cached[0] < ttl:
+                    found[ws_id] = cached[1]
+        missed = [ws_id for ws_id in dict.fromkeys(ws_ids) if ws_id not in found]
+        metrics.registry.count_cache("ws admins", hits=len(found), misses=len(missed))
+        for i in range(0, len(missed), MAX_PERMISSIONS_MASS):
+            batch = missed[i:i + MAX_PERMISSIONS_MASS]
+            perms = self._client.administer({
+                "command": "getPermissionsMass",
+                "params": {
+                    "workspaces": [{"id": ws_id} for ws_id in batch]
+                }
+            })["perms"]
+            looked_up = time.time()
+            with self._lock:
+                for ws_id, ws_perms in zip(batch, perms):
+                    admins = [u for u in ws_perms if ws_perms[u] == "a"]
+                    self._cache[ws_id] = (looked_up, admins)
+                    found[ws_id] = admins
+        # callers get their own lists
+        return {ws_id: list(found[ws_id]) for ws_id in ws_ids}
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+class CachingWorkspace(object):
+    """
+    Wraps a Workspace client for a user, so object infos with metadata, which can be large, come
+    from an ObjectInfoCache. get_object_info3 and get_object_info_new calls that include metadata
+    and only ask for versioned UPAs (ws_id/obj_id/ver) the cache has with metadata are sent to the
+    Workspace without it, which checks the user can still read each object and that it hasn't
+    been deleted, and the metadata is filled in from the cache. Anything else goes to the
+    Workspace as it is, and the infos it returns are cached. All other methods are passed straight
+    through.
+    """
+    # get_object_info3 and get_object_info_new params that cached infos can answer
+    _CACHEABLE_PARAMS = {"objects", "includeMetadata", "ignoreErrors"}
+
+    def __init__(self, client, info_cache):
+        self._client = client
+        self._info_cache = info_cache
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def get_object_info3(self, params, context=None):
+        cached = self._cached_infos(params)
+        if cached is not None:
+            result = self._client.get_object_info3(dict(params, includeMetadata=0),
+                                                   context=context)
+            result["infos"] = self._with_metadata(result["infos"], cached)
+            return result
+        result = self._client.get_object_info3(params, context=context)
+        self._info_cache.put_many(result["infos"], bool(params.get("includeMetadata")))
+        return result
+
+    def get_object_info_new(self, params, context=None):
+        cached = self._cached_infos(params)
+        if cached is not None:
+            return self._with_metadata(
+                self._client.get_object_info_new(dict(params, includeMetadata=0),
+                                                 context=context),
+                cached)
+        infos = self._client.get_object_info_new(params, context=context)
+        self._info_cache.put_many(infos, bool(params.get("includeMetadata")))
+        return infos
+
+    def _cached_infos(self, params):
+        """
+        Returns a dict of upa -> cached info with metadata for the params, or None if the
+        Workspace has to be asked for the metadata.
+        """
+        objects = params.get("objects") or []
+        if (not objects or not params.get("includeMetadata") or
+                not self._CACHEABLE_PARAMS.issuperset(params) or
+                not all(list(obj) == ["ref"] and VERSIONED_UPA.match(str(obj["ref"]))
+                        for obj in objects)):
+            return None
+        upas = [obj["ref"] for obj in objects]
+        cached = self._info_cache.get_many(upas, include_metadata=True)
+        metrics.registry.count_cache("object_info", hits=len(cached),
+                                     misses=len(set(upas)) - len(cached))
+        if len(cached) < len(set(upas)):
+            return None
+        return cached
+
+    @staticmethod
+    def _with_metadata(infos, cached):
+        """
+        Fills in the metadata of the infos the user could read from their cached infos.
+        """
+        for info in infos:
+            if info is not None:
+                info[10] = cached[info_upa(info)][10]
+        return infos
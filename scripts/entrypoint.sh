@@ -10,6 +10,12 @@ fi
 
 if [ $# -eq 0 ] ; then
   sh ./scripts/start_server.sh
+elif [ "${1}" = "asgi" ] ; then
+  # the same server under uvicorn instead of uwsgi. Only the HTTP server changes, requests
+  # (and their blocking calls to other services) still run on a thread pool, see util/asgi.py
+  export KB_DEPLOYMENT_CONFIG=$(pwd)/deploy.cfg
+  export PYTHONPATH=$(pwd)/lib:$PYTHONPATH
+  uvicorn --host 0.0.0.0 --port 5000 NarrativeService.NarrativeServiceServer:asgi_application
 elif [ "${1}" = "test" ] ; then
   echo "Run Tests"
   make test
@@ -0,0 +1,183 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from NarrativeService.apps import appinfo
+from NarrativeService.apps.appinfo import AppInfoCache, get_all_app_info
+
+
+def make_app(app_id, categories=("assembly",)):
+    return {"id": app_id, "module_name": app_id.split("/")[0], "ver": "1.0.0",
+            "categories": list(categories), "input_types": ["KBaseGenomes.Genome"],
+            "output_types": ["KBaseFBA.FBAModel"]}
+
+
+class NMSMock:
+    apps = [make_app("Mod/app_a"), make_app("Mod/app_b"), make_app("Other/run", ["inactive"]),
+            None]
+    calls = 0
+    delay = 0
+
+    def __init__(self, url):
+        pass
+
+    def list_methods(self, params):
+        NMSMock.calls += 1
+        time.sleep(NMSMock.delay)
+        return [dict(a) if a else a for a in NMSMock.apps]
+
+
+class CatalogMock:
+    calls = 0
+    delay = 0
+
+    def __init__(self, url):
+        pass
+
+    def list_favorites(self, user):
+        CatalogMock.calls += 1
+        time.sleep(CatalogMock.delay)
+        if user == "fan":
+            return [{"module_name_lc": "mod", "id": "app_a", "timestamp": 12345}]
+        return []
+
+
+@mock.patch("NarrativeService.apps.appinfo.NarrativeMethodStore", NMSMock)
+@mock.patch("NarrativeService.apps.appinfo.Catalog", CatalogMock)
+class AppInfoCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        NMSMock.calls = CatalogMock.calls = NMSMock.delay = CatalogMock.delay = 0
+
+    def test_same_as_uncached(self):
+        cache = AppInfoCache("nms", "catalog")
+        for user in ["fan", "someone"]:
+            info = cache.get_all_app_info("release", user)
+            self.assertEqual(len(info.pop("version")), 40)
+            self.assertEqual(info, get_all_app_info("release", user, "nms", "catalog"))
+        info = cache.get_all_app_info("release", "fan")
+        self.assertEqual(sorted(info["app_infos"]), ["mod/app_a", "mod/app_b"])
+        self.assertEqual(info["app_infos"]["mod/app_a"]["favorite"], 12345)
+        self.assertEqual(info["app_infos"]["mod/app_a"]["info"]["short_input_types"], ["Genome"])
+        self.assertEqual(info["module_versions"], {"mod": "1.0.0"})
+        # one user's favorites don't show up for another
+        info = cache.get_all_app_info("release", "someone")
+        self.assertNotIn("favorite", info["app_infos"]["mod/app_a"])
+        with self.assertRaises(ValueError):
+            cache.get_all_app_info("nope", "fan")
+
+    def test_copies(self):
+        apps = [make_app("Mod/app_a")]
+        with mock.patch.object(NMSMock, "list_methods", return_value=apps):
+            cache = AppInfoCache("nms", "catalog")
+            info = cache.get_all_app_info("release", "fan")
+        # the NMS result isn't changed
+        self.assertEqual(apps, [make_app("Mod/app_a")])
+        # and changing what's returned doesn't change what the next caller gets
+        info["app_infos"]["mod/app_a"]["info"]["name"] = "changed"
+        info["app_infos"]["mod/app_a"]["favorite"] = 1
+        info["module_versions"]["mod"] = "2.0.0"
+        info = cache.get_all_app_info("release", "someone")
+        self.assertNotIn("name", info["app_infos"]["mod/app_a"]["info"])
+        self.assertNotIn("favorite", info["app_infos"]["mod/app_a"])
+        self.assertEqual(info["module_versions"], {"mod": "1.0.0"})
+
+    def test_refresh_failure_logged(self):
+        cache = AppInfoCache("nms", "catalog", refresh_interval=0)
+        cache.get_all_app_info("release", "fan")
+        with mock.patch.object(NMSMock, "list_methods", side_effect=RuntimeError("down")), \
+                self.assertLogs(appinfo.logger, "ERROR") as logs:
+            cache._refresh("release")
+        self.assertIn("release", logs.output[0])
+        # the current app info is kept
+        self.assertIn("mod/app_a", cache.get_all_app_info("release", "fan")["app_infos"])
+
+    def test_cached(self):
+        cache = AppInfoCache("nms", "catalog", favorites_ttl=0.1)
+        for _ in range(3):
+            cache.get_all_app_info("release", "fan")
+        cache.get_all_app_info("dev", "fan")
+        self.assertEqual((NMSMock.calls, CatalogMock.calls), (2, 1))
+        time.sleep(0.15)
+        cache.get_all_app_info("release", "fan")
+        self.assertEqual((NMSMock.calls, CatalogMock.calls), (2, 2))
+
+    def test_first_fetch_once(self):
+        NMSMock.delay = 0.1
+        cache = AppInfoCache("nms", "catalog")
+        threads = [threading.Thread(target=cache.get_all_app_info, args=("beta", "fan"))
+                   for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(NMSMock.calls, 1)
+
+    def test_background_refresh(self):
+        cache = AppInfoCache("nms", "catalog", refresh_interval=0.05)
+        cache.get_all_app_info("release", "fan")
+        time.sleep(0.1)
+        NMSMock.delay = 0.1
+        NMSMock.apps = NMSMock.apps + [make_app("Mod/app_c")]
+        try:
+            start = time.time()
+            # the old app info comes back right away, and one refresh starts
+            for _ in range(3):
+                info = cache.get_all_app_info("release", "fan")
+                self.assertNotIn("mod/app_c", info["app_infos"])
+            self.assertLess(time.time() - start, 0.1)
+            time.sleep(0.2)
+            self.assertEqual(NMSMock.calls, 2)
+            self.assertIn("mod/app_c", cache.get_all_app_info("release", "fan")["app_infos"])
+        finally:
+            NMSMock.apps = NMSMock.apps[:-1]
+
+    def test_parallel_calls(self):
+        NMSMock.delay = CatalogMock.delay = 0.1
+        for get_info in [lambda: get_all_app_info("dev", "fan", "nms", "catalog"),
+                         lambda: AppInfoCache("nms", "catalog").get_all_app_info("dev", "fan")]:
+            start = time.time()
+            info = get_info()
+            self.assertLess(time.time() - start, 0.18)
+            self.assertEqual(info["app_infos"]["mod/app_a"]["favorite"], 12345)
+
+    def test_versions(self):
+        cache = AppInfoCache("nms", "catalog")
+        version = cache.get_all_app_info("release", "fan")["version"]
+        # the version only depends on the app info
+        self.assertEqual(AppInfoCache("nms", "catalog").get_all_app_info("dev", "x")["version"],
+                         version)
+        self.assertEqual(cache.get_all_app_info("release", "fan", version),
+                         {"version": version, "unchanged": 1, "favorites": {"mod/app_a": 12345}})
+        self.assertEqual(cache.get_all_app_info("release", "someone", version)["favorites"], {})
+        # unknown versions get everything
+        info = cache.get_all_app_info("release", "fan", "nope")
+        self.assertEqual(info["version"], version)
+        self.assertIn("app_infos", info)
+
+        old_apps = NMSMock.apps
+        NMSMock.apps = [make_app("Mod/app_a"), dict(make_app("Mod/app_b"), ver="1.1.0"),
+                        make_app("Mod/app_c")]
+        try:
+            cache.clear()
+            cache.get_all_app_info("release", "fan")
+            # clearing forgets the history too
+            self.assertIn("app_infos", cache.get_all_app_info("release", "fan", version))
+            cache = AppInfoCache("nms", "catalog", refresh_interval=0)
+            NMSMock.apps = old_apps
+            cache.get_all_app_info("release", "fan")
+            NMSMock.apps = [make_app("Mod/app_a"), dict(make_app("Mod/app_b"), ver="1.1.0"),
+                            make_app("Mod/app_c")]
+            # starts a refresh
+            cache.get_all_app_info("release", "fan")
+            time.sleep(0.05)
+            delta = cache.get_all_app_info("release", "fan", version)
+        finally:
+            NMSMock.apps = old_apps
+        self.assertNotEqual(delta["version"], version)
+        self.assertEqual(delta["base_version"], version)
+        self.assertEqual(sorted(delta["changed_apps"]), ["mod/app_b", "mod/app_c"])
+        self.assertNotIn("favorite", delta["changed_apps"]["mod/app_b"])
+        self.assertEqual(delta["removed_apps"], [])
+        self.assertEqual(delta["favorites"], {"mod/app_a": 12345})
+        self.assertEqual(delta["module_versions"], {"mod": "1.0.0"})
@@ -0,0 +1,86 @@
+import asyncio
+import time
+import unittest
+
+from NarrativeService.util.asgi import ASGIAdapter, build_environ
+
+
+def wsgi_app(environ, start_response):
+    body = environ["wsgi.input"].read(int(environ["CONTENT_LENGTH"]))
+    time.sleep(0.1)
+    start_response("200 OK", [("Content-Type", "application/json")])
+    if environ["PATH_INFO"] == "/stream":
+        return iter([b"[", body, b"]"])
+    return [body]
+
+
+def run_request(app, path="/", body=b"{}"):
+    messages = [{"type": "http.request", "body": body[:1], "more_body": True},
+                {"type": "http.request", "body": body[1:]}]
+    sent = list()
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+    scope = {"type": "http", "method": "POST", "path": path, "headers": []}
+    return app(scope, receive, send), sent
+
+
+class AsgiTestCase(unittest.TestCase):
+    def test_build_environ(self):
+        environ = build_environ({
+            "type": "http", "method": "GET", "path": "/metrics", "query_string": b"a=1",
+            "client": ("10.0.0.1", 1234), "server": ("ns", 5000),
+            "headers": [(b"authorization", b"token"), (b"content-type", b"text/plain"),
+                        (b"x-forwarded-for", b"1.1.1.1"), (b"x-forwarded-for", b"2.2.2.2")]
+        }, b"abc")
+        self.assertEqual(environ["REQUEST_METHOD"], "GET")
+        self.assertEqual(environ["PATH_INFO"], "/metrics")
+        self.assertEqual(environ["QUERY_STRING"], "a=1")
+        self.assertEqual(environ["REMOTE_ADDR"], "10.0.0.1")
+        self.assertEqual(environ["SERVER_PORT"], "5000")
+        self.assertEqual(environ["CONTENT_LENGTH"], "3")
+        self.assertEqual(environ["CONTENT_TYPE"], "text/plain")
+        self.assertEqual(environ["HTTP_AUTHORIZATION"], "token")
+        self.assertEqual(environ["HTTP_X_FORWARDED_FOR"], "1.1.1.1,2.2.2.2")
+        self.assertEqual(environ["wsgi.input"].read(), b"abc")
+
+    def test_concurrent_requests(self):
+        app = ASGIAdapter(wsgi_app, max_threads=20)
+
+        async def run_all():
+            requests = [run_request(app, body=str(i).encode() * 2) for i in range(20)]
+            await asyncio.gather(*[r[0] for r in requests])
+            return [r[1] for r in requests]
+        start = time.time()
+        responses = asyncio.run(run_all())
+        # 20 requests that each wait 0.1s, in about the time of one
+        self.assertLess(time.time() - start, 1)
+        for i, sent in enumerate(responses):
+            self.assertEqual(sent[0], {"type": "http.response.start", "status": 200,
+                                       "headers": [(b"content-type", b"application/json")]})
+            self.assertEqual(sent[1], {"type": "http.response.body",
+                                       "body": str(i).encode() * 2, "more_body": False})
+
+    def test_streamed_response(self):
+        app = ASGIAdapter(wsgi_app)
+        coroutine, sent = run_request(app, path="/stream", body=b"123")
+        asyncio.run(coroutine)
+        self.assertEqual([m["body"] for m in sent[1:]], [b"[", b"123", b"]"])
+        self.assertEqual([m["more_body"] for m in sent[1:]], [True, True, False])
+
+    def test_lifespan(self):
+        app = ASGIAdapter(wsgi_app)
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = list()
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+        asyncio.run(app({"type": "lifespan"}, receive, send))
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+
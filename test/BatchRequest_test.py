@@ -0,0 +1,122 @@
+import io
+import json
+import threading
+import time
+import unittest
+
+from jsonrpcbase import ServerError as JSONServerError
+
+from NarrativeService.NarrativeServiceServer import (JSONRPCServiceCustom, MethodContext,
+                                                     application)
+
+
+class LoggerMock:
+    def log_message(self, *args, **kwargs):
+        pass
+
+
+def echo(ctx, params):
+    # later requests in the tests sleep less, so they finish first when run concurrently
+    time.sleep(params.get("sleep", 0))
+    ctx["token"] = "changed"
+    return [{"x": params["x"], "method": ctx["method"], "call_id": ctx["call_id"],
+             "provenance": ctx["provenance"], "thread": threading.current_thread().name}]
+
+
+def shout(ctx, params):
+    return [params["x"].upper()]
+
+
+def fail(ctx, params):
+    time.sleep(params.get("sleep", 0))
+    raise ValueError("failed " + params["x"])
+
+
+def request(method, x, call_id, sleep=0):
+    return {"method": "NarrativeService." + method, "params": [{"x": x, "sleep": sleep}],
+            "version": "1.1", "id": call_id}
+
+
+class BatchRequestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rpc_service = JSONRPCServiceCustom()
+        for method in [echo, shout, fail]:
+            self.rpc_service.add(method, name="NarrativeService." + method.__name__,
+                                 types=[dict])
+        self.rpc_service.batch_concurrency = 4
+        self.ctx = MethodContext(LoggerMock())
+        self.ctx.update({"module": "NarrativeService", "method": "batch",
+                         "token": "some_token", "user_id": "some_user"})
+
+    def test_mixed_methods_in_order(self):
+        results = self.rpc_service.call_py(self.ctx, [
+            request("echo", "a", "1", sleep=0.2),
+            request("shout", "b", "2"),
+            request("echo", "c", "3", sleep=0.1),
+            request("echo", "d", None)  # a notification gets no response
+        ])
+        self.assertEqual([r["id"] for r in results], ["1", "2", "3"])
+        self.assertEqual(results[1]["result"], ["B"])
+        (a, c) = (results[0]["result"][0], results[2]["result"][0])
+        self.assertEqual((a["x"], a["method"], a["call_id"]), ("a", "echo", "1"))
+        self.assertEqual((c["x"], c["method"], c["call_id"]), ("c", "echo", "3"))
+        self.assertEqual(c["provenance"], [{"service": "NarrativeService", "method": "echo",
+                                            "method_params": [{"x": "c", "sleep": 0.1}]}])
+        self.assertNotEqual(a["thread"], c["thread"])
+        # each request got its own copy of the context
+        self.assertEqual(self.ctx["token"], "some_token")
+        self.assertEqual(self.ctx["method"], "batch")
+
+    def test_first_error_in_request_order(self):
+        # the second request fails first, but the first one's error is what's raised
+        with self.assertRaises(JSONServerError) as e:
+            self.rpc_service.call_py(self.ctx, [
+                request("echo", "a", "1"),
+                request("fail", "b", "2", sleep=0.2),
+                request("fail", "c", "3")
+            ])
+        self.assertIn("failed b", e.exception.data)
+
+    def test_concurrency_1(self):
+        self.rpc_service.batch_concurrency = 1
+        main_thread = threading.current_thread().name
+        results = self.rpc_service.call_py(self.ctx, [request("echo", "a", "1", sleep=0.05),
+                                                      request("echo", "b", "2")])
+        self.assertEqual([r["result"][0]["x"] for r in results], ["a", "b"])
+        self.assertEqual([r["result"][0]["thread"] for r in results], [main_thread] * 2)
+        self.assertEqual([r["result"][0]["call_id"] for r in results], ["1", "2"])
+
+    def test_for_request(self):
+        self.ctx["rpc_context"] = {"call_stack": [{"method": "NarrativeService.batch"}]}
+        req_ctx = self.ctx.for_request(request("echo", "a", "5"))
+        self.assertEqual((req_ctx["module"], req_ctx["method"], req_ctx["call_id"]),
+                         ("NarrativeService", "echo", "5"))
+        self.assertEqual(req_ctx["user_id"], "some_user")
+        req_ctx["rpc_context"]["call_stack"].append({"method": "other"})
+        self.assertEqual(len(self.ctx["rpc_context"]["call_stack"]), 1)
+
+
+class BatchAuthTestCase(unittest.TestCase):
+    def call(self, body):
+        body = json.dumps(body).encode("utf8")
+        environ = {"REQUEST_METHOD": "POST", "CONTENT_LENGTH": str(len(body)),
+                   "wsgi.input": io.BytesIO(body), "REMOTE_ADDR": "127.0.0.1"}
+        statuses = list()
+        chunks = application(environ, lambda status, headers: statuses.append(status))
+        return statuses[0], json.loads(b"".join(chunks))
+
+    def test_auth_required_method_in_unauthenticated_batch(self):
+        self.assertEqual(application.get_auth_requirement(
+            ["NarrativeService.get_ignore_categories", "NarrativeService.list_narratives"]),
+            "optional")
+        self.assertEqual(application.get_auth_requirement(
+            ["NarrativeService.get_ignore_categories", "NarrativeService.copy_narrative"]),
+            "required")
+        (status, response) = self.call([
+            {"method": "NarrativeService.get_ignore_categories", "params": [],
+             "version": "1.1", "id": "1"},
+            {"method": "NarrativeService.copy_narrative",
+             "params": [{"newName": "x", "workspaceRef": "1/1"}], "version": "1.1", "id": "2"}
+        ])
+        self.assertEqual(status, "500 Internal Server Error")
+        self.assertIn("Authentication required", response["error"]["message"])
@@ -0,0 +1,105 @@
+import datetime
+import json
+import math
+import unittest
+from unittest import mock
+
+from NarrativeService.util import json_codec
+
+
+class JSONable:
+    def toJSONable(self):
+        return {"a": 1}
+
+
+class JsonCodecTestCase(unittest.TestCase):
+    def codecs(self):
+        codecs = [json_codec.get_codec("json")]
+        if json_codec.orjson is not None:
+            codecs.append(json_codec.get_codec("orjson"))
+        return codecs
+
+    def test_round_trip(self):
+        obj = {"s": "é", "i": 2**70, "f": 1.5, "l": [1, None, True], "t": (1, 2), 1: "x",
+               "set": {3}, "fs": frozenset(), "j": JSONable()}
+        expected = {"s": "é", "i": 2**70, "f": 1.5, "l": [1, None, True], "t": [1, 2], "1": "x",
+                    "set": [3], "fs": [], "j": {"a": 1}}
+        for codec in self.codecs():
+            with self.subTest(codec=codec.name):
+                self.assertEqual(json.loads(codec.dumps_bytes(obj)), expected)
+                self.assertEqual(json.loads(codec.dumps(obj)), expected)
+                self.assertEqual(codec.loads(codec.dumps_bytes(obj)), expected)
+                self.assertEqual(codec.loads(codec.dumps(obj)), expected)
+
+    def test_bad_input(self):
+        for codec in self.codecs():
+            with self.subTest(codec=codec.name):
+                with self.assertRaises(TypeError):
+                    codec.dumps({"x": object()})
+                with self.assertRaises(ValueError):
+                    codec.loads(b"{nope")
+                self.assertTrue(math.isnan(codec.loads(b"{\"x\": NaN}")["x"]))
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            json_codec.get_codec("nope")
+
+    def test_same_as_json_module(self):
+        obj = {"s": "é", "keys": {1: "a", 2.5: "b", True: "c", None: "d"}}
+        for codec in self.codecs():
+            with self.subTest(codec=codec.name):
+                self.assertEqual(json.loads(codec.dumps(obj)), json.loads(json.dumps(obj)))
+                # keys that are the same once they're strings are both kept, as json does
+                self.assertEqual(codec.dumps({1: "x", "1": "y"}).replace(" ", ""),
+                                 '{"1":"x","1":"y"}')
+                with self.assertRaises(TypeError):
+                    codec.dumps({"d": datetime.datetime.now()})
+
+    def test_nan(self):
+        obj = {"nan": float("nan"), "inf": float("inf")}
+        self.assertEqual(json_codec.get_codec("json").dumps(obj),
+                         '{"nan": NaN, "inf": Infinity}')
+        if json_codec.orjson is not None:
+            self.assertEqual(json_codec.get_codec("orjson").dumps(obj),
+                             '{"nan":null,"inf":null}')
+
+    def test_client_call(self):
+        from installed_clients import baseclient
+        call = json_codec._client_call(baseclient)
+        client = baseclient.BaseClient("http://localhost/ws", token="t")
+        ok = mock.Mock(status_code=200, ok=True, content=b'{"result": [{"x": [1, 2]}]}')
+        with mock.patch.object(baseclient._requests, "post", return_value=ok) as post:
+            self.assertEqual(call(client, "http://localhost/ws", "Workspace.m", [{"s": {3}}]),
+                             {"x": [1, 2]})
+        body = json.loads(post.call_args[1]["data"])
+        self.assertEqual(body["method"], "Workspace.m")
+        self.assertEqual(body["params"], [{"s": [3]}])
+        self.assertEqual(post.call_args[1]["headers"], client._headers)
+
+        ok.content = b'{"result": []}'
+        with mock.patch.object(baseclient._requests, "post", return_value=ok):
+            self.assertIsNone(call(client, "http://localhost/ws", "Workspace.m", []))
+
+        err = mock.Mock(status_code=500, headers={"content-type": "application/json"},
+                        content=b'{"error": {"name": "JSONRPCError", "code": -32500, '
+                                b'"message": "no", "error": "trace"}}')
+        with mock.patch.object(baseclient._requests, "post", return_value=err):
+            with self.assertRaises(baseclient.ServerError) as e:
+                call(client, "http://localhost/ws", "Workspace.m", [])
+        self.assertEqual(e.exception.message, "no")
+        with self.assertRaises(ValueError):
+            call(client, "http://localhost/ws", "Workspace.m", [], context="nope")
+
+    def test_install_in_clients(self):
+        from installed_clients import baseclient as installed_baseclient
+        from NarrativeService import baseclient
+        calls = (installed_baseclient.BaseClient._call, baseclient.BaseClient._call)
+        try:
+            json_codec.install_in_clients()
+            installed = (installed_baseclient.BaseClient._call, baseclient.BaseClient._call)
+            self.assertTrue(all(c._json_codec for c in installed))
+            json_codec.install_in_clients()
+            self.assertEqual((installed_baseclient.BaseClient._call, baseclient.BaseClient._call),
+                             installed)
+        finally:
+            installed_baseclient.BaseClient._call, baseclient.BaseClient._call = calls
@@ -0,0 +1,24 @@
+import sys
+import unittest
+
+from NarrativeService.util.lazy import lazy_import
+
+
+class LazyImportTestCase(unittest.TestCase):
+    def test_lazy_name(self):
+        sys.modules.pop("installed_clients.KBaseReportClient", None)
+        KBaseReport = lazy_import("installed_clients.KBaseReportClient", "KBaseReport")
+        self.assertNotIn("installed_clients.KBaseReportClient", sys.modules)
+        client = KBaseReport("http://localhost:9999", token="fake")
+        self.assertIn("installed_clients.KBaseReportClient", sys.modules)
+        self.assertEqual(type(client).__name__, "KBaseReport")
+        self.assertEqual(KBaseReport.__name__, "KBaseReport")
+
+    def test_lazy_module(self):
+        parser = lazy_import("dateutil.parser")
+        self.assertEqual(parser.parse("2019-05-01T12:00:00+0000").year, 2019)
+
+    def test_missing(self):
+        missing = lazy_import("installed_clients.NotAClient", "NotAClient")
+        with self.assertRaises(ImportError):
+            missing()
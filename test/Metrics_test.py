@@ -0,0 +1,98 @@
+import io
+import unittest
+from unittest import mock
+
+from installed_clients.baseclient import BaseClient, ServerError
+from NarrativeService.util import metrics
+from NarrativeService.util.metrics import MetricsRegistry
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_rpc_histogram(self):
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        registry.observe_rpc("NarrativeService.list_narratives", 0.05)
+        registry.observe_rpc("NarrativeService.list_narratives", 0.5, error=True)
+        registry.observe_rpc("NarrativeService.list_narratives", 5)
+        stats = registry.snapshot()["rpc"]["NarrativeService.list_narratives"]
+        self.assertEqual(stats["count"], 3)
+        self.assertEqual(stats["errors"], 1)
+        self.assertAlmostEqual(stats["sum"], 5.55)
+        self.assertEqual(stats["buckets"], {"0.1": 1, "1.0": 2, "+Inf": 3})
+
+    def test_upstream_timer(self):
+        registry = MetricsRegistry()
+        with registry.time_upstream("Workspace", "list_objects"):
+            pass
+        with self.assertRaises(ValueError):
+            with registry.time_upstream("Workspace", "list_objects"):
+                raise ValueError("nope")
+        stats = registry.snapshot()["upstream"]["Workspace.list_objects"]
+        self.assertEqual(stats["count"], 2)
+        self.assertEqual(stats["errors"], 1)
+
+    def test_cache_counts(self):
+        registry = MetricsRegistry()
+        registry.count_cache("narrative_info", hits=3, misses=1)
+        registry.count_cache("narrative_info", misses=4)
+        self.assertEqual(registry.snapshot()["cache"]["narrative_info"],
+                         {"hits": 3, "misses": 5, "hit_ratio": 0.375})
+
+    def test_prometheus_text(self):
+        registry = MetricsRegistry(buckets=(1.0,))
+        registry.observe_rpc("NarrativeService.status", 0.5)
+        registry.observe_upstream("Set\"API", "list_sets", 2, error=True)
+        registry.count_cache("auth_token", hits=1)
+        lines = registry.prometheus_text().split("\n")
+        self.assertIn('narrative_service_rpc_duration_seconds_bucket'
+                      '{method="NarrativeService.status",le="1.0"} 1', lines)
+        self.assertIn('narrative_service_rpc_duration_seconds_count'
+                      '{method="NarrativeService.status"} 1', lines)
+        self.assertIn('narrative_service_upstream_duration_seconds_bucket'
+                      '{service="Set\\"API",method="list_sets",le="1.0"} 0', lines)
+        self.assertIn('narrative_service_upstream_errors_total'
+                      '{service="Set\\"API",method="list_sets"} 1', lines)
+        self.assertIn('narrative_service_cache_requests_total{cache="auth_token",result="miss"} 0',
+                      lines)
+
+    def test_instrument_clients(self):
+        metrics.registry.reset()
+        with mock.patch.object(BaseClient, "_call") as call:
+            call.side_effect = [{"x": 1}, ServerError("err", 500, "nope")]
+            metrics.instrument_clients()
+            metrics.instrument_clients()
+            client = BaseClient("https://ws.example.com", lookup_url=False)
+            self.assertEqual(client.call_method("Workspace.get_objects2", [{}]), {"x": 1})
+            with self.assertRaises(ServerError):
+                client.call_method("Workspace.get_objects2", [{}])
+        stats = metrics.registry.snapshot()["upstream"]["Workspace.get_objects2"]
+        self.assertEqual(stats["count"], 2)
+        self.assertEqual(stats["errors"], 1)
+
+    def get(self, path):
+        from NarrativeService.NarrativeServiceServer import application
+        environ = {"REQUEST_METHOD": "GET", "PATH_INFO": path, "CONTENT_LENGTH": "0",
+                   "wsgi.input": io.BytesIO(b""), "REMOTE_ADDR": "127.0.0.1"}
+        started = list()
+        body = b"".join(application(environ, lambda status, headers: started.append(status)))
+        return started[0], body
+
+    def test_metrics_endpoint(self):
+        from NarrativeService.NarrativeServiceServer import application
+        metrics_path = application.metrics_path
+        try:
+            # off by default
+            application.metrics_path = None
+            (status, body) = self.get("/metrics")
+            self.assertNotEqual(status, "200 OK")
+            self.assertNotIn(b"narrative_service_", body)
+
+            application.metrics_path = "/metrics"
+            (status, body) = self.get("/metrics")
+            self.assertEqual(status, "200 OK")
+            self.assertIn(b"narrative_service_", body)
+            for path in ["/anything/metrics", "/metrics/", "/rpc/metrics"]:
+                with self.subTest(path=path):
+                    (status, body) = self.get(path)
+                    self.assertNotEqual(status, "200 OK")
+        finally:
+            application.metrics_path = metrics_path
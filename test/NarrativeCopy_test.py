@@ -0,0 +1,87 @@
+import copy
+import json
+import unittest
+
+from NarrativeService.NarrativeManager import NarrativeManager
+
+
+def nar_info(version, meta):
+    return [1, "Narrative.1", "KBaseNarrative.Narrative-4.0", "2019-05-01T12:00:00+0000",
+            version, "user", 10, "user:narrative_1", "chsum", 100, meta]
+
+
+class CopyWsMock:
+    """
+    A workspace 10 with a Narrative (object 1) at versions 1 to 2. Records the calls made.
+    """
+    def __init__(self, meta, data):
+        self.meta = meta
+        self.data = data
+        self.calls = list()
+
+    def get_objects2(self, params):
+        self.calls.append("get_objects2")
+        parts = params["objects"][0]["ref"].split("/")
+        return {"data": [{"info": nar_info(int(parts[2]) if len(parts) > 2 else 2,
+                                           dict(self.meta)),
+                          "data": copy.deepcopy(self.data)}]}
+
+    def get_objects(self, refs):
+        self.calls.append("get_objects")
+        version = int(refs[0]["ref"].split("/")[2]) if refs[0]["ref"].count("/") > 1 else 2
+        return [{"info": nar_info(version, dict(self.meta)), "data": copy.deepcopy(self.data),
+                 "provenance": []}]
+
+    def clone_workspace(self, params):
+        self.calls.append("clone_workspace")
+        self.cloned = params
+        return [20]
+
+    def save_objects(self, params):
+        self.calls.append("save_objects")
+        self.saved = params["objects"][0]
+        return [[1]]
+
+    def alter_workspace_metadata(self, params):
+        self.calls.append("alter_workspace_metadata")
+
+
+class NarrativeCopyTestCase(unittest.TestCase):
+    def copy(self, ws, ref, new_name="Copy"):
+        nm = NarrativeManager({"narrative-method-store": "https://nms.example.com",
+                               "intro-markdown-file": "intro.md"}, "user", None, None, ws)
+        return nm.copy_narrative(new_name, ref, None, fastCopy=True)
+
+    def test_fast_copy(self):
+        ws = CopyWsMock({"name": "Copy", "is_temporary": "false"},
+                        {"cells": [{"cell_type": "markdown"}] * 3, "metadata": {"name": "Copy"}})
+        self.assertEqual(self.copy(ws, "10/1"), {"newWsId": 20, "newNarId": 1})
+        self.assertEqual(ws.calls, ["get_objects2", "clone_workspace"])
+        self.assertEqual(ws.cloned["meta"]["cell_count"], "3")
+        self.assertNotIn("exclude", ws.cloned)
+
+    def test_fast_copy_renamed(self):
+        # a Narrative as the Narrative interface saves it, copied under a new name
+        job_info = json.dumps({"queue_time": 5, "running": 0, "completed": 2, "run_time": 9,
+                               "error": 0})
+        ws = CopyWsMock(
+            {"name": "My Narrative", "ws_name": "user:narrative_1", "job_info": job_info,
+             "is_temporary": "false", "creator": "user", "format": "ipynb"},
+            {"cells": [{"cell_type": "markdown"}, {"cell_type": "code"}],
+             "metadata": {"name": "My Narrative", "ws_name": "user:narrative_1",
+                          "job_ids": {"apps": [{"id": "job1"}], "methods": []}}})
+        self.assertEqual(self.copy(ws, "10/1/2", "My Narrative - Copy"),
+                         {"newWsId": 20, "newNarId": 1})
+        self.assertEqual(ws.calls, ["get_objects2", "clone_workspace"])
+        self.assertEqual(ws.cloned["meta"], {
+            "narrative_nice_name": "My Narrative - Copy", "searchtags": "narrative",
+            "narrative": "1", "is_temporary": "false", "cell_count": "2"})
+
+    def test_old_version(self):
+        ws = CopyWsMock({"name": "Copy"}, {"cells": [], "metadata": {}})
+        self.copy(ws, "10/1/1")
+        self.assertIn("save_objects", ws.calls)
+        # the version asked for is copied, not the latest one
+        self.assertEqual(ws.calls[1:3], ["get_objects", "clone_workspace"])
+        self.assertEqual(ws.cloned["exclude"], [{"objid": 1}])
+        self.assertEqual(ws.saved["meta"]["ws_name"], ws.cloned["workspace"])
@@ -0,0 +1,80 @@
+import threading
+import unittest
+
+from NarrativeService.NarrativeManager import NarrativeManager
+
+WS_ID = 10
+
+
+def obj_info(obj_id, name, ws_id=WS_ID, save_date="2019-05-01T12:00:00+0000"):
+    return [obj_id, name, "KBaseGenomes.Genome-1.0", save_date, 1, "user", ws_id,
+            "ws_" + str(ws_id), "chsum", 100, {}]
+
+
+class CreateWsMock:
+    """
+    Makes workspace WS_ID. alter_workspace_metadata waits for a copy to start, and the copies
+    wait for each other, so create_new_narrative only finishes if they all overlap.
+    """
+    def __init__(self, num_copies):
+        self.copies_started = threading.Barrier(num_copies, timeout=5)
+        self.copy_started = threading.Event()
+        self.meta = {}
+        self.lock = threading.Lock()
+        self.calls = list()
+
+    def _call(self, name):
+        with self.lock:
+            self.calls.append(name)
+
+    def create_workspace(self, params):
+        self._call("create_workspace")
+        return [WS_ID, params["workspace"], "user", "2019-05-01T12:00:00+0000", 0, "a", "n",
+                "unlocked", {}]
+
+    def save_objects(self, params):
+        self._call("save_objects")
+        return [obj_info(1, params["objects"][0]["name"])]
+
+    def alter_workspace_metadata(self, params):
+        self._call("alter_workspace_metadata")
+        if not self.copy_started.wait(5):
+            raise RuntimeError("The metadata update didn't overlap the copies")
+        self.meta.update(params["new"])
+
+    def get_object_info_new(self, params):
+        self._call("get_object_info_new")
+        return [obj_info(int(o["ref"].split("/")[1]), "obj" + o["ref"].split("/")[1], 5)
+                for o in params["objects"]]
+
+    def copy_object(self, params):
+        self._call("copy_object")
+        self.copy_started.set()
+        self.copies_started.wait()
+        obj_id = int(params["from"]["ref"].split("/")[1]) + 1
+        return obj_info(obj_id, params["to"]["name"],
+                        save_date="2019-05-01T12:0{}:00+0000".format(obj_id))
+
+
+class NarrativeCreateTestCase(unittest.TestCase):
+    def test_create_parallel(self):
+        ws = CreateWsMock(3)
+        nm = NarrativeManager({"narrative-method-store": "https://nms.example.com",
+                               "intro-markdown-file": "intro.md"}, "user", None, None, ws)
+        result = nm.create_new_narrative(None, None, None, None, None, None,
+                                         ["5/1", "5/2", "5/3"], 0, "My Narrative")
+        self.assertEqual(ws.calls.count("copy_object"), 3)
+        # the workspace info is put together without fetching it again
+        self.assertNotIn("get_workspace_info", ws.calls)
+        ws_info = result["workspaceInfo"]
+        self.assertEqual(ws_info["id"], WS_ID)
+        self.assertEqual(ws_info["object_count"], 4)
+        self.assertEqual(ws_info["moddate"], "2019-05-01T12:04:00+0000")
+        self.assertEqual(ws_info["metadata"], ws.meta)
+        self.assertEqual(ws_info["metadata"], {"narrative": "1", "is_temporary": "false",
+                                               "searchtags": "narrative", "cell_count": "0",
+                                               "narrative_nice_name": "My Narrative"})
+        self.assertEqual(result["narrativeInfo"]["id"], 1)
+        self.assertEqual(set(nm.step_times), {"create_workspace", "fetch_narrative_objects",
+                                              "save_objects", "alter_workspace_metadata",
+                                              "copy_import_data"})
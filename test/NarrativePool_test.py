@@ -0,0 +1,151 @@
+import time
+import unittest
+
+from NarrativeService.NarrativeManager import NarrativeManager
+from NarrativeService.narrative.pool import NarrativePool, POOL_META_KEY, POOL_META_UNCLAIMED
+
+
+def ws_info(ws_id, meta, moddate="2019-05-01T12:00:00+0000"):
+    return [ws_id, "some_user:narrative_1", "some_user", moddate, 1, "a", "n", "unlocked", meta]
+
+
+class PoolWsMock:
+    def __init__(self, pooled=None):
+        self.altered = list()
+        self.deleted = list()
+        self.pooled = pooled or list()  # infos of the user's pooled workspaces
+        self.meta = dict()
+
+    def alter_workspace_metadata(self, params):
+        self.altered.append(params)
+        meta = self.meta.setdefault(params["wsi"]["id"], {POOL_META_KEY: POOL_META_UNCLAIMED})
+        meta.update(params["new"])
+        for key in params.get("remove", []):
+            meta.pop(key, None)
+
+    def get_workspace_info(self, params):
+        return ws_info(params["id"], dict(self.meta[params["id"]]),
+                       time.strftime("%Y-%m-%dT%H:%M:%S+0000", time.gmtime()))
+
+    def list_workspace_info(self, params):
+        assert params == {"owners": ["some_user"], "meta": {POOL_META_KEY: POOL_META_UNCLAIMED}}
+        return self.pooled
+
+    def delete_workspace(self, params):
+        self.deleted.append(params["id"])
+
+
+class PoolNarrativeManagerMock(NarrativeManager):
+    """
+    Uses the real claim_pooled_narrative, but fakes creating the pooled Narratives.
+    """
+    def __init__(self, user_id, narrative_pool, ws):
+        super().__init__({"narrative-method-store": "https://nms.example.com",
+                          "intro-markdown-file": "intro.md"},
+                         user_id, None, None, ws, narrative_pool, "some_token")
+        self.created = 0
+
+    def create_pooled_narrative(self, includeIntroCell):
+        self.created += 1
+        return {
+            "workspaceInfo": {"id": self.created,
+                              "metadata": {"is_temporary": "true", "cell_count": "1",
+                                           POOL_META_KEY: POOL_META_UNCLAIMED}},
+            "narrativeInfo": {"id": 1}
+        }
+
+
+class PoolTestBase(unittest.TestCase):
+    def make_pool(self, size, pooled=None, max_age=3600):
+        """
+        Makes a pool whose refills all use one manager, self.refill_nm, and a manager for the
+        requests, self.nm, with the same workspace.
+        """
+        self.ws = PoolWsMock(pooled)
+        self.tokens = list()
+        pool = NarrativePool(size, self.make_manager, max_age=max_age)
+        self.refill_nm = PoolNarrativeManagerMock("some_user", None, self.ws)
+        self.nm = PoolNarrativeManagerMock("some_user", pool, self.ws)
+        return pool
+
+    def make_manager(self, user_id, token):
+        self.assertEqual(user_id, "some_user")
+        self.tokens.append(token)
+        return self.refill_nm
+
+
+def wait_for_pool(pool, user_id, size, timeout=5):
+    end = time.time() + timeout
+    while (pool.pool_size(user_id) < size or user_id in pool._refilling) and time.time() < end:
+        time.sleep(0.01)
+
+
+class NarrativePoolTestCase(PoolTestBase):
+    def test_pool_off(self):
+        pool = self.make_pool(0)
+        self.assertIsNone(pool.claim(self.nm, 1, "some_token"))
+        self.assertEqual(self.refill_nm.created, 0)
+        self.assertEqual(self.tokens, [])
+
+    def test_claim_and_refill(self):
+        pool = self.make_pool(2)
+        # nothing's in the pool yet, but asking fills it.
+        self.assertIsNone(pool.claim(self.nm, 1, "some_token"))
+        wait_for_pool(pool, "some_user", 2)
+        self.assertEqual(pool.pool_size("some_user"), 2)
+        # the refill used its own manager, made from the token
+        self.assertEqual(self.tokens, ["some_token"])
+        self.assertEqual(self.nm.created, 0)
+
+        before = time.time()
+        narr_info = pool.claim(self.nm, 1, "some_token")
+        self.assertIsNotNone(narr_info)
+        ws_info = narr_info["workspaceInfo"]
+        self.assertEqual(ws_info["metadata"]["narrative"], "1")
+        self.assertEqual(ws_info["metadata"]["searchtags"], "narrative")
+        self.assertNotIn(POOL_META_KEY, ws_info["metadata"])
+        self.assertEqual(self.ws.altered[-1]["remove"], [POOL_META_KEY])
+        # the workspace info is fetched after the claim, not kept from when it was made
+        self.assertGreaterEqual(ws_info["modDateMs"], int(before) * 1000)
+        wait_for_pool(pool, "some_user", 2)
+        self.assertEqual(self.refill_nm.created, 3)
+
+    def test_pool_not_used_with_other_intro_cell_setting(self):
+        pool = self.make_pool(1)
+        pool.refill("some_user", "some_token")
+        wait_for_pool(pool, "some_user", 1)
+        self.assertIsNone(pool.claim(self.nm, 0, "some_token"))
+        self.assertEqual(pool.pool_size("some_user"), 1)
+
+    def test_create_new_narrative_uses_pool(self):
+        pool = self.make_pool(1)
+        pool.refill("some_user", "some_token")
+        wait_for_pool(pool, "some_user", 1)
+        narr_info = self.nm.create_new_narrative(None, None, None, None, None, None, None, 1,
+                                                 None)
+        self.assertEqual(narr_info["workspaceInfo"]["id"], 1)
+
+    def test_expired_not_claimed(self):
+        pool = self.make_pool(1, max_age=0.05)
+        pool.refill("some_user", "some_token")
+        wait_for_pool(pool, "some_user", 1)
+        time.sleep(0.1)
+        self.assertIsNone(pool.claim(self.nm, 1, "some_token"))
+        self.assertEqual(self.ws.altered, [])
+        wait_for_pool(pool, "some_user", 1)
+        self.assertEqual(self.refill_nm.created, 2)
+
+    def test_old_pooled_narratives_deleted(self):
+        now = time.strftime("%Y-%m-%dT%H:%M:%S+0000", time.gmtime())
+        pool = self.make_pool(1, pooled=[
+            ws_info(20, {POOL_META_KEY: POOL_META_UNCLAIMED}),
+            ws_info(21, {POOL_META_KEY: POOL_META_UNCLAIMED}, now)
+        ])
+        pool.refill("some_user", "some_token")
+        wait_for_pool(pool, "some_user", 1)
+        # the new one might be another process's
+        self.assertEqual(self.ws.deleted, [20])
+        # and it isn't looked for again until max_age has passed
+        pool.claim(self.nm, 1, "some_token")
+        wait_for_pool(pool, "some_user", 1)
+        self.assertEqual(self.ws.deleted, [20])
@@ -422,6 +422,40 @@ class NarrativeServiceTest(unittest.TestCase):
             self.getWsClient().delete_workspace({'id': copied_nar_info2['newWsId']})
             self.getWsClient().delete_workspace({'id': copied_nar_info3['newWsId']})
 
+    # @unittest.skip
+    def test_fast_copy_narrative(self):
+        ws = self.getWsClient()
+        source_nar_info = self.getImpl().create_new_narrative(self.getContext(), {
+            'includeIntroCell': 1,
+            'title': 'Fast Copy Source'
+        })[0]
+        source_ws_id = source_nar_info['workspaceInfo']['id']
+        source_nar_id = source_nar_info['narrativeInfo']['id']
+        copy_nar_name = 'Fast Copy Source - Copy'
+        ret = self.getImpl().copy_narrative(self.getContext(), {
+            'workspaceRef': '{}/{}'.format(source_ws_id, source_nar_id),
+            'newName': copy_nar_name,
+            'fastCopy': 1
+        })[0]
+        copy_ws_id = ret['newWsId']
+        try:
+            self.assertNotEqual(source_ws_id, copy_ws_id)
+            copy_ws_info = ws.get_workspace_info({'id': copy_ws_id})
+            copy_nar = ws.get_objects2({'objects': [{
+                'ref': '{}/{}'.format(copy_ws_id, ret['newNarId'])
+            }]})['data'][0]
+            # the cloned object keeps the source's metadata until it's next saved
+            source_ws_info = ws.get_workspace_info({'id': source_ws_id})
+            self.assertEqual(copy_nar['info'][10]['ws_name'], source_ws_info[1])
+            self.assertEqual(copy_ws_info[8]['narrative'], str(ret['newNarId']))
+            self.assertEqual(copy_ws_info[8]['narrative_nice_name'], copy_nar_name)
+            self.assertEqual(copy_ws_info[8]['searchtags'], 'narrative')
+            self.assertEqual(copy_ws_info[8]['is_temporary'], 'false')
+            self.assertEqual(copy_ws_info[8]['cell_count'], str(len(copy_nar['data']['cells'])))
+        finally:
+            ws.delete_workspace({'id': source_ws_id})
+            ws.delete_workspace({'id': copy_ws_id})
+
     # @unittest.skip
     def test_copy_narrative_two_users(self):
         # Create workspace with Reads object for user1
@@ -622,6 +656,23 @@ class NarrativeServiceTest(unittest.TestCase):
                                                              'target_ws_name': ws_name})
         self.assertEqual(target_name, ret[0]['info']['name'])
 
+    # @unittest.skip
+    def test_copy_objects(self):
+        ws_name = self.createWs()
+        import_ref = self.__class__.example_reads_ref
+        bad_ref = ws_name + '/not_an_object'
+        ret = self.getImpl().copy_objects(self.getContext(), {'refs': [import_ref, bad_ref],
+                                                              'target_ws_name': ws_name})[0]
+        self.assertEqual(len(ret['results']), 2)
+        self.assertIn('info', ret['results'][0])
+        self.assertEqual(ws_name, ret['results'][0]['info']['ws'])
+        self.assertNotIn('error', ret['results'][0])
+        self.assertIn('error', ret['results'][1])
+        self.assertNotIn('info', ret['results'][1])
+
+        with self.assertRaises(ValueError):
+            self.getImpl().copy_objects(self.getContext(), {'refs': [import_ref]})
+
     # @unittest.skip
     def test_copy_object_two_users(self):
         ws_name1 = self.createWs()
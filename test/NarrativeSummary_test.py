@@ -0,0 +1,57 @@
+import json
+import os
+import unittest
+
+from NarrativeService.narrative.summary import (
+    SUMMARY_PATHS,
+    get_narrative_summary,
+    summarize_narrative_data
+)
+
+
+class SummaryWsMock:
+    def __init__(self, data):
+        self.data = data
+        self.params = None
+
+    def get_objects2(self, params):
+        self.params = params
+        return {"data": [{"info": [1, "Narrative.1", "KBaseNarrative.Narrative-4.0"], "data": self.data}]}
+
+
+class NarrativeSummaryTestCase(unittest.TestCase):
+    def test_summarize_narrative_file(self):
+        nar_file = os.path.join(os.path.dirname(__file__), "data", "narrative1.json")
+        with open(nar_file, "r") as f:
+            nar_data = json.load(f)
+        summary = summarize_narrative_data(nar_data)
+        self.assertEqual(summary["cell_count"], len(nar_data["cells"]))
+        self.assertEqual(summary["cell_types"], {"markdown": 1})
+        self.assertEqual(summary["job_ids"], [])
+
+    def test_summarize_cell_types_and_jobs(self):
+        nar_data = {
+            "cells": [
+                {"cell_type": "markdown"},
+                {"cell_type": "code", "metadata": {"kbase": {"type": "app", "appCell": {
+                    "exec": {"jobState": {"job_id": "job1"}}}}}},
+                {"cell_type": "code", "metadata": {"kbase": {"type": "output"}}},
+                {"cell_type": "code"}
+            ],
+            "metadata": {"job_ids": {"apps": [{"id": "job2"}], "methods": [], "job_usage": {}}}
+        }
+        summary = summarize_narrative_data(nar_data)
+        self.assertEqual(summary["cell_count"], 4)
+        self.assertEqual(summary["cell_types"], {"markdown": 1, "app": 1, "output": 1, "code": 1})
+        self.assertEqual(summary["job_ids"], ["job1", "job2"])
+
+    def test_summarize_legacy(self):
+        nar_data = {"worksheets": [{"cells": [{"cell_type": "markdown"}, {"cell_type": "code"}]}]}
+        self.assertEqual(summarize_narrative_data(nar_data)["cell_count"], 2)
+
+    def test_get_narrative_summary_uses_subset(self):
+        ws = SummaryWsMock({"cells": [{"cell_type": "markdown"}, {"cell_type": "code"}]})
+        summary = get_narrative_summary(ws, "1/2/3")
+        self.assertEqual(ws.params["objects"], [{"ref": "1/2/3", "included": SUMMARY_PATHS}])
+        self.assertEqual(summary["cell_count"], 2)
+        self.assertEqual(summary["info"][1], "Narrative.1")
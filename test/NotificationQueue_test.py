@@ -0,0 +1,179 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from NarrativeService import feeds
+from NarrativeService.feeds import NotificationQueue
+from NarrativeService.sharing.sharemanager import ShareRequester
+
+
+class FeedsSessionMock:
+    """
+    Stands in for the requests.Session the queue's worker uses. Records the notes posted, fails
+    the first `failures` posts, and takes `delay` seconds for each.
+    """
+    posted = list()
+    failures = 0
+    delay = 0
+    lock = threading.Lock()
+
+    def post(self, url, json=None, headers=None):
+        time.sleep(FeedsSessionMock.delay)
+        response = mock.Mock(status_code=200, text="")
+        with FeedsSessionMock.lock:
+            if FeedsSessionMock.failures > 0:
+                FeedsSessionMock.failures -= 1
+                response.status_code = 500
+                response.text = "Feeds is down"
+            else:
+                FeedsSessionMock.posted.append(json)
+        response.json.return_value = {"id": str(len(FeedsSessionMock.posted))}
+        return response
+
+
+def share_note(ws_id, user="someone", level="r"):
+    return {"actor": {"type": "user", "id": user}, "verb": "request",
+            "object": {"type": "narrative", "id": ws_id}, "context": {"level": level}}
+
+
+@mock.patch("NarrativeService.feeds.requests.Session", FeedsSessionMock)
+class NotificationQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        FeedsSessionMock.posted = list()
+        FeedsSessionMock.failures = FeedsSessionMock.delay = 0
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_send(self):
+        queue = NotificationQueue("feeds", "token")
+        for ws_id in range(50):
+            self.assertTrue(queue.put(share_note(ws_id)))
+        self.assertTrue(queue.join(5))
+        self.assertEqual([note["object"]["id"] for note in FeedsSessionMock.posted],
+                         list(range(50)))
+        self.assertEqual(FeedsSessionMock.posted[0]["source"], feeds.SERVICE_NAME)
+        self.assertEqual(len(queue), 0)
+
+    def test_dedup_and_full(self):
+        FeedsSessionMock.delay = 0.05
+        queue = NotificationQueue("feeds", "token", max_size=3)
+        self.assertTrue(queue.put(share_note(1), key=(1, "someone", "r")))
+        self.assertTrue(queue.put(share_note(1), key=(1, "someone", "r")))
+        self.assertTrue(queue.put(share_note(1, level="w"), key=(1, "someone", "w")))
+        self.assertTrue(queue.put(share_note(2)))
+        self.assertFalse(queue.put(share_note(3)))
+        self.assertTrue(queue.join(5))
+        self.assertEqual(len(FeedsSessionMock.posted), 3)
+        # once it's sent, the same request can be made again
+        self.assertTrue(queue.put(share_note(1), key=(1, "someone", "r")))
+        self.assertTrue(queue.join(5))
+        self.assertEqual(len(FeedsSessionMock.posted), 4)
+
+    def test_retries(self):
+        FeedsSessionMock.failures = 3
+        queue = NotificationQueue("feeds", "token", retry_delay=0.01)
+        queue.put(share_note(1))
+        self.assertTrue(queue.join(5))
+        self.assertEqual(len(FeedsSessionMock.posted), 1)
+
+        FeedsSessionMock.failures = 10
+        queue = NotificationQueue("feeds", "token", max_attempts=3, retry_delay=0.01)
+        queue.put(share_note(2), key=(2, "someone", "r"))
+        self.assertTrue(queue.join(5))
+        self.assertEqual(len(FeedsSessionMock.posted), 1)
+        self.assertEqual(FeedsSessionMock.failures, 7)
+
+    def test_spool(self):
+        FeedsSessionMock.failures = 100
+        spool_dir = os.path.join(self.dir, "spool")
+        queue = NotificationQueue("feeds", "token", spool_dir=spool_dir, retry_delay=60)
+        queue.put(share_note(1), key=(1, "someone", "r"))
+        queue.put(share_note(2))
+        self.assertEqual(len(os.listdir(spool_dir)), 2)
+        # wait for both to fail once, they're not retried for a minute
+        while FeedsSessionMock.failures > 98:
+            time.sleep(0.01)
+        # pretend it was left by a stopped process
+        for name in os.listdir(spool_dir):
+            os.rename(os.path.join(spool_dir, name),
+                      os.path.join(spool_dir, "999999999-" + name.split("-", 1)[1]))
+
+        FeedsSessionMock.failures = 0
+        queue = NotificationQueue("feeds", "token", spool_dir=spool_dir)
+        # the recovered request still counts for dedup
+        queue.put(share_note(1), key=(1, "someone", "r"))
+        self.assertTrue(queue.join(5))
+        self.assertEqual(sorted(note["object"]["id"] for note in FeedsSessionMock.posted), [1, 2])
+        self.assertEqual(os.listdir(spool_dir), [])
+
+    def test_given_up_kept(self):
+        FeedsSessionMock.failures = 100
+        spool_dir = os.path.join(self.dir, "feed_notifications")
+        queue = NotificationQueue("feeds", "token", spool_dir=spool_dir, max_attempts=2,
+                                  retry_delay=0.01)
+        with self.assertLogs(feeds.logger, "ERROR") as logs:
+            queue.put(share_note(1))
+            self.assertTrue(queue.join(5))
+        self.assertIn("kept in", logs.output[0])
+        self.assertEqual(len(queue), 0)
+        names = os.listdir(spool_dir)
+        self.assertEqual(len(names), 1)
+        os.rename(os.path.join(spool_dir, names[0]),
+                  os.path.join(spool_dir, "999999999-" + names[0].split("-", 1)[1]))
+
+        # it's sent when the next process starts, without waiting for a put
+        FeedsSessionMock.failures = 0
+        queue = NotificationQueue.from_config({
+            "feed-notification-queue-size": "10", "feed-notification-spool": "true",
+            "scratch": self.dir, "feeds-url": "feeds", "service-token": "token"})
+        self.assertTrue(queue.join(5))
+        self.assertEqual([note["object"]["id"] for note in FeedsSessionMock.posted], [1])
+        self.assertEqual(os.listdir(spool_dir), [])
+
+    def test_fork(self):
+        FeedsSessionMock.failures = 100
+        queue = NotificationQueue("feeds", "token", retry_delay=60)
+        queue.start()
+        queue.put(share_note(1), key=(1, "someone", "r"))
+        pid = os.fork()
+        if pid == 0:
+            # the child has its own worker, and the parent's notifications aren't its to send or
+            # dedup against
+            FeedsSessionMock.failures = 0
+            ok = (len(queue) == 0 and queue._worker.is_alive() and
+                  queue.put(share_note(2), key=(1, "someone", "r")) and queue.join(5) and
+                  [note["object"]["id"] for note in FeedsSessionMock.posted] == [2])
+            os._exit(0 if ok else 1)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertEqual(len(queue), 1)
+
+    def test_from_config(self):
+        self.assertIsNone(NotificationQueue.from_config({"feed-notification-queue-size": "0"}))
+        queue = NotificationQueue.from_config({
+            "feed-notification-queue-size": "10", "feed-notification-spool": "true",
+            "scratch": self.dir, "feeds-url": "feeds", "service-token": "token"})
+        self.assertEqual(queue.max_size, 10)
+        self.assertEqual(queue.spool_dir, os.path.join(self.dir, "feed_notifications"))
+
+    @mock.patch("NarrativeService.util.workspace.get_ws_admins", return_value=["owner"])
+    def test_request_share(self, mock_admins):
+        FeedsSessionMock.delay = 0.2
+        config = {"service-token": "token", "ws-admin-token": "token", "workspace-url": "ws",
+                  "feeds-url": "feeds"}
+        queue = NotificationQueue("feeds", "token")
+        start = time.time()
+        for _ in range(3):
+            requester = ShareRequester({"ws_id": 5, "user": "someone", "share_level": "r"},
+                                       config, queue)
+            self.assertEqual(requester.request_share(), {"ok": 1})
+        self.assertLess(time.time() - start, 0.1)
+        self.assertTrue(queue.join(5))
+        self.assertEqual(len(FeedsSessionMock.posted), 1)
+        self.assertEqual(FeedsSessionMock.posted[0]["users"],
+                         [{"id": "owner", "type": "user"}, {"id": "someone", "type": "user"}])
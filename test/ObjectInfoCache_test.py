@@ -0,0 +1,143 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from NarrativeService.util import object_info_cache
+from NarrativeService.util.object_info_cache import ObjectInfoCache
+from NarrativeService.util.workspace import CachingWorkspace
+from installed_clients.baseclient import ServerError
+
+
+def obj_info(upa, meta=None):
+    ws_id, obj_id, ver = [int(x) for x in upa.split("/")]
+    return [obj_id, "obj_{}".format(obj_id), "KBaseGenomes.Genome-14.2", "2019-05-01T12:00:00+0000",
+            ver, "user", ws_id, "ws_{}".format(ws_id), "chsum", 100, meta]
+
+
+class InfoWsMock:
+    def __init__(self, readable):
+        self.readable = set(readable)
+        self.deleted = set()
+        self.calls = list()
+
+    def _info(self, ref, params):
+        ws_id = int(ref.split("/")[0])
+        if ws_id not in self.readable or ref in self.deleted:
+            if params.get("ignoreErrors"):
+                return None
+            raise ServerError("JSONRPCError", -32500, "Object {} cannot be accessed".format(ref))
+        if ref.count("/") == 1:
+            ref += "/3"
+        return obj_info(ref, {"Name": "x"} if params.get("includeMetadata") else None)
+
+    def get_object_info3(self, params, context=None):
+        self.calls.append(("get_object_info3", params.get("includeMetadata", 0)))
+        infos = [self._info(o["ref"], params) for o in params["objects"]]
+        return {"infos": infos, "paths": [[o["ref"]] if i else None
+                                          for o, i in zip(params["objects"], infos)]}
+
+    def get_object_info_new(self, params, context=None):
+        self.calls.append(("get_object_info_new", params.get("includeMetadata", 0)))
+        return [self._info(o["ref"], params) for o in params["objects"]]
+
+    def ver(self):
+        return "0.14.0"
+
+
+class ObjectInfoCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_metadata(self):
+        cache = ObjectInfoCache(10)
+        cache.put_many([obj_info("1/2/3"), None])
+        self.assertEqual(cache.get_many(["1/2/3", "1/2/4"]), {"1/2/3": obj_info("1/2/3")})
+        self.assertEqual(cache.get_many(["1/2/3"], include_metadata=True), {})
+        cache.put_many([obj_info("1/2/3", {"a": "b"})], include_metadata=True)
+        self.assertEqual(cache.get_many(["1/2/3"], include_metadata=True)["1/2/3"][10], {"a": "b"})
+        self.assertIsNone(cache.get_many(["1/2/3"])["1/2/3"][10])
+        # infos without metadata don't replace those with it
+        cache.put_many([obj_info("1/2/3")])
+        self.assertEqual(cache.get_many(["1/2/3"], include_metadata=True)["1/2/3"][10], {"a": "b"})
+        # callers get copies
+        cache.get_many(["1/2/3"], include_metadata=True)["1/2/3"][10]["a"] = "c"
+        self.assertEqual(cache.get_many(["1/2/3"], include_metadata=True)["1/2/3"][10], {"a": "b"})
+
+    def test_disk(self):
+        config = {"scratch": self.dir, "object-info-cache-disk": "true"}
+        cache = ObjectInfoCache.from_config(config)
+        cache.put_many([obj_info("1/2/{}".format(i)) for i in range(1, 1001)])
+        cache.put_many([obj_info("1/2/5", {"a": "b"})], include_metadata=True)
+        self.assertTrue(os.path.exists(os.path.join(self.dir, "object_info_cache.sqlite")))
+        # a new process, with an empty memory cache
+        cache = ObjectInfoCache.from_config(config)
+        self.assertEqual(len(cache), 0)
+        upas = ["1/2/{}".format(i) for i in range(1, 1003)]
+        self.assertEqual(len(cache.get_many(upas)), 1000)
+        self.assertEqual(cache.get_many(["1/2/5"], include_metadata=True)["1/2/5"][10], {"a": "b"})
+        self.assertEqual(len(cache), 1000)
+
+    def test_disk_per_process(self):
+        cache = ObjectInfoCache(10, os.path.join(self.dir, "infos.sqlite"))
+        # nothing's opened until it's used
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "infos.sqlite")))
+        cache.put_many([obj_info("1/2/3")])
+        parent_db = cache._db
+        # as if the server forked after the first use
+        cache._db_pid = -1
+        cache._memory.clear()
+        self.assertEqual(cache.get_many(["1/2/3"]), {"1/2/3": obj_info("1/2/3")})
+        self.assertIsNot(cache._db, parent_db)
+
+    def test_disk_errors_logged(self):
+        cache = ObjectInfoCache(10, os.path.join(self.dir, "infos.sqlite"))
+        cache.put_many([obj_info("1/2/3")])
+        cache._db.execute("DROP TABLE object_info")
+        cache._memory.clear()
+        with self.assertLogs(object_info_cache.logger, "ERROR") as logs:
+            self.assertEqual(cache.get_many(["1/2/3"]), {})
+            cache.put_many([obj_info("1/2/4")])
+        self.assertEqual(len(logs.records), 2)
+        self.assertIsInstance(logs.records[0].exc_info[1], sqlite3.Error)
+
+    def test_caching_workspace(self):
+        ws = InfoWsMock(readable=[1, 2])
+        client = CachingWorkspace(ws, ObjectInfoCache())
+        params = {"objects": [{"ref": "1/2/3"}, {"ref": "2/2/3"}], "includeMetadata": 1}
+        first = client.get_object_info3(params)
+        self.assertEqual(client.get_object_info3(params), first)
+        self.assertEqual(client.get_object_info_new(params), first["infos"])
+        # only the first call asks for the metadata
+        self.assertEqual(ws.calls, [("get_object_info3", 1), ("get_object_info3", 0),
+                                    ("get_object_info_new", 0)])
+        # other methods pass through
+        self.assertEqual(client.ver(), "0.14.0")
+
+    def test_not_cacheable(self):
+        ws = InfoWsMock(readable=[1])
+        client = CachingWorkspace(ws, ObjectInfoCache())
+        for params in [{"objects": [{"ref": "1/2"}], "includeMetadata": 1},
+                       {"objects": [{"ref": "1/2/3", "included": ["a"]}], "includeMetadata": 1},
+                       {"objects": [{"ref": "1/2/3"}], "includeMetadata": 1, "infostruct": 1}]:
+            client.get_object_info3(params)
+            client.get_object_info3(params)
+        self.assertEqual(ws.calls, [("get_object_info3", 1)] * 6)
+
+    def test_lost_access(self):
+        ws = InfoWsMock(readable=[1, 2, 3])
+        client = CachingWorkspace(ws, ObjectInfoCache())
+        refs = [{"ref": "1/2/3"}, {"ref": "2/2/3"}, {"ref": "3/2/3"}]
+        client.get_object_info_new({"objects": refs, "includeMetadata": 1})
+        ws.readable.remove(2)
+        ws.deleted.add("3/2/3")
+        infos = client.get_object_info_new({"objects": refs, "includeMetadata": 1,
+                                            "ignoreErrors": 1})
+        self.assertEqual(infos, [obj_info("1/2/3", {"Name": "x"}), None, None])
+        for ref in refs[1:]:
+            with self.assertRaises(ServerError):
+                client.get_object_info_new({"objects": [ref], "includeMetadata": 1})
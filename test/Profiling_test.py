@@ -0,0 +1,82 @@
+import base64
+import shutil
+import tempfile
+import unittest
+
+from NarrativeService.util.profiling import Profiler, PROFILE_HEADER
+
+
+def work(n):
+    return sum(i * i for i in range(n))
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_disabled_by_default(self):
+        profiler = Profiler.from_config({"scratch": self.dir})
+        self.assertFalse(profiler.enabled)
+        self.assertFalse(profiler.should_profile({PROFILE_HEADER: "1"}))
+        self.assertEqual(profiler.list_profiles(), [])
+
+    def test_should_profile(self):
+        profiler = Profiler.from_config({"scratch": self.dir, "profile-header-enabled": "true"})
+        self.assertTrue(profiler.enabled)
+        self.assertTrue(profiler.should_profile({PROFILE_HEADER: "1"}))
+        self.assertFalse(profiler.should_profile({}))
+        self.assertTrue(Profiler(self.dir, sample_rate=1).should_profile({}))
+
+    def test_run_list_and_get(self):
+        profiler = Profiler(self.dir, sample_rate=1, max_files=2)
+        self.assertEqual(profiler.run("NarrativeService.list_all_data", "123", "some_user", work,
+                                      1000),
+                         work(1000))
+        profiles = profiler.list_profiles()
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]["user"], "some_user")
+        self.assertEqual(profiles[0]["method"], "NarrativeService.list_all_data")
+        self.assertEqual(profiles[0]["call_id"], "123")
+        profile = profiler.get_profile(profiles[0]["name"])
+        self.assertEqual(profile["info"], profiles[0])
+        self.assertIn("work", profile["stats"])
+        self.assertEqual(len(base64.b64decode(profile["data"])), profiles[0]["size"])
+
+        with self.assertRaises(ZeroDivisionError):
+            profiler.run("NarrativeService.x", "../../etc", "../u", lambda: 1 / 0)
+        profiler.run("NarrativeService.y", None, None, work, 10)
+        profiles = profiler.list_profiles()
+        self.assertEqual(len(profiles), 2)
+        self.assertEqual(len(profiler.list_profiles(limit=1)), 1)
+        self.assertEqual({p["call_id"] for p in profiles}, {"None", ".._.._etc"})
+        self.assertEqual({p["user"] for p in profiles}, {"", "___u"})
+
+    def test_only_own_profiles(self):
+        profiler = Profiler.from_config({"scratch": self.dir, "profile-sample-rate": "1",
+                                         "profile-admins": "admin1, admin2"})
+        self.assertEqual(profiler.admins, {"admin1", "admin2"})
+        profiler.run("NarrativeService.a", "1", "user1", work, 10)
+        profiler.run("NarrativeService.b", "2", "user2", work, 10)
+        profiler.run("NarrativeService.c", "3", None, work, 10)
+        names = {p["user"]: p["name"] for p in profiler.list_profiles()}
+
+        self.assertEqual([p["user"] for p in profiler.list_profiles(for_user="user1")], ["user1"])
+        self.assertEqual([p["user"] for p in profiler.list_profiles(for_user="admin2")],
+                         ["", "user2", "user1"])
+        self.assertEqual(profiler.list_profiles(for_user="user3"), [])
+        self.assertEqual(profiler.get_profile(names["user1"], for_user="user1")["info"]["user"],
+                         "user1")
+        self.assertEqual(profiler.get_profile(names[""], for_user="admin1")["info"]["user"], "")
+        for name in names.values():
+            if name != names["user1"]:
+                with self.assertRaises(ValueError):
+                    profiler.get_profile(name, for_user="user1")
+
+    def test_get_bad_name(self):
+        profiler = Profiler(self.dir, sample_rate=1)
+        for name in ["nope", "../deploy.cfg", "1-x-y.prof"]:
+            with self.assertRaises(ValueError):
+                profiler.get_profile(name)
@@ -0,0 +1,202 @@
+import unittest
+
+from NarrativeService.ReportFetcher import MAX_COPY_DEPTH, ReportCache, ReportFetcher
+from installed_clients.baseclient import ServerError
+
+
+def obj_info(upa, obj_type):
+    ws_id, obj_id, ver = upa.split("/")
+    return [int(obj_id), "obj_" + obj_id, obj_type, "2019-05-01T12:00:00+0000", int(ver), "user",
+            int(ws_id), "ws_" + ws_id, "chsum", 100, {}]
+
+
+class ReportWsMock:
+    """
+    A Workspace with objects given as upa -> (upas of objects referencing it, copy source or
+    None), for a user that can't read the unreadable UPAs. Counts calls to each method.
+    """
+    REPORT = "KBaseReport.Report-3.0"
+
+    def __init__(self, objects, unreadable=(), inaccessible_sources=()):
+        self.objects = objects
+        self.unreadable = set(unreadable)
+        self.inaccessible_sources = set(inaccessible_sources)
+        self.calls = {"list_referencing_objects": 0, "get_objects2": 0, "get_object_info3": 0}
+
+    def list_referencing_objects(self, refs):
+        self.calls["list_referencing_objects"] += 1
+        result = list()
+        for ref in refs:
+            if ref["ref"] in self.unreadable:
+                raise ServerError("JSONRPCError", -32500, "Object {} is not readable".format(
+                    ref["ref"]))
+            # only the referencing objects the user can read are listed
+            result.append([obj_info(r, self.REPORT if r.startswith("9/") else "KBaseGenomes.Genome")
+                           for r in self.objects[ref["ref"]][0] if r not in self.unreadable])
+        return result
+
+    def get_object_info3(self, params):
+        self.calls["get_object_info3"] += 1
+        assert params["ignoreErrors"] == 1
+        return {"infos": [None if ref["ref"] in self.unreadable else
+                          obj_info(ref["ref"], "KBaseGenomes.Genome")
+                          for ref in params["objects"]]}
+
+    def get_objects2(self, params):
+        self.calls["get_objects2"] += 1
+        assert params["no_data"] == 1
+        data = list()
+        for ref in params["objects"]:
+            source = self.objects[ref["ref"]][1]
+            obj_data = {"info": obj_info(ref["ref"], "KBaseGenomes.Genome")}
+            if ref["ref"] in self.inaccessible_sources:
+                obj_data["copy_source_inaccessible"] = 1
+            elif source:
+                obj_data["copied"] = source
+            data.append(obj_data)
+        return {"data": data}
+
+
+class ReportFetcherBatchTestCase(unittest.TestCase):
+    def test_find_reports(self):
+        ws = ReportWsMock({
+            "1/1/1": (["9/1/1", "2/5/1"], None),    # has a report
+            "1/2/1": (["2/5/1"], None),             # no report, not a copy
+            "1/3/1": ([], "1/1/1"),                 # copy of an object with a report
+            "1/4/1": ([], "1/3/1"),                 # copy of a copy
+            "1/5/1": ([], "7/7/7"),                 # copy with an inaccessible source
+        }, inaccessible_sources=["1/5/1"])
+        upas = ["1/4/1", "1/1/1", "1/2/1", "1/3/1", "1/5/1", "1/1/1"]
+        reports = ReportFetcher(ws).find_reports_from_objects(upas)
+        self.assertEqual(reports, [
+            {"report_upas": ["9/1/1"], "object_upa": "1/1/1"},
+            {"report_upas": ["9/1/1"], "object_upa": "1/1/1"},
+            {"report_upas": [], "object_upa": "1/2/1"},
+            {"report_upas": ["9/1/1"], "object_upa": "1/1/1"},
+            {"report_upas": [], "object_upa": "1/5/1", "inaccessible": 1,
+             "error": "No report found. This object is a copy, and its source is inaccessible."},
+            {"report_upas": ["9/1/1"], "object_upa": "1/1/1"},
+        ])
+        # one round for the inputs, and one more for 1/4/1's source 1/3/1. That one's source,
+        # 1/1/1, was found in the first round.
+        self.assertEqual(ws.calls, {"list_referencing_objects": 2, "get_objects2": 2,
+                                    "get_object_info3": 0})
+
+    def test_many_objects_few_calls(self):
+        objects = {"1/{}/1".format(i): (["9/{}/1".format(i)] if i % 2 else [], None)
+                   for i in range(100)}
+        ws = ReportWsMock(objects)
+        reports = ReportFetcher(ws).find_reports_from_objects(list(objects))
+        self.assertEqual(len(reports), 100)
+        self.assertEqual(reports[1]["report_upas"], ["9/1/1"])
+        self.assertEqual(reports[2]["report_upas"], [])
+        self.assertEqual(ws.calls, {"list_referencing_objects": 1, "get_objects2": 1,
+                                    "get_object_info3": 0})
+
+    def test_unreadable_object(self):
+        ws = ReportWsMock({"1/1/1": (["9/1/1"], None), "1/2/1": ([], None)},
+                          unreadable=["1/2/1"])
+        reports = ReportFetcher(ws).find_reports_from_objects(["1/1/1", "1/2/1"])
+        self.assertEqual(reports[0], {"report_upas": ["9/1/1"], "object_upa": "1/1/1"})
+        self.assertEqual(reports[1]["report_upas"], [])
+        self.assertIn("not readable", reports[1]["error"])
+
+    def test_no_upas(self):
+        ws = ReportWsMock({})
+        self.assertEqual(ReportFetcher(ws).find_reports_from_objects([]), [])
+        self.assertEqual(sum(ws.calls.values()), 0)
+
+    def test_single(self):
+        ws = ReportWsMock({"1/1/1": (["9/1/1"], None), "1/2/1": ([], "1/1/1")},
+                          unreadable=["1/3/1"])
+        fetcher = ReportFetcher(ws)
+        self.assertEqual(fetcher.find_report_from_object("1/2/1"),
+                         {"report_upas": ["9/1/1"], "object_upa": "1/1/1"})
+        with self.assertRaises(ServerError):
+            fetcher.find_report_from_object("1/3/1")
+
+    def test_cached_chains(self):
+        ws = ReportWsMock({
+            "1/1/1": (["9/1/1"], None),
+            "1/2/1": ([], "1/1/1"),
+            "1/3/1": ([], "1/2/1"),
+            "2/1/1": ([], "1/2/1"),  # another copy of the copy
+            "2/2/1": ([], None),
+        })
+        cache = ReportCache()
+        ReportFetcher(ws, cache).find_reports_from_objects(["1/3/1", "2/2/1"])
+        # every object on the chain is cached, objects with no report aren't
+        self.assertEqual(len(cache), 3)
+        ws.calls = dict.fromkeys(ws.calls, 0)
+        reports = ReportFetcher(ws, cache).find_reports_from_objects(["1/2/1", "2/1/1"])
+        self.assertEqual(reports, [{"report_upas": ["9/1/1"], "object_upa": "1/1/1"}] * 2)
+        # 1/2/1 only needs a permission check, 2/1/1 stops at its source 1/2/1, which that
+        # already covered
+        self.assertEqual(ws.calls, {"list_referencing_objects": 1, "get_objects2": 1,
+                                    "get_object_info3": 1})
+
+    def test_cached_unreadable(self):
+        ws = ReportWsMock({"1/1/1": (["9/1/1"], None)})
+        cache = ReportCache()
+        ReportFetcher(ws, cache).find_report_from_object("1/1/1")
+        ws.unreadable.add("1/1/1")
+        report = ReportFetcher(ws, cache).find_reports_from_objects(["1/1/1"])[0]
+        self.assertEqual(report["report_upas"], [])
+        self.assertIn("cannot be accessed", report["error"])
+
+    def test_copy_cycle_and_depth(self):
+        objects = {"1/1/1": ([], "1/2/1"), "1/2/1": ([], "1/1/1")}
+        for i in range(MAX_COPY_DEPTH + 5):
+            objects["2/{}/1".format(i)] = ([], "2/{}/1".format(i + 1))
+        objects["2/{}/1".format(MAX_COPY_DEPTH + 5)] = (["9/1/1"], None)
+        reports = ReportFetcher(ReportWsMock(objects)).find_reports_from_objects(["1/1/1",
+                                                                                 "2/0/1"])
+        self.assertIn("copy cycle", reports[0]["error"])
+        self.assertIn("copied more than", reports[1]["error"])
+
+    def test_cache_shared_by_users(self):
+        objects = {
+            "1/1/1": (["9/1/1", "9/2/1"], None),
+            "1/2/1": ([], "1/1/1"),
+            "2/1/1": ([], "1/2/1"),
+        }
+        cache = ReportCache()
+        ReportFetcher(ReportWsMock(objects), cache).find_reports_from_objects(["1/2/1"])
+        self.assertEqual(cache.get("1/2/1"), ("1/1/1", ["9/1/1", "9/2/1"]))
+
+        # a user that can only read one of the reports only gets that one
+        ws = ReportWsMock(objects, unreadable=["9/2/1"])
+        self.assertEqual(ReportFetcher(ws, cache).find_reports_from_objects(["1/2/1", "2/1/1"]),
+                         [{"report_upas": ["9/1/1"], "object_upa": "1/1/1"}] * 2)
+
+        # one that can't read either gets what they'd get without the cache
+        for user_cache in [cache, ReportCache()]:
+            ws = ReportWsMock(objects, unreadable=["9/1/1", "9/2/1"])
+            self.assertEqual(
+                ReportFetcher(ws, user_cache).find_reports_from_objects(["1/2/1", "2/1/1"]),
+                [{"report_upas": [], "object_upa": "1/1/1"}] * 2)
+
+        # and so does one that can't read the copy source the reports were found for
+        for user_cache in [cache, ReportCache()]:
+            ws = ReportWsMock(objects, unreadable=["1/1/1"], inaccessible_sources=["1/2/1"])
+            self.assertEqual(
+                ReportFetcher(ws, user_cache).find_reports_from_objects(["1/2/1", "2/1/1"]),
+                [{"report_upas": [], "object_upa": "1/2/1", "inaccessible": 1,
+                  "error": "No report found. This object is a copy, and its source is "
+                           "inaccessible."}] * 2)
+        # the first user's entries are still there
+        self.assertEqual(cache.get("1/2/1"), ("1/1/1", ["9/1/1", "9/2/1"]))
+
+    def test_cached_source_checked(self):
+        objects = {
+            "1/1/1": (["9/1/1"], None),
+            "1/2/1": ([], "1/1/1"),
+        }
+        cache = ReportCache()
+        ReportFetcher(ReportWsMock(objects), cache).find_reports_from_objects(["1/1/1"])
+        # a copy reaching the cached source mid-chain is checked too
+        ws = ReportWsMock(objects, unreadable=["9/1/1"])
+        self.assertEqual(ReportFetcher(ws, cache).find_reports_from_objects(["1/2/1"]),
+                         [{"report_upas": [], "object_upa": "1/1/1"}])
+        self.assertEqual(ws.calls["get_object_info3"], 1)
+        self.assertEqual(cache.get("1/2/1"), None)
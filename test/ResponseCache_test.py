@@ -0,0 +1,159 @@
+import hashlib
+import json
+import threading
+import time
+import unittest
+
+from NarrativeService.util.response_cache import (ResponseCache, encoded_etag, etag_matches,
+                                                  matching_etag)
+
+
+class Counter:
+    def __init__(self, result=None, delay=0, error=None):
+        self.calls = 0
+        self.result = result
+        self.delay = delay
+        self.error = error
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def test_uncached_method(self):
+        cache = ResponseCache()
+        compute = Counter([1])
+        self.assertFalse(cache.is_cached("NarrativeService.status"))
+        self.assertEqual(cache.call("NarrativeService.status", {}, [], compute), ([1], None))
+
+    def test_cache_and_expire(self):
+        cache = ResponseCache()
+        cache.add("NarrativeService.get_ignore_categories", ttl=0.1)
+        compute = Counter([{"apps": []}])
+        result, encoded = cache.call("NarrativeService.get_ignore_categories", {},
+                                     [{"tag": "dev"}], compute)
+        self.assertEqual(result, [{"apps": []}])
+        self.assertEqual(json.loads(b"".join(encoded.chunks)), result)
+        self.assertTrue(encoded.etag.startswith('"'))
+        self.assertEqual(cache.call("NarrativeService.get_ignore_categories", {}, [{"tag": "dev"}],
+                                    compute), (result, encoded))
+        self.assertEqual(compute.calls, 1)
+        cache.call("NarrativeService.get_ignore_categories", {}, [{"tag": "beta"}], compute)
+        self.assertEqual(compute.calls, 2)
+        time.sleep(0.15)
+        cache.call("NarrativeService.get_ignore_categories", {}, [{"tag": "dev"}], compute)
+        self.assertEqual(compute.calls, 3)
+
+    def test_encode(self):
+        # the ETag is made from the chunks the result is encoded to, and they're kept
+        chunks = [b'[{"apps": ', b'[]}]']
+        encode = Counter(chunks)
+        cache = ResponseCache(encode=lambda result: encode())
+        cache.add("NarrativeService.get_ignore_categories", ttl=60)
+        self.assertFalse(cache.caches("NarrativeService.set_narratorial"))
+        self.assertTrue(cache.caches("NarrativeService.get_ignore_categories"))
+        for _ in range(2):
+            (_, encoded) = cache.call("NarrativeService.get_ignore_categories", {}, [],
+                                      Counter([{"apps": []}]))
+            self.assertEqual(encoded.chunks, chunks)
+            self.assertEqual(encoded.etag, '"{}"'.format(hashlib.sha1(b"".join(chunks)).hexdigest()))
+        self.assertEqual(encode.calls, 1)
+
+    def test_per_user_and_key(self):
+        cache = ResponseCache()
+        cache.add("NarrativeService.list_narratives", ttl=60, per_user=True,
+                  key=lambda params: "public" if params[0].get("type") == "public" else None)
+        compute = Counter([{}])
+        for user in ["a", "a", "b"]:
+            cache.call("NarrativeService.list_narratives", {"user_id": user},
+                       [{"type": "public"}], compute)
+        self.assertEqual(compute.calls, 2)
+        for _ in range(2):
+            self.assertIsNone(cache.call("NarrativeService.list_narratives", {"user_id": "a"},
+                                         [{"type": "mine"}], compute)[1])
+        self.assertEqual(compute.calls, 4)
+
+    def test_single_flight(self):
+        cache = ResponseCache()
+        cache.add("NarrativeService.get_ignore_categories", ttl=60)
+        compute = Counter([{}], delay=0.1)
+        results = list()
+        threads = [threading.Thread(target=lambda: results.append(
+            cache.call("NarrativeService.get_ignore_categories", {}, [], compute)))
+            for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(compute.calls, 1)
+        self.assertEqual(len(results), 5)
+
+    def test_errors_not_cached(self):
+        cache = ResponseCache()
+        cache.add("NarrativeService.get_ignore_categories", ttl=60)
+        failing = Counter(error=ValueError("nope"))
+        with self.assertRaises(ValueError):
+            cache.call("NarrativeService.get_ignore_categories", {}, [], failing)
+        compute = Counter([{}])
+        cache.call("NarrativeService.get_ignore_categories", {}, [], compute)
+        self.assertEqual(compute.calls, 1)
+
+    def test_invalidated_by(self):
+        cache = ResponseCache()
+        cache.add("NarrativeService.list_narratorials", ttl=60,
+                  invalidated_by=["NarrativeService.set_narratorial"])
+        compute = Counter([{}])
+        cache.call("NarrativeService.list_narratorials", {}, [{}], compute)
+        self.assertTrue(cache.is_cached("NarrativeService.set_narratorial"))
+        cache.call("NarrativeService.set_narratorial", {}, [{}], Counter([{}]))
+        cache.call("NarrativeService.list_narratorials", {}, [{}], compute)
+        self.assertEqual(compute.calls, 2)
+
+    def test_invalidated_while_computing(self):
+        cache = ResponseCache()
+        cache.add("NarrativeService.list_narratorials", ttl=60,
+                  invalidated_by=["NarrativeService.set_narratorial"])
+        started = threading.Event()
+        finish = threading.Event()
+
+        def compute_old():
+            started.set()
+            finish.wait(5)
+            return [{"narratorials": ["old"]}]
+        thread = threading.Thread(target=cache.call, args=(
+            "NarrativeService.list_narratorials", {}, [{}], compute_old))
+        thread.start()
+        started.wait(5)
+        # set_narratorial finishes while the old list is being computed
+        cache.call("NarrativeService.set_narratorial", {}, [{}], Counter([{}]))
+        # so this call doesn't wait for the old list, and isn't given it
+        compute_new = Counter([{"narratorials": ["new"]}])
+        self.assertEqual(cache.call("NarrativeService.list_narratorials", {}, [{}],
+                                    compute_new)[0], [{"narratorials": ["new"]}])
+        finish.set()
+        thread.join(5)
+        # and the old list isn't cached when it finishes
+        self.assertEqual(cache.call("NarrativeService.list_narratorials", {}, [{}],
+                                    Counter([{"narratorials": ["newer"]}]))[0],
+                         [{"narratorials": ["new"]}])
+        self.assertEqual(compute_new.calls, 1)
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('"abc"', '"abc"'))
+        self.assertTrue(etag_matches('"abc"', 'W/"xyz", W/"abc"'))
+        self.assertTrue(etag_matches('"abc"', '*'))
+        self.assertFalse(etag_matches('"abc"', '"xyz"'))
+        self.assertFalse(etag_matches('"abc"', None))
+        self.assertFalse(etag_matches(None, '*'))
+
+    def test_matching_etag(self):
+        self.assertEqual(encoded_etag('"abc"', 'gzip'), '"abc-gzip"')
+        self.assertEqual(matching_etag('"abc"', '"xyz", W/"abc-gzip"'), '"abc-gzip"')
+        self.assertEqual(matching_etag('"abc"', '"abc-deflate"'), '"abc-deflate"')
+        self.assertEqual(matching_etag('"abc"', '*'), '"abc"')
+        self.assertIsNone(matching_etag('"abc"', '"abc-br"'))
+        self.assertIsNone(matching_etag('"abc"', '"xyz-gzip"'))
@@ -0,0 +1,81 @@
+import json
+import unittest
+from unittest import mock
+
+from NarrativeService.NarrativeServiceServer import (JSONObjectEncoder, _iterencode, application,
+                                                     encode_json_chunks)
+from NarrativeService.util import json_codec
+
+
+class JSONable:
+    def toJSONable(self):
+        return {"a": [1, 2]}
+
+
+def make_result(n=300):
+    return [{
+        "objects": [[i, "obj é ☃ " + str(i), "KBaseGenomes.Genome-1.0", {"meta": "ß"}, None,
+                     1.5, True] for i in range(n)],
+        "deep": {"a": {"b": {"c": {"d": [{"e": i} for i in range(3)]}}}},
+        "set": {"x"},
+        "fs": frozenset([1]),
+        "j": JSONable(),
+        "empty": [{}, [], ""],
+        "tuple": (1, "two"),
+        1: "int key"
+    }]
+
+
+class ResponseChunksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.codec = json_codec.codec
+
+    def tearDown(self):
+        json_codec.codec = self.codec
+
+    def test_same_as_json_dumps(self):
+        json_codec.codec = json_codec.get_codec("json")
+        for result in [make_result(), make_result(0), [], {}, "é", None, [[[[[["deep"]]]]]]]:
+            with self.subTest(result=str(result)[:20]):
+                expected = json.dumps(result, cls=JSONObjectEncoder).encode("utf-8")
+                self.assertEqual(b"".join(_iterencode(result)), expected)
+                self.assertEqual(b"".join(encode_json_chunks(result, chunk_size=100)), expected)
+
+    def test_orjson_same_value(self):
+        if json_codec.orjson is None:
+            self.skipTest("orjson is not installed")
+        json_codec.codec = json_codec.get_codec("orjson")
+        result = make_result()
+        expected = json.loads(json.dumps(result, cls=JSONObjectEncoder))
+        self.assertEqual(json.loads(b"".join(encode_json_chunks(result, chunk_size=100))),
+                         expected)
+
+    def test_chunk_sizes(self):
+        result = make_result()
+        # a dict with a non-string key is encoded in one piece
+        del result[0][1]
+        chunks = list(encode_json_chunks(result, chunk_size=1000))
+        self.assertGreater(len(chunks), 2)
+        # each chunk is at least chunk_size, apart from the last
+        self.assertTrue(all(len(chunk) >= 1000 for chunk in chunks[:-1]))
+
+    def test_encode_response(self):
+        ctx = {}
+        small = application.encode_response({"x": 1}, ctx)
+        self.assertEqual(small, [b'{"x": 1}'])
+        big = [{"objects": [["é" * 100, i] for i in range(2000)]}]
+        self.assertEqual(json.loads(b"".join(application.encode_response(big, ctx))),
+                         json.loads(json.dumps(big)))
+        # a bad value in the first chunks raises before anything's sent
+        with self.assertRaises(TypeError):
+            application.encode_response([object()] + big, ctx)
+        # one past them ends the response early, and is logged
+        big[0]["objects"].append(object())
+        with mock.patch.object(application, "log") as log:
+            chunks = application.encode_response(big, ctx)
+            encoded = b"".join(chunks)
+        complete = b"".join(application.encode_response(
+            [{"objects": big[0]["objects"][:-1]}], ctx))
+        self.assertTrue(len(encoded) > 65536 and complete.startswith(encoded))
+        self.assertEqual(log.call_count, 1)
+        self.assertIn("truncated", log.call_args[0][2])
@@ -0,0 +1,133 @@
+import gzip
+import io
+import json
+import unittest
+import zlib
+
+from NarrativeService.NarrativeServiceServer import (application, compress_chunks,
+                                                     get_response_encoding)
+
+
+class ResponseEncodingTestCase(unittest.TestCase):
+    def test_get_response_encoding(self):
+        for accept_encoding, expected in [
+            (None, None),
+            ("", None),
+            ("gzip", "gzip"),
+            ("deflate", "deflate"),
+            ("deflate, gzip", "gzip"),
+            ("GZIP", "gzip"),
+            ("gzip;q=0.5, deflate;q=0.8", "deflate"),
+            ("gzip; q=0.9, deflate; q=0.9", "gzip"),
+            ("gzip;q=0, deflate", "deflate"),
+            ("gzip;q=0", None),
+            ("gzip;q=nope", None),
+            ("*", "gzip"),
+            ("*;q=0.1, deflate;q=0.2", "deflate"),
+            ("br", None),
+            ("identity", None),
+            # nothing's sent uncompressed if it can be helped, but it's sent anyway if not
+            ("identity;q=0, gzip", "gzip"),
+            ("identity;q=0", None),
+        ]:
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertEqual(get_response_encoding(accept_encoding), expected)
+
+    def test_compress_chunks_round_trip(self):
+        chunks = [b'{"a": ', b'"' + "é".encode("utf-8") * 1000 + b'"', b"}"]
+        gzipped = b"".join(compress_chunks(iter(chunks), "gzip", 6))
+        self.assertEqual(gzip.decompress(gzipped), b"".join(chunks))
+        deflated = b"".join(compress_chunks(iter(chunks), "deflate", 6))
+        self.assertEqual(zlib.decompress(deflated), b"".join(chunks))
+
+
+class ResponseCompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.threshold = application.compression_threshold
+
+    def tearDown(self):
+        application.compression_threshold = self.threshold
+
+    def call(self, accept_encoding=None, if_none_match=None, http_method="GET"):
+        if http_method == "GET":
+            body = b""
+            query = "method=NarrativeService.get_ignore_categories&params=%5B%5D&id=1"
+        else:
+            body = json.dumps({"method": "NarrativeService.get_ignore_categories", "params": [],
+                               "version": "1.1", "id": "1"}).encode("utf-8")
+            query = ""
+        environ = {"REQUEST_METHOD": http_method, "CONTENT_LENGTH": str(len(body)),
+                   "QUERY_STRING": query, "wsgi.input": io.BytesIO(body),
+                   "REMOTE_ADDR": "127.0.0.1"}
+        if accept_encoding:
+            environ["HTTP_ACCEPT_ENCODING"] = accept_encoding
+        if if_none_match:
+            environ["HTTP_IF_NONE_MATCH"] = if_none_match
+        started = list()
+        body = b"".join(application(environ, lambda status, headers: started.extend(
+            [status, dict(headers)])))
+        (status, headers) = started
+        if headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        elif headers.get("Content-Encoding") == "deflate":
+            body = zlib.decompress(body)
+        return status, headers, json.loads(body) if body else None
+
+    def test_threshold(self):
+        (status, headers, plain) = self.call()
+        self.assertEqual(status, "200 OK")
+        self.assertNotIn("Content-Encoding", headers)
+        size = int(headers["content-length"])
+
+        application.compression_threshold = size + 1
+        (_, headers, result) = self.call("gzip")
+        self.assertNotIn("Content-Encoding", headers)
+        self.assertEqual(result, plain)
+
+        application.compression_threshold = size
+        for encoding in ["gzip", "deflate"]:
+            with self.subTest(encoding=encoding):
+                (_, headers, result) = self.call(encoding)
+                self.assertEqual(headers["Content-Encoding"], encoding)
+                self.assertEqual(headers["Vary"], "Accept-Encoding")
+                self.assertEqual(result, plain)
+
+    def test_etag(self):
+        application.compression_threshold = 1
+        (_, plain_headers, _) = self.call()
+        (_, gzip_headers, _) = self.call("gzip")
+        (_, deflate_headers, _) = self.call("deflate")
+        etags = [plain_headers["ETag"], gzip_headers["ETag"], deflate_headers["ETag"]]
+        # each encoding's bytes differ, so each gets its own ETag
+        self.assertEqual(len(set(etags)), 3)
+        self.assertEqual(gzip_headers["ETag"], etags[0][:-1] + '-gzip"')
+        for etag in etags:
+            for accept_encoding in [None, "gzip"]:
+                with self.subTest(etag=etag, accept_encoding=accept_encoding):
+                    (status, headers, body) = self.call(accept_encoding, etag)
+                    self.assertEqual(status, "304 Not Modified")
+                    self.assertEqual(headers["ETag"], etag)
+                    self.assertIsNone(body)
+        (status, _, _) = self.call("gzip", '"other"')
+        self.assertEqual(status, "200 OK")
+
+    def test_etag_post(self):
+        # a POST gets the ETag, but isn't cacheable, so If-None-Match is ignored
+        (status, headers, result) = self.call(http_method="POST")
+        self.assertEqual(status, "200 OK")
+        (_, get_headers, get_result) = self.call()
+        self.assertEqual(headers["ETag"], get_headers["ETag"])
+        self.assertEqual(result, get_result)
+        self.assertEqual(get_headers["Cache-Control"], "private, no-cache")
+        self.assertNotIn("Cache-Control", headers)
+        (status, _, result) = self.call(if_none_match=headers["ETag"], http_method="POST")
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(result, get_result)
+
+    def test_get_uncached_method(self):
+        environ = {"REQUEST_METHOD": "GET", "QUERY_STRING": "method=NarrativeService.status",
+                   "wsgi.input": io.BytesIO(b""), "REMOTE_ADDR": "127.0.0.1"}
+        started = list()
+        body = b"".join(application(environ, lambda status, headers: started.append(status)))
+        self.assertEqual(started[0], "500 Internal Server Error")
+        self.assertEqual(json.loads(body)["error"]["code"], -32600)
@@ -0,0 +1,59 @@
+import unittest
+
+from NarrativeService.ServiceUtils import ServiceUtils
+
+
+class ServiceUtilsTestCase(unittest.TestCase):
+    def test_iso8601_to_millis_since_epoch(self):
+        to_millis = ServiceUtils.iso8601_to_millis_since_epoch
+        for date, expected in [
+            ("2019-05-01T12:00:00+0000", 1556712000000),
+            ("2019-05-01T12:00:00Z", 1556712000000),
+            ("2019-05-01T14:30:00+0230", 1556712000000),
+            ("2019-05-01T07:00:00-05:00", 1556712000000),
+            ("2019-05-01T12:00:00.123+0000", 1556712000123),
+            ("2019-05-01T12:00:00.1234567+0000", 1556712000123),
+            ("1970-01-01T00:00:00+0000", 0),
+            # not the Workspace's format, so dateutil parses these
+            ("2019-05-01 12:00:00 +0000", 1556712000000),
+            ("May 1 2019 12:00:00 UTC", 1556712000000),
+        ]:
+            with self.subTest(date=date):
+                self.assertEqual(to_millis(date), expected)
+                self.assertEqual(to_millis(date), expected)
+        with self.assertRaises(ValueError):
+            to_millis("not a date")
+
+    def test_info_to_object(self):
+        obj = ServiceUtils.object_info_to_object(
+            [2, "obj", "KBaseGenomes.Genome-14.2", "2019-05-01T12:00:00+0000", 3, "user", 1, "ws",
+             "chsum", 100, {}])
+        self.assertEqual(obj["saveDateMs"], 1556712000000)
+        self.assertEqual(obj["ref"], "1/2/3")
+        ws = ServiceUtils.workspace_info_to_object(
+            [1, "ws", "user", "2019-05-01T12:00:00+0000", 5, "a", "n", "unlocked", {}])
+        self.assertEqual(ws["modDateMs"], 1556712000000)
+
+    def test_infos_to_objects(self):
+        infos = [[i, "obj_{}".format(i), "KBaseGenomes.Genome-14.{}".format(i % 2),
+                  "2019-05-01T12:00:0{}+0000".format(i % 3), 1, "user", 1, "ws", "chsum", 100, {}]
+                 for i in range(10)]
+        infos.insert(3, None)
+        objects = ServiceUtils.object_infos_to_objects(infos)
+        self.assertEqual(objects, [None if info is None else ServiceUtils.object_info_to_object(info)
+                                   for info in infos])
+        self.assertEqual(objects[5]["typeMinorVersion"], "0")
+        self.assertEqual(objects[5]["saveDateMs"], 1556712001000)
+        columns = ServiceUtils.object_infos_to_objects(infos, columnar=True)
+        self.assertEqual(sorted(columns), sorted(objects[0]))
+        for field, values in columns.items():
+            self.assertEqual(values, [None if obj is None else obj[field] for obj in objects])
+
+        ws_infos = [[1, "ws", "user", "2019-05-01T12:00:00+0000", 5, "a", "n", "unlocked", {}],
+                    None]
+        self.assertEqual(ServiceUtils.workspace_infos_to_objects(ws_infos),
+                         [ServiceUtils.workspace_info_to_object(ws_infos[0]), None])
+        columns = ServiceUtils.workspace_infos_to_objects(ws_infos, columnar=True)
+        self.assertEqual(columns["modDateMs"], [1556712000000, None])
+        self.assertEqual(columns["lockstat"], ["unlocked", None])
+        self.assertEqual(ServiceUtils.object_infos_to_objects([], columnar=True)["ref"], [])
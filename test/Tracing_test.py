@@ -0,0 +1,43 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from NarrativeService.util import tracing
+
+
+class TracingTestCase(unittest.TestCase):
+    def test_no_trace(self):
+        with tracing.span("nothing") as span:
+            self.assertIsNone(span)
+        func = lambda: 1  # noqa: E731
+        self.assertIs(tracing.propagate(func), func)
+
+    def test_span_tree(self):
+        trace = tracing.start_trace("NarrativeService.list_narratives")
+        with tracing.span("Workspace.list_workspace_info"):
+            with tracing.span("page", objects=3) as span:
+                span.attrs["more"] = 1
+        with tracing.span("sort"):
+            pass
+        root = trace.finish()
+        self.assertEqual([s.name for s in root.children], ["Workspace.list_workspace_info", "sort"])
+        self.assertEqual(root.children[0].children[0].attrs, {"objects": 3, "more": 1})
+        lines = trace.format()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].endswith("ms NarrativeService.list_narratives"))
+        self.assertTrue(lines[2].startswith("    +"))
+        self.assertTrue(lines[2].endswith("ms page more=1 objects=3"))
+        # the trace is over, so spans aren't recorded anymore
+        with tracing.span("after") as span:
+            self.assertIsNone(span)
+
+    def test_propagate_to_threads(self):
+        trace = tracing.start_trace("copy_objects")
+
+        def copy(i):
+            with tracing.span("copy", i=i):
+                time.sleep(0.01)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            list(executor.map(tracing.propagate(copy), range(3)))
+        root = trace.finish()
+        self.assertEqual(sorted(s.attrs["i"] for s in root.children), [0, 1, 2])
@@ -0,0 +1,77 @@
+import time
+import unittest
+from unittest import mock
+
+import NarrativeService.util.workspace as ws
+from NarrativeService.util.workspace import WorkspaceAdmins
+from installed_clients.baseclient import ServerError
+
+
+class AdminWsMock:
+    """
+    An admin Workspace client where workspace N is administered by user_N and user_N+1.
+    """
+    instances = 0
+
+    def __init__(self, *args, **kwargs):
+        AdminWsMock.instances += 1
+        self.calls = list()
+
+    def administer(self, params):
+        assert params["command"] == "getPermissionsMass"
+        ws_ids = [w["id"] for w in params["params"]["workspaces"]]
+        self.calls.append(ws_ids)
+        if 0 in ws_ids:
+            raise ServerError("JSONRPCError", -32500, "No workspace with id 0 exists")
+        return {"perms": [{"user_{}".format(i): "a", "user_{}".format(i + 1): "a",
+                           "reader": "r", "*": "r"} for i in ws_ids]}
+
+
+class WorkspaceAdminsTestCase(unittest.TestCase):
+    def tearDown(self):
+        ws._ws_admins.clear()
+
+    def test_get_many(self):
+        client = AdminWsMock()
+        admins = WorkspaceAdmins(client)
+        self.assertEqual(admins.get_many([3, 1, 3]), {1: ["user_1", "user_2"],
+                                                      3: ["user_3", "user_4"]})
+        self.assertEqual(admins.get_many([2, 1]), {1: ["user_1", "user_2"],
+                                                   2: ["user_2", "user_3"]})
+        self.assertEqual(client.calls, [[3, 1], [2]])
+        # callers can't change the cached lists
+        admins.get_many([1])[1].append("someone")
+        self.assertEqual(admins.get_many([1])[1], ["user_1", "user_2"])
+
+    def test_batches(self):
+        client = AdminWsMock()
+        found = WorkspaceAdmins(client).get_many(list(range(1, 2501)))
+        self.assertEqual(len(found), 2500)
+        self.assertEqual([len(ws_ids) for ws_ids in client.calls], [1000, 1000, 500])
+
+    def test_ttl(self):
+        client = AdminWsMock()
+        admins = WorkspaceAdmins(client)
+        admins.get_many([1], ttl=0.05)
+        admins.get_many([1], ttl=0.05)
+        time.sleep(0.1)
+        admins.get_many([1], ttl=0.05)
+        admins.get_many([1], ttl=0)
+        self.assertEqual(client.calls, [[1], [1], [1]])
+
+    def test_errors(self):
+        admins = WorkspaceAdmins(AdminWsMock())
+        with self.assertRaises(ServerError):
+            admins.get_many([1, 0])
+        self.assertEqual(admins.get_many([1]), {1: ["user_1", "user_2"]})
+
+    @mock.patch("NarrativeService.util.workspace.Workspace", AdminWsMock)
+    def test_pooled_clients(self):
+        AdminWsMock.instances = 0
+        for ws_id in [5, 6, 5]:
+            self.assertEqual(ws.get_ws_admins(ws_id, "ws_url", "token"),
+                             ["user_{}".format(ws_id), "user_{}".format(ws_id + 1)])
+        ws.get_ws_admins_mass([5, 7], "ws_url", "token")
+        ws.get_ws_admins(5, "ws_url", "other_token")
+        self.assertEqual(AdminWsMock.instances, 2)
+        self.assertEqual(ws._ws_admins[("ws_url", "token")]._client.calls, [[5], [6], [7]])
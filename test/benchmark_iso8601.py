@@ -0,0 +1,61 @@
+"""
+Compares ServiceUtils.iso8601_to_millis_since_epoch with parsing every timestamp with dateutil (as
+it used to), on made-up Workspace save dates shaped like those in a big list_all_data call - many
+objects saved together share a timestamp. Not a test - run it directly from this directory:
+
+    PYTHONPATH=../lib:../lib/installed_clients python benchmark_iso8601.py [num_timestamps]
+"""
+import datetime
+import random
+import sys
+import timeit
+
+from dateutil import parser
+
+from NarrativeService import ServiceUtils as service_utils
+from NarrativeService.ServiceUtils import ServiceUtils
+
+
+def dateutil_to_millis(date):
+    dt = parser.parse(date)
+    utc_naive = dt.replace(tzinfo=None) - dt.utcoffset()
+    return int((utc_naive - service_utils.EPOCH).total_seconds() * 1000.0)
+
+
+def workspace_timestamps(num_timestamps):
+    start = datetime.datetime(2016, 1, 1)
+    timestamps = list()
+    while len(timestamps) < num_timestamps:
+        saved = start + datetime.timedelta(seconds=random.randint(0, 5 * 365 * 86400))
+        # an app run or upload saves a few objects in the same second
+        timestamps.extend([saved.strftime("%Y-%m-%dT%H:%M:%S+0000")] * random.randint(1, 5))
+    return timestamps[:num_timestamps]
+
+
+def run(name, func, timestamps, clear=False, number=3):
+    def parse_all():
+        if clear:
+            service_utils._iso8601_to_millis.cache_clear()
+        for ts in timestamps:
+            func(ts)
+    elapsed = min(timeit.repeat(parse_all, number=number, repeat=3)) / number
+    print("    {:28s} {:8.2f} ms   {:6.2f} us/timestamp".format(
+        name, elapsed * 1000, elapsed * 1e6 / len(timestamps)))
+
+
+def main():
+    num_timestamps = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    random.seed(1)
+    timestamps = workspace_timestamps(num_timestamps)
+    assert [ServiceUtils.iso8601_to_millis_since_epoch(ts) for ts in timestamps] == \
+        [dateutil_to_millis(ts) for ts in timestamps]
+    print("{:,} timestamps, {:,} distinct".format(len(timestamps), len(set(timestamps))))
+    run("dateutil", dateutil_to_millis, timestamps)
+    run("fixed format, empty memo", ServiceUtils.iso8601_to_millis_since_epoch, timestamps,
+        clear=True)
+    run("fixed format, no memo", service_utils._iso8601_to_millis.__wrapped__, timestamps)
+    run("fixed format, warm memo", ServiceUtils.iso8601_to_millis_since_epoch, timestamps)
+
+
+if __name__ == "__main__":
+    main()
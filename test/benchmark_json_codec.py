@@ -0,0 +1,141 @@
+"""
+Compares the JSON codecs in NarrativeService.util.json_codec on made-up responses shaped like
+list_all_data and list_objects_with_sets results, and on parsing them back (as a client would).
+Then times a generated Workspace client's get_objects2 call, with the HTTP post replaced by one
+that returns a made-up response, as generated and with json_codec.install_in_clients.
+Not a test - run it directly from this directory:
+
+    PYTHONPATH=../lib:../lib/installed_clients python benchmark_json_codec.py [num_objects]
+"""
+import json
+import random
+import sys
+import timeit
+from unittest import mock
+
+from installed_clients import baseclient
+from installed_clients.WorkspaceClient import Workspace
+from NarrativeService.util import json_codec
+
+TYPES = ["KBaseGenomes.Genome-14.2", "KBaseFBA.FBAModel-13.0", "KBaseAssembly.Assembly-6.0",
+         "KBaseRNASeq.RNASeqAlignment-8.2", "KBaseSets.ReadsSet-1.2", "KBaseReport.Report-3.0"]
+
+
+def object_info(ws_id, obj_id):
+    return [obj_id, "object_{}_{}".format(ws_id, obj_id), random.choice(TYPES),
+            "2019-05-{:02d}T12:34:56+0000".format(random.randint(1, 28)), random.randint(1, 20),
+            "some_user", ws_id, "some_user:narrative_{}".format(ws_id),
+            "%032x" % random.getrandbits(128), random.randint(1000, 10000000),
+            {"Name": "object {}".format(obj_id), "Domain": "Bacteria", "Size": "4641652"}]
+
+
+def list_all_data_result(num_objects):
+    objects = list()
+    for i in range(num_objects):
+        ws_id = 1000 + i % 200
+        objects.append({
+            "upa": "{}/{}/{}".format(ws_id, i, 1),
+            "name": "object_{}".format(i),
+            "narr_name": "Narrative {}".format(ws_id),
+            "type": random.choice(TYPES).split("-")[0].split(".")[1],
+            "savedate": 1557000000000 + i,
+            "saved_by": "some_user"
+        })
+    return {
+        "version": "1.1", "id": "12345",
+        "result": [{
+            "objects": objects,
+            "limit_reached": 0,
+            "type_counts": {t.split("-")[0].split(".")[1]: num_objects // len(TYPES) for t in TYPES},
+            "workspace_display": {1000 + i: {"display": "Narrative {}".format(1000 + i),
+                                             "count": num_objects // 200} for i in range(200)}
+        }]
+    }
+
+
+def list_objects_with_sets_result(num_objects):
+    data = list()
+    for i in range(num_objects):
+        item = {"object_info": object_info(1000 + i % 20, i)}
+        if i % 50 == 0:
+            item["set_items"] = {"set_items_info": [object_info(1000, j) for j in range(5)]}
+        if i % 10 == 0:
+            item["dp_info"] = {"ref": "1000/1/1", "refs": {"1000/1/1", "1001/1/1"}}
+        data.append(item)
+    return {
+        "version": "1.1", "id": "12345",
+        "result": [{"data": data,
+                    "data_palette_refs": {str(1000 + i): "{}/1/1".format(1000 + i)
+                                          for i in range(20)}}]
+    }
+
+
+def run(name, payload, codecs, number=5):
+    print("{} ({:,} bytes)".format(name, len(json_codec.get_codec("json").dumps_bytes(payload))))
+    for codec in codecs:
+        encoded = codec.dumps_bytes(payload)
+        enc = min(timeit.repeat(lambda: codec.dumps_bytes(payload), number=number, repeat=3))
+        dec = min(timeit.repeat(lambda: codec.loads(encoded), number=number, repeat=3))
+        assert json.loads(encoded) == json.loads(json.dumps(payload, default=list))
+        print("    {:8s} encode {:8.2f} ms   decode {:8.2f} ms".format(
+            codec.name, enc * 1000 / number, dec * 1000 / number))
+
+
+def get_objects2_result(num_objects):
+    data = [{"data": {"id": "object_{}".format(i), "features": [{"id": "f{}".format(j),
+                                                                "location": [["c", j, "+", 99]]}
+                                                               for j in range(20)]},
+             "info": object_info(1000, i), "refs": [], "provenance": [], "creator": "some_user",
+             "orig_wsid": 1000, "created": "2019-05-01T12:34:56+0000", "epoch": 1556714096000,
+             "copy_source_inaccessible": 0, "extracted_ids": {}}
+            for i in range(num_objects)]
+    return {"version": "1.1", "id": "12345", "result": [{"data": data}]}
+
+
+def run_client(name, params, response, number=5):
+    """Times a Workspace.get_objects2 call, generated and with each codec."""
+    body = json.dumps(response).encode("utf-8")
+    post = mock.Mock(return_value=mock.Mock(status_code=200, ok=True, content=body,
+                                            text=body.decode("utf-8"), json=lambda: json.loads(body),
+                                            headers={}))
+    ws = Workspace("http://localhost/ws", token=None)
+    generated = baseclient.BaseClient._call
+    print("{} ({:,} byte request, {:,} byte response)".format(
+        name, len(json.dumps(params)), len(body)))
+    calls = [("generated", generated)]
+    codec = json_codec.codec
+    for c in [json_codec.get_codec("json")] + (
+            [json_codec.get_codec("orjson")] if json_codec.orjson is not None else []):
+        calls.append((c.name, json_codec._client_call(baseclient)))
+    try:
+        with mock.patch.object(baseclient._requests, "post", post):
+            for call_name, call in calls:
+                if call_name != "generated":
+                    json_codec.codec = json_codec.get_codec(call_name)
+                baseclient.BaseClient._call = call
+                assert ws.get_objects2(params) == response["result"][0]
+                t = min(timeit.repeat(lambda: ws.get_objects2(params), number=number, repeat=3))
+                print("    {:9s} call {:8.2f} ms".format(call_name, t * 1000 / number))
+    finally:
+        baseclient.BaseClient._call = generated
+        json_codec.codec = codec
+
+
+def main():
+    num_objects = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    random.seed(1)
+    codecs = [json_codec.get_codec("json")]
+    if json_codec.orjson is not None:
+        codecs.append(json_codec.get_codec("orjson"))
+    run("list_all_data, {} objects".format(num_objects), list_all_data_result(num_objects), codecs)
+    run("list_objects_with_sets, {} objects".format(num_objects),
+        list_objects_with_sets_result(num_objects), codecs)
+    num_refs = num_objects // 10
+    run_client("get_objects2, {} objects".format(num_refs),
+               {"objects": [{"ref": "1000/{}/1".format(i), "included": ["/id", "/features"]}
+                            for i in range(num_refs)]},
+               get_objects2_result(num_refs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Measures how long a new server worker takes to start: importing NarrativeServiceServer (which
+makes the Application and Impl), answering its first status request, and loading the generated
+clients the first time a request needs them. Each run is a fresh Python process.
+Not a test - run it directly from this directory with a deploy config:
+
+    KB_DEPLOYMENT_CONFIG=../deploy.cfg PYTHONPATH=../lib:../lib/installed_clients \
+        python benchmark_startup.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+WORKER = r"""
+import io, json, sys, time
+start = time.perf_counter()
+from NarrativeService import NarrativeServiceServer
+imported = time.perf_counter()
+
+body = json.dumps({"method": "NarrativeService.status", "params": [], "version": "1.1",
+                   "id": "1"}).encode()
+environ = {"REQUEST_METHOD": "POST", "CONTENT_LENGTH": str(len(body)),
+           "wsgi.input": io.BytesIO(body), "REMOTE_ADDR": "127.0.0.1"}
+b"".join(NarrativeServiceServer.application(environ, lambda status, headers: None))
+first_request = time.perf_counter()
+
+loaded = [m for m in sys.modules if m.startswith("installed_clients.") and "Client" in m]
+from NarrativeService.NarrativeServiceImpl import Workspace
+from NarrativeService.apps.appinfo import Catalog, NarrativeMethodStore
+Workspace.__name__, Catalog.__name__, NarrativeMethodStore.__name__
+clients = time.perf_counter()
+
+print(json.dumps({"import": imported - start, "first request": first_request - imported,
+                  "load clients": clients - first_request, "clients at startup": loaded}))
+"""
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    results = list()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", WORKER], env=os.environ, check=True,
+                             stdout=subprocess.PIPE).stdout
+        results.append(json.loads(out.decode().strip().splitlines()[-1]))
+    print("{} runs, median times".format(runs))
+    for name in ["import", "first request", "load clients"]:
+        print("    {:14s} {:8.1f} ms".format(name, statistics.median(r[name] for r in results) * 1000))
+    print("    generated clients imported at startup: {}".format(
+        ", ".join(results[0]["clients at startup"]) or "none"))
+
+
+if __name__ == "__main__":
+    main()